@@ -0,0 +1,9 @@
+"""Benchmarks of the headless protocol engines.
+
+    python -m benchmarks.run --output baseline.json
+    # ... change something ...
+    python -m benchmarks.run --output current.json
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+
+Run them from the `manim` directory, like the `utils` command-line tools.
+"""
@@ -0,0 +1,68 @@
+"""Compare two benchmark baselines and flag regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+
+Exits with status 1 if any metric got worse by more than the threshold (a fraction
+of the baseline value), so it can gate changes.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Tuple
+
+# Metrics where bigger is better; for all others smaller is better.
+HIGHER_IS_BETTER = {"instances_per_second", "decisions_per_second"}
+# Counts of repetitions, not measurements.
+IGNORED = {"instances"}
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float
+) -> List[Tuple[str, str, float, float, float]]:
+    """(benchmark, metric, baseline value, current value, relative change) of every
+    regression. A positive change is always worse."""
+    regressions = []
+    for name, metrics in baseline["results"].items():
+        if name not in current["results"]:
+            continue
+        for metric, old in metrics.items():
+            new = current["results"][name].get(metric)
+            if metric in IGNORED or new is None or old == 0:
+                continue
+            change = (new - old) / old
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    missing = set(baseline["results"]) - set(current["results"])
+    if missing:
+        print(f"Not in {args.current}: {', '.join(sorted(missing))}")
+
+    regressions = compare(baseline, current, args.threshold)
+    for name, metric, old, new, change in regressions:
+        print(
+            f"REGRESSION {name} {metric}: {old:.4g} -> {new:.4g} ({change:+.1%} worse)"
+        )
+    if not regressions:
+        print(f"No regressions above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
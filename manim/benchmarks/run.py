@@ -0,0 +1,208 @@
+"""Measure the protocol engines and write the results to a JSON baseline.
+
+Covers the decision rules on their own (`majority` and `supermajority_or_leader`,
+scalar and vectorized) and the full algorithm with 3 phases, for every number of
+generals, fraction of traitors and traitor strategy in the sweep. For every
+configuration it records throughput, per-phase latency and peak memory (measured with
+`tracemalloc` in a separate run, since tracing slows everything down).
+
+    python -m benchmarks.run --output baseline.json
+    python -m benchmarks.run --generals 4 12 100 --min-time 0.1 --output quick.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from utils import opinion_matrix, protocol, strategies
+
+GENERALS = [4, 12, 100, 1000, 10_000]
+# Fractions of the generals that are traitors; "max" is `protocol.max_traitors`.
+TRAITOR_FRACTIONS = ["0", "0.1", "max"]
+STRATEGIES = ["cyclic", "random", "worst_case"]
+# Leaders of the 3 phases
+LEADER_IDS = [0, 1, 2]
+
+
+def n_traitors(n: int, fraction: str) -> int:
+    if fraction == "max":
+        return protocol.max_traitors(n)
+    return int(n * float(fraction))
+
+
+def make_game(
+    n: int, n_traitors: int, strategy: str, rng: np.random.Generator
+) -> protocol.HeadlessGameState:
+    generals = [protocol.HeadlessPlayer("YN"[i]) for i in rng.integers(2, size=n)]
+    # Worst-case traitors follow one joint plan, computed once per round if they share
+    # the strategy
+    worst_case = strategies.WorstCaseStrategy()
+    for i in rng.choice(n, n_traitors, replace=False):
+        if strategy == "cyclic":
+            opinions = "".join("YN"[j] for j in rng.integers(2, size=5))
+            generals[i] = protocol.HeadlessCyclicOpinionTraitor(opinions)
+        elif strategy == "random":
+            generals[i] = strategies.StrategyTraitor(
+                strategies.RandomStrategy(seed=int(rng.integers(1 << 31)))
+            )
+        elif strategy == "worst_case":
+            generals[i] = strategies.StrategyTraitor(worst_case)
+        else:
+            raise ValueError(f"Unknown strategy {strategy}")
+    return protocol.HeadlessGameState(generals, vectorized=n >= 100)
+
+
+def run_game(game: protocol.HeadlessGameState) -> List[float]:
+    """Run the full algorithm, returning the seconds every phase took."""
+    phase_times = []
+    start = time.perf_counter()
+    for round, _ in game.rounds(LEADER_IDS):
+        if round == protocol.ROUND_LEADER:
+            now = time.perf_counter()
+            phase_times.append(now - start)
+            start = now
+    return phase_times
+
+
+def peak_memory(f: Callable[[], object]) -> int:
+    """Peak bytes allocated by Python while running `f`."""
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_full_algorithm(
+    n: int, fraction: str, strategy: str, min_time: float, seed: int = 0
+) -> Dict[str, float]:
+    rng = np.random.default_rng(seed)
+    t = n_traitors(n, fraction)
+    instances = 0
+    seconds = 0.0
+    phase_times: List[float] = []
+    # Games are built outside of the timed part
+    while seconds < min_time:
+        game = make_game(n, t, strategy, rng)
+        times = run_game(game)
+        phase_times.extend(times)
+        seconds += sum(times)
+        instances += 1
+
+    game = make_game(n, t, strategy, rng)
+    return {
+        "instances": instances,
+        "instances_per_second": instances / seconds,
+        "phase_p50_ms": float(np.percentile(phase_times, 50)) * 1000,
+        "phase_p90_ms": float(np.percentile(phase_times, 90)) * 1000,
+        "peak_memory_kb": peak_memory(lambda: run_game(game)) / 1024,
+    }
+
+
+def _calls_per_second(f: Callable[[], object], calls: int, min_time: float) -> float:
+    """`f` makes `calls` decisions per call."""
+    total = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_time:
+        f()
+        total += calls
+    return total / elapsed
+
+
+def bench_decision_rules(min_time: float, seed: int = 0) -> Dict[str, Dict]:
+    n = 12
+    threshold = protocol.max_traitors(n)
+    rng = np.random.default_rng(seed)
+    y_cnts = rng.integers(n + 1, size=1000)
+    n_cnts = n - y_cnts
+    leader = rng.choice([protocol.YES, protocol.NO], size=1000)
+    leader_codes = opinion_matrix.encode_opinions(list(leader))
+    pairs = list(zip(y_cnts.tolist(), n_cnts.tolist(), leader.tolist()))
+
+    def majority_scalar():
+        for y, no, _ in pairs:
+            protocol.majority(y, no)
+
+    def supermajority_or_leader_scalar():
+        for y, no, lead in pairs:
+            protocol.supermajority_or_leader(y, no, lead, threshold)
+
+    benchmarks = {
+        "majority/scalar": majority_scalar,
+        "majority/vectorized": lambda: opinion_matrix.majority_decisions(
+            y_cnts, n_cnts
+        ),
+        "supermajority_or_leader/scalar": supermajority_or_leader_scalar,
+        "supermajority_or_leader/vectorized": lambda: (
+            opinion_matrix.supermajority_or_leader_decisions(
+                y_cnts, n_cnts, leader_codes, threshold
+            )
+        ),
+    }
+    return {
+        name: {"decisions_per_second": _calls_per_second(f, len(pairs), min_time)}
+        for name, f in benchmarks.items()
+    }
+
+
+def run(
+    generals: List[int],
+    fractions: List[str],
+    strategy_names: List[str],
+    min_time: float,
+) -> Dict[str, Dict]:
+    results = bench_decision_rules(min_time)
+    for n in generals:
+        for fraction in fractions:
+            # Without traitors, the strategy doesn't matter
+            names = strategy_names if n_traitors(n, fraction) > 0 else ["none"]
+            if names == ["none"] and fraction != "0" and "0" in fractions:
+                # Same as the run without traitors
+                continue
+            for strategy in names:
+                key = f"full_algorithm/n={n}/traitors={fraction}/{strategy}"
+                results[key] = bench_full_algorithm(
+                    n, fraction, "cyclic" if strategy == "none" else strategy, min_time
+                )
+                print(
+                    f"{key}: {results[key]['instances_per_second']:.1f} instances/s",
+                    flush=True,
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, nargs="+", default=GENERALS)
+    parser.add_argument("--traitors", nargs="+", default=TRAITOR_FRACTIONS)
+    parser.add_argument("--strategies", nargs="+", default=STRATEGIES)
+    parser.add_argument(
+        "--min-time", type=float, default=0.5, help="Seconds per configuration"
+    )
+    parser.add_argument("--output", default="baseline.json")
+    args = parser.parse_args()
+
+    results = run(args.generals, args.traitors, args.strategies, args.min_time)
+    baseline = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(baseline, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""Exhaustive search for traitor strategies that break the full algorithm.
+
+`ComparisonTable` claims that the ad-hoc approach works for fewer than n/4 traitors.
+This checks the claim for small n: for every input, every placement of the traitors
+and every choice of the messages the traitors send, do the honest generals agree, and
+do they keep their opinion if they all started with the same one?
+
+    python -m utils.adversary_search --min-generals 4 --max-generals 16
+
+Two things make this feasible:
+
+- Memoization: the search is over phase states (the opinions of the honest generals
+  at the start of a phase), and states reached in different ways are explored once.
+- Symmetry: all honest generals receive the same honest messages, so generals that
+  don't lead any of the remaining phases are interchangeable. Such states are
+  canonicalized to just the number of YES opinions among them. The traitors' messages
+  then only matter through how many YES messages each receiver gets.
+
+With `symmetry=False`, every message of every traitor is enumerated literally. That is
+only feasible for n up to ~6 and serves as a cross-check of the symmetric search.
+"""
+
+import argparse
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from . import protocol
+
+AGREE_YES = "all YES"
+AGREE_NO = "all NO"
+DISAGREE = "disagreement"
+
+# A group of honest generals with the same role: (future phases they lead, number of
+# YES opinions, size). Generals that don't lead any future phase form one group.
+Group = Tuple[Tuple[int, ...], int, int]
+SymmetricState = Tuple[int, Tuple[Group, ...]]
+
+
+@dataclass
+class SearchResult:
+    n_generals: int
+    n_traitors: int
+    threshold: int
+    agreement: bool = True
+    validity: bool = True
+    states_explored: int = 0
+    seconds: float = 0.0
+    # A sequence of honest opinions leading to the first violation found, if any.
+    counterexample: Optional[List[str]] = None
+    counterexample_traitors: Optional[List[int]] = None
+
+
+@dataclass
+class _Search:
+    n_generals: int
+    n_traitors: int
+    threshold: int
+    leader_ids: Sequence[int]
+    # Whether traitors may also send no message at all (or garbage) instead of Y/N.
+    allow_silence: bool = False
+    _outcomes: Dict = field(default_factory=dict)
+    _successors: Dict = field(default_factory=dict)
+
+    def traitor_tallies(self) -> List[Tuple[int, int]]:
+        """All possible (YES, NO) counts of the traitors' messages to one general."""
+        t = self.n_traitors
+        if self.allow_silence:
+            return [(y, n) for y in range(t + 1) for n in range(t + 1 - y)]
+        return [(y, t - y) for y in range(t + 1)]
+
+    def final_outcome(self, honest_y: int, honest: int) -> str:
+        if honest_y == honest:
+            return AGREE_YES
+        elif honest_y == 0:
+            return AGREE_NO
+        return DISAGREE
+
+    def outcomes(self, state) -> FrozenSet[str]:
+        """All final outcomes the traitors can force from this state."""
+        if state in self._outcomes:
+            return self._outcomes[state]
+
+        successors = self.successors(state)
+        if not successors:
+            result = frozenset([self.final_outcome(*self.honest_counts(state))])
+        else:
+            result = frozenset().union(*(self.outcomes(s) for s in successors))
+
+        self._outcomes[state] = result
+        return result
+
+    def path_to(self, state, outcome: str) -> List:
+        """States from `state` to a final state with the given outcome."""
+        path = [state]
+        while self.successors(state):
+            state = next(
+                s for s in self.successors(state) if outcome in self.outcomes(s)
+            )
+            path.append(state)
+        return path
+
+
+@dataclass
+class _SymmetricSearch(_Search):
+    traitor_phases: FrozenSet[int] = frozenset()
+
+    def honest_counts(self, state: SymmetricState) -> Tuple[int, int]:
+        _, groups = state
+        return sum(g[1] for g in groups), sum(g[2] for g in groups)
+
+    def successors(self, state: SymmetricState) -> List[SymmetricState]:
+        if state in self._successors:
+            return self._successors[state]
+
+        phase, groups = state
+        if phase == len(self.leader_ids):
+            self._successors[state] = []
+            return []
+
+        honest_y, honest = self.honest_counts(state)
+        tallies = [
+            (honest_y + y, honest - honest_y + n) for y, n in self.traitor_tallies()
+        ]
+
+        if phase in self.traitor_phases:
+            # The leader is a traitor and sends whatever to each general.
+            leader_choices = [
+                (None, {protocol.YES, protocol.NO}),
+            ]
+        else:
+            # The honest leader's majority opinion depends on what the traitors sent
+            # it, and then it sends the same opinion to everybody.
+            leader_choices = [
+                (m, {m}) for m in {protocol.majority(*t) for t in tallies}
+            ]
+
+        successors = set()
+        for leader_opinion, leader_messages in leader_choices:
+            # Every general can independently end up with any of these opinions,
+            # since the traitors choose their messages to each general separately.
+            reachable = {
+                protocol.supermajority_or_leader(y, n, m, self.threshold)
+                for y, n in tallies
+                for m in leader_messages
+            }
+
+            options_per_group = []
+            for roles, y, size in groups:
+                if roles and roles[0] == phase:
+                    y_options = [int(leader_opinion == protocol.YES)]
+                elif reachable == {protocol.YES}:
+                    y_options = [size]
+                elif reachable == {protocol.NO}:
+                    y_options = [0]
+                else:
+                    y_options = range(size + 1)
+                options_per_group.append(y_options)
+
+            for new_ys in itertools.product(*options_per_group):
+                successors.add(
+                    self.canonical(
+                        phase + 1,
+                        [
+                            (roles, new_y, size)
+                            for (roles, _, size), new_y in zip(groups, new_ys)
+                        ],
+                    )
+                )
+
+        self._successors[state] = list(successors)
+        return self._successors[state]
+
+    def canonical(self, phase: int, groups: List[Group]) -> SymmetricState:
+        """Drop past phases from the roles and merge generals with equal roles."""
+        merged = {}
+        for roles, y, size in groups:
+            roles = tuple(r for r in roles if r >= phase)
+            old_y, old_size = merged.get(roles, (0, 0))
+            merged[roles] = (old_y + y, old_size + size)
+        return phase, tuple(sorted((r, y, s) for r, (y, s) in merged.items()))
+
+    def initial_states(self) -> List[SymmetricState]:
+        """All inputs of the honest generals, up to relabeling."""
+        roles_of = {}
+        for phase, leader_id in enumerate(self.leader_ids):
+            roles_of.setdefault(leader_id, []).append(phase)
+
+        honest_leaders = [
+            tuple(phases)
+            for phases in roles_of.values()
+            if not (set(phases) & self.traitor_phases)
+        ]
+        traitor_leaders = len(roles_of) - len(honest_leaders)
+        anonymous = (
+            self.n_generals - len(roles_of) - (self.n_traitors - traitor_leaders)
+        )
+
+        states = []
+        for leader_ys in itertools.product([0, 1], repeat=len(honest_leaders)):
+            for y in range(anonymous + 1):
+                groups = [
+                    (roles, ly, 1) for roles, ly in zip(honest_leaders, leader_ys)
+                ]
+                groups.append(((), y, anonymous))
+                states.append(self.canonical(0, groups))
+        return states
+
+    def describe(self, state: SymmetricState) -> str:
+        _, groups = state
+        parts = []
+        for roles, y, size in groups:
+            who = f"leader of phases {list(roles)}" if roles else f"{size} others"
+            parts.append(f"{who}: {y} YES")
+        return ", ".join(parts)
+
+
+@dataclass
+class _BruteForceSearch(_Search):
+    traitor_ids: FrozenSet[int] = frozenset()
+
+    def honest_ids(self) -> List[int]:
+        return [i for i in range(self.n_generals) if i not in self.traitor_ids]
+
+    def honest_counts(self, state) -> Tuple[int, int]:
+        _, opinions = state
+        return opinions.count(protocol.YES), len(opinions)
+
+    def successors(self, state) -> List:
+        if state in self._successors:
+            return self._successors[state]
+
+        phase, opinions = state
+        if phase == len(self.leader_ids):
+            self._successors[state] = []
+            return []
+
+        honest_ids = self.honest_ids()
+        leader_id = self.leader_ids[phase]
+        h = len(honest_ids)
+        honest_y, _ = self.honest_counts(state)
+        values = [protocol.YES, protocol.NO]
+        if self.allow_silence:
+            values.append(None)
+
+        successors = set()
+        # Every message from every traitor to every honest general.
+        for messages in itertools.product(values, repeat=self.n_traitors * h):
+            tallies = []
+            for r in range(h):
+                received = messages[r * self.n_traitors : (r + 1) * self.n_traitors]
+                tallies.append(
+                    (
+                        honest_y + received.count(protocol.YES),
+                        h - honest_y + received.count(protocol.NO),
+                    )
+                )
+
+            if leader_id in self.traitor_ids:
+                leader_options = itertools.product(
+                    [protocol.YES, protocol.NO], repeat=h
+                )
+            else:
+                leader_pos = honest_ids.index(leader_id)
+                leader_options = [
+                    (protocol.majority(*tallies[leader_pos]),) * h,
+                ]
+
+            for leader_messages in leader_options:
+                new_opinions = tuple(
+                    (
+                        leader_messages[r]
+                        if honest_ids[r] == leader_id
+                        else protocol.supermajority_or_leader(
+                            *tallies[r], leader_messages[r], self.threshold
+                        )
+                    )
+                    for r in range(h)
+                )
+                successors.add((phase + 1, new_opinions))
+
+        self._successors[state] = list(successors)
+        return self._successors[state]
+
+    def initial_states(self) -> List:
+        h = len(self.honest_ids())
+        return [
+            (0, opinions)
+            for opinions in itertools.product([protocol.YES, protocol.NO], repeat=h)
+        ]
+
+    def describe(self, state) -> str:
+        _, opinions = state
+        return ", ".join(f"#{i + 1}: {o}" for i, o in zip(self.honest_ids(), opinions))
+
+
+def _initial_outcome(search: _Search, state) -> Optional[str]:
+    """The outcome validity requires, or None if the inputs are mixed."""
+    honest_y, honest = search.honest_counts(state)
+    if honest_y == honest:
+        return AGREE_YES
+    elif honest_y == 0:
+        return AGREE_NO
+    return None
+
+
+def search(
+    n_generals: int,
+    n_traitors: int,
+    threshold: Optional[int] = None,
+    leader_ids: Optional[Sequence[int]] = None,
+    symmetry: bool = True,
+    allow_silence: bool = False,
+) -> SearchResult:
+    """Check agreement and validity against every possible traitor behavior.
+
+    By default, the threshold is the one `GameState` uses for n generals and the
+    leaders of the phases are generals 0..n_traitors, like in `FullSolutionWithCode`.
+    """
+    start = time.perf_counter()
+    if threshold is None:
+        threshold = protocol.max_traitors(n_generals)
+    if leader_ids is None:
+        leader_ids = list(range(n_traitors + 1))
+
+    result = SearchResult(n_generals, n_traitors, threshold)
+
+    if symmetry:
+        # Only which phases have a traitor leader matters, not who the traitors are.
+        distinct_leaders = list(dict.fromkeys(leader_ids))
+        placements = []
+        for k in range(min(n_traitors, len(distinct_leaders)) + 1):
+            for traitor_leaders in itertools.combinations(distinct_leaders, k):
+                if n_traitors - k > n_generals - len(distinct_leaders):
+                    continue
+                placements.append(
+                    frozenset(
+                        p for p, i in enumerate(leader_ids) if i in traitor_leaders
+                    )
+                )
+        searches = [
+            _SymmetricSearch(
+                n_generals,
+                n_traitors,
+                threshold,
+                leader_ids,
+                allow_silence,
+                traitor_phases=phases,
+            )
+            for phases in placements
+        ]
+    else:
+        searches = [
+            _BruteForceSearch(
+                n_generals,
+                n_traitors,
+                threshold,
+                leader_ids,
+                allow_silence,
+                traitor_ids=frozenset(ids),
+            )
+            for ids in itertools.combinations(range(n_generals), n_traitors)
+        ]
+
+    for s in searches:
+        for state in s.initial_states():
+            outcomes = s.outcomes(state)
+            required = _initial_outcome(s, state)
+
+            violation = None
+            if DISAGREE in outcomes:
+                result.agreement = False
+                violation = DISAGREE
+            if required is not None and outcomes != {required}:
+                result.validity = False
+                violation = violation or next(o for o in outcomes if o != required)
+
+            if violation is not None and result.counterexample is None:
+                result.counterexample = [
+                    s.describe(st) for st in s.path_to(state, violation)
+                ]
+                if isinstance(s, _SymmetricSearch):
+                    result.counterexample_traitors = [
+                        leader_ids[p] for p in sorted(s.traitor_phases)
+                    ]
+                else:
+                    result.counterexample_traitors = sorted(s.traitor_ids)
+
+        result.states_explored += len(s._outcomes)
+
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--min-generals", type=int, default=4)
+    parser.add_argument("--max-generals", type=int, default=16)
+    parser.add_argument(
+        "--brute-force",
+        action="store_true",
+        help="enumerate messages literally instead of using symmetries",
+    )
+    parser.add_argument("--allow-silence", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    print("n  threshold  traitors  agreement  validity  states  seconds")
+    for n in range(args.min_generals, args.max_generals + 1):
+        threshold = protocol.max_traitors(n)
+        # The claimed bound, and one traitor more to see that it is needed.
+        for t in [threshold, threshold + 1]:
+            result = search(
+                n,
+                t,
+                threshold,
+                symmetry=not args.brute_force,
+                allow_silence=args.allow_silence,
+            )
+            print(
+                f"{n:<3}{threshold:<11}{t:<10}{str(result.agreement):<11}"
+                f"{str(result.validity):<10}{result.states_explored:<8}"
+                f"{result.seconds:.3f}"
+            )
+            if args.verbose and result.counterexample:
+                print(f"   traitors include: {result.counterexample_traitors}")
+                for phase, description in enumerate(result.counterexample):
+                    print(f"   before phase {phase + 1}: {description}")
+
+
+if __name__ == "__main__":
+    main()
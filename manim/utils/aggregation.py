@@ -0,0 +1,225 @@
+"""Signed aggregation instead of all-to-all messages.
+
+In `local_algorithm` and `full_algorithm` every general sends its opinion to
+everybody, which is n^2 messages per phase. The decision rules only need the number
+of YES and NO messages, so here the messages go through a few aggregators instead:
+
+1. Every general signs its opinion (see `signatures.py`) and sends it to each of the
+   k aggregators of the phase, picked at random.
+2. Every aggregator sends the signed partial count it collected (which generals
+   voted YES and which NO, with their signatures) to everybody.
+3. Every general verifies the signatures, takes the union of the votes and counts
+   them. A general with both a YES and a NO vote signed is a traitor that sent
+   different opinions to different aggregators, and isn't counted.
+
+That is 2k(n - 1) messages per phase, and with k = log2(n) it is O(n log n).
+
+The aggregators are roots of trees of depth 1. Deeper trees would need fewer
+messages per aggregator, but a traitor inside a tree could drop the votes of its
+whole subtree. A traitor aggregator can't forge votes either, only drop them or show
+different generals different ones, so as long as one of the k aggregators is honest,
+every general gets all honest votes and at most one vote per traitor, just like with
+all-to-all messages. With t < n/4 traitors all aggregators are traitors with
+probability below 4^-k = 1/n^2.
+
+Without traitors the counts are those of all-to-all and so are the outputs. With
+traitors the outputs can differ, since the traitors choose their messages per
+aggregator instead of per general. The agreement guarantees only hold as long as
+every phase has an honest aggregator: a phase whose k aggregators are all traitors
+can show different generals different counts and break agreement. That happens with
+probability C(t, k) / C(n, k) <= (t/n)^k per phase, so with t < n/4 and
+k = ceil(log2 n) at most (t + 1) / n^2, about 1 / (4n), over the t + 1 phases of
+`full_algorithm`. `SignedAggregation(n_aggregators=t + 1)` always has an honest
+aggregator and keeps the guarantees for sure, for (t + 1) / k times the messages.
+
+    python -m utils.aggregation --generals 12 100 1000
+"""
+
+import argparse
+import math
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import opinion_matrix, protocol
+from .signatures import KeyRing
+
+# phase, signer, opinion code
+_VOTE = struct.Struct("<IIb")
+
+
+class SignedAggregation:
+    """Dissemination of the all-to-all counts for `HeadlessGameState`.
+
+    Pass it as `HeadlessGameState(..., dissemination=SignedAggregation())`.
+    """
+
+    def __init__(
+        self,
+        n_aggregators: Optional[int] = None,
+        keys: Optional[KeyRing] = None,
+        seed: int = 0,
+    ):
+        self.n_aggregators = n_aggregators
+        self.keys = keys
+        self.seed = seed
+        # Votes rejected because their signature didn't verify.
+        self.rejected = 0
+
+    def _n_aggregators(self, n: int) -> int:
+        k = self.n_aggregators or math.ceil(math.log2(n))
+        return min(n, max(1, k))
+
+    def messages_per_phase(self, n: int) -> int:
+        """Messages of one phase: to the aggregators and back."""
+        return 2 * self._n_aggregators(n) * (n - 1)
+
+    def aggregator_ids(self, n: int, phase: int) -> np.ndarray:
+        rng = np.random.default_rng([self.seed, phase])
+        return rng.choice(n, self._n_aggregators(n), replace=False)
+
+    def _genuine(
+        self, phase: int, signatures: Dict[Tuple[int, int], bytes], claimed, code
+    ) -> np.ndarray:
+        """Which generals in `claimed` signed a vote with the given code.
+
+        A vote is relayed to everybody by several aggregators, but whether its
+        signature is valid doesn't depend on who checks it, so it is only checked
+        once per phase. Votes nobody signed are forged.
+        """
+        genuine = np.zeros(len(claimed), dtype=bool)
+        for i in np.flatnonzero(claimed):
+            signature = signatures.get((int(i), code))
+            genuine[i] = signature is not None and self.keys.verify(
+                int(i), _VOTE.pack(phase, int(i), code), signature
+            )
+            self.rejected += not genuine[i]
+        return genuine
+
+    def tallies(
+        self, game, view: Optional[protocol.PhaseView], send_to_self: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The YES and NO counts of every general."""
+        n = len(game.generals)
+        if self.keys is None or len(self.keys.keys) < n:
+            self.keys = KeyRing(n, seed=self.seed)
+        phase = game.phase
+        aggregator_ids = self.aggregator_ids(n, phase)
+        is_traitor = np.array([g.is_traitor for g in game.generals])
+        traitor_ids = np.flatnonzero(is_traitor)
+        honest_ids = np.flatnonzero(~is_traitor)
+
+        # votes[a, i]: what general i sent to the a-th aggregator
+        own = opinion_matrix.encode_opinions(
+            [protocol.UNDECIDED if g.is_traitor else g.opinion for g in game.generals]
+        )
+        votes = np.repeat(own[None, :], len(aggregator_ids), axis=0)
+        for i in traitor_ids:
+            votes[:, i] = game.generals[i].send(view, int(i), aggregator_ids)
+
+        # Honest generals sign their opinion; the traitors sign both and share them.
+        signatures: Dict[Tuple[int, int], bytes] = {}
+        for i in range(n):
+            for code in [opinion_matrix.CODE_Y, opinion_matrix.CODE_N]:
+                if is_traitor[i] or own[i] == code:
+                    signatures[i, code] = self.keys.sign(i, _VOTE.pack(phase, i, code))
+
+        # has_y[j, i]: general j got a YES vote of general i from some aggregator
+        has_y = np.zeros((n, n), dtype=bool)
+        has_n = np.zeros((n, n), dtype=bool)
+        for a, aggregator_id in enumerate(aggregator_ids):
+            y_votes = votes[a] == opinion_matrix.CODE_Y
+            n_votes = votes[a] == opinion_matrix.CODE_N
+            if is_traitor[aggregator_id]:
+                # Show half of the generals only the YES votes and the other half
+                # only the NO votes, with all traitors voting along.
+                y_votes[traitor_ids] = True
+                n_votes[traitor_ids] = True
+                shown_y = np.arange(n) % 2 == 0
+                has_y[shown_y] |= y_votes
+                has_n[~shown_y] |= n_votes
+            else:
+                has_y |= y_votes
+                has_n |= n_votes
+            game.messages_sent += 2 * (n - 1)
+
+        has_y &= self._genuine(phase, signatures, has_y.any(0), opinion_matrix.CODE_Y)
+        has_n &= self._genuine(phase, signatures, has_n.any(0), opinion_matrix.CODE_N)
+
+        # Everybody knows its own opinion; it is a message only with `send_to_self`.
+        has_y[honest_ids, honest_ids] = send_to_self & (
+            own[honest_ids] == opinion_matrix.CODE_Y
+        )
+        has_n[honest_ids, honest_ids] = send_to_self & (
+            own[honest_ids] == opinion_matrix.CODE_N
+        )
+
+        y_cnts = np.count_nonzero(has_y & ~has_n, axis=1)
+        n_cnts = np.count_nonzero(has_n & ~has_y, axis=1)
+        return y_cnts, n_cnts
+
+
+def benchmark(n: int, n_runs: int, seed: int = 0) -> List[str]:
+    """Compare all-to-all and aggregation on random games with n generals.
+
+    There are 3 phases and general 0 is never a traitor, so that one of the leaders
+    is honest."""
+    rng = np.random.default_rng(seed)
+    n_traitors = protocol.max_traitors(n)
+    leader_ids = list(range(n_traitors + 1))[:3]
+    stats = {
+        name: {"messages": 0, "seconds": 0.0, "agreements": 0, "phases": 0}
+        for name in ["all-to-all", "aggregation"]
+    }
+    same_outputs = 0
+
+    for run in range(n_runs):
+        inputs = ["YN"[i] for i in rng.integers(2, size=n)]
+        traitor_ids = rng.choice(np.arange(1, n), n_traitors, replace=False)
+        traitor_opinions = {
+            int(i): "".join("YN"[j] for j in rng.integers(2, size=5))
+            for i in traitor_ids
+        }
+        outputs = {}
+        for name in stats:
+            game = protocol.HeadlessGameState.from_opinions(
+                inputs,
+                traitor_opinions,
+                vectorized=n >= 100,
+                dissemination=(
+                    SignedAggregation(seed=run) if name == "aggregation" else None
+                ),
+            )
+            start = time.perf_counter()
+            outputs[name] = game.full_algorithm(leader_ids)
+            stats[name]["seconds"] += time.perf_counter() - start
+            stats[name]["messages"] += game.messages_sent
+            stats[name]["phases"] += len(leader_ids)
+            stats[name]["agreements"] += protocol.is_agreement(outputs[name])
+        same_outputs += outputs["all-to-all"] == outputs["aggregation"]
+
+    lines = []
+    for name, s in stats.items():
+        lines.append(
+            f"n={n} {name:>11}: {s['messages'] / s['phases']:.0f} messages/phase, "
+            f"{s['seconds'] / s['phases'] * 1000:.2f} ms/phase, "
+            f"agreement {s['agreements']}/{n_runs}"
+        )
+    lines.append(f"n={n} same outputs: {same_outputs}/{n_runs}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, nargs="+", default=[12, 100, 1000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for n in args.generals:
+        print("\n".join(benchmark(n, args.runs)))
+
+
+if __name__ == "__main__":
+    main()
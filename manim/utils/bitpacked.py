@@ -0,0 +1,243 @@
+"""Bit-packed opinions with popcount tallies, for simulations with many generals.
+
+`HeadlessGameState` stores opinions as "Y"/"N"/"-" strings on one Python object per
+general. Here the opinions of all generals are packed into bits of `uint64` words:
+bit i of `yes` is set if general i thinks YES, bit i of `no` if it thinks NO. The
+state of 10k generals then fits into a few kilobytes instead of hundreds of MB.
+
+The tallies are popcounts over the bitmasks of the received messages. Honest generals
+send the same message to everybody, so the honest part of every tally is a single
+popcount over the packed opinions. Only the traitors' messages differ per receiver,
+so every receiver also gets a bitmask over the traitors (bit k set if the k-th traitor
+sent it YES).
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import opinion_matrix, protocol
+
+WORD_BITS = 64
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def n_words(n_bits: int) -> int:
+    return (n_bits + WORD_BITS - 1) // WORD_BITS
+
+
+def pack(bits: np.ndarray) -> np.ndarray:
+    """Pack a boolean array into uint64 words, bit i of the array is bit i % 64 of
+    word i // 64."""
+    padded = np.zeros(n_words(len(bits)) * WORD_BITS, dtype=bool)
+    padded[: len(bits)] = bits
+    return np.packbits(padded, bitorder="little").view(np.uint64)
+
+
+def unpack(words: np.ndarray, n_bits: int) -> np.ndarray:
+    """Inverse of `pack`."""
+    bits = np.unpackbits(words.view(np.uint8), bitorder="little")
+    return bits[:n_bits].astype(bool)
+
+
+def popcount_words(words: np.ndarray) -> np.ndarray:
+    """Number of set bits in each word."""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(words)
+    counts = _POPCOUNT_TABLE[words.view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1)
+
+
+def popcount(words: np.ndarray) -> int:
+    """Number of set bits in all the words."""
+    return int(popcount_words(words).sum())
+
+
+class BitPackedGameState:
+    """Bit-packed counterpart of `HeadlessGameState`, for very many generals.
+
+    Traitors are the same objects as in `HeadlessGameState`; what they send is asked
+    for with `send`, in the same order.
+    """
+
+    def __init__(
+        self,
+        opinions: Sequence[Optional[str]],
+        traitors: Dict[int, protocol.HeadlessTraitor],
+        threshold: Optional[int] = None,
+    ):
+        self.n = len(opinions)
+        self.traitors = traitors
+        self.threshold = (
+            threshold if threshold is not None else protocol.max_traitors(self.n)
+        )
+        honest = np.ones(self.n, dtype=bool)
+        honest[list(traitors)] = False
+        self.honest = pack(honest)
+
+        codes = opinion_matrix.encode_opinions(
+            [protocol.UNDECIDED if i in traitors else o for i, o in enumerate(opinions)]
+        )
+        self.set_opinion_codes(codes)
+        self.phase = 0
+        self.messages_sent = 0
+
+    @classmethod
+    def from_opinions(
+        cls,
+        opinions: Sequence[str],
+        traitor_opinions: Optional[Dict[int, str]] = None,
+        threshold: Optional[int] = None,
+    ) -> "BitPackedGameState":
+        """Same as `HeadlessGameState.from_opinions`."""
+        traitors = {
+            i: protocol.HeadlessCyclicOpinionTraitor(o)
+            for i, o in (traitor_opinions or {}).items()
+        }
+        return cls(opinions, traitors, threshold=threshold)
+
+    def set_opinion_codes(self, codes: np.ndarray, mask: Optional[np.ndarray] = None):
+        """Set the opinions of the honest generals (where `mask` is set, if given)
+        from message codes."""
+        yes = pack(codes == opinion_matrix.CODE_Y) & self.honest
+        no = pack(codes == opinion_matrix.CODE_N) & self.honest
+        if mask is None:
+            self.yes, self.no = yes, no
+        else:
+            self.yes = (self.yes & ~mask) | (yes & mask)
+            self.no = (self.no & ~mask) | (no & mask)
+
+    def opinions(self) -> List[Optional[str]]:
+        """Same as `HeadlessGameState.opinions`."""
+        yes = unpack(self.yes, self.n)
+        no = unpack(self.no, self.n)
+        honest = unpack(self.honest, self.n)
+        return [
+            (protocol.YES if y else protocol.NO if n else protocol.UNDECIDED)
+            if h
+            else None
+            for y, n, h in zip(yes, no, honest)
+        ]
+
+    def view(
+        self,
+        round: int,
+        leader_id: Optional[int] = None,
+        send_to_self: bool = True,
+        y_cnts: Optional[np.ndarray] = None,
+        n_cnts: Optional[np.ndarray] = None,
+    ) -> protocol.PhaseView:
+        """Same as `HeadlessGameState.view`."""
+        return protocol.PhaseView.from_opinions(
+            self.phase,
+            round,
+            leader_id,
+            opinion_matrix.encode_opinions(self.opinions()),
+            self.threshold,
+            send_to_self,
+            y_cnts,
+            n_cnts,
+        )
+
+    def nbytes(self) -> int:
+        """Memory used by the packed state."""
+        return self.yes.nbytes + self.no.nbytes + self.honest.nbytes
+
+    def send_opinions_to_everybody(
+        self, send_to_self: bool = True, leader_id: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Same as `HeadlessGameState.send_opinions_to_everybody`."""
+        # Receiver x traitor bitmasks of the YES and NO messages sent by the traitors.
+        traitor_yes = np.zeros((self.n, n_words(len(self.traitors))), dtype=np.uint64)
+        traitor_no = np.zeros_like(traitor_yes)
+
+        view = None
+        if any(traitor.uses_view for traitor in self.traitors.values()):
+            view = self.view(protocol.ROUND_ALL_TO_ALL, leader_id, send_to_self)
+        for k, (i, traitor) in enumerate(self.traitors.items()):
+            receiver_ids = np.arange(self.n)
+            if not send_to_self:
+                receiver_ids = np.delete(receiver_ids, i)
+            codes = np.full(self.n, opinion_matrix.NO_MESSAGE, dtype=np.int8)
+            codes[receiver_ids] = traitor.send(view, i, receiver_ids)
+            word, bit = divmod(k, WORD_BITS)
+            bit = np.uint64(bit)
+            traitor_yes[:, word] |= (codes == opinion_matrix.CODE_Y).astype(
+                np.uint64
+            ) << bit
+            traitor_no[:, word] |= (codes == opinion_matrix.CODE_N).astype(
+                np.uint64
+            ) << bit
+
+        y_cnts = popcount(self.yes) + popcount_words(traitor_yes).sum(axis=1)
+        n_cnts = popcount(self.no) + popcount_words(traitor_no).sum(axis=1)
+        y_cnts = y_cnts.astype(np.int64)
+        n_cnts = n_cnts.astype(np.int64)
+
+        if not send_to_self:
+            y_cnts -= unpack(self.yes, self.n)
+            n_cnts -= unpack(self.no, self.n)
+
+        self.messages_sent += self.n * self.n if send_to_self else self.n * (self.n - 1)
+        return y_cnts, n_cnts
+
+    def broadcast_opinion(
+        self, general_id: int, view: Optional[protocol.PhaseView] = None
+    ) -> np.ndarray:
+        """Same as `HeadlessGameState.broadcast_opinion`, but returns message codes."""
+        if general_id in self.traitors:
+            if view is None and self.traitors[general_id].uses_view:
+                view = self.view(protocol.ROUND_LEADER, general_id)
+            receiver_ids = np.delete(np.arange(self.n), general_id)
+            codes = np.full(self.n, opinion_matrix.NO_MESSAGE, dtype=np.int8)
+            codes[receiver_ids] = self.traitors[general_id].send(
+                view, general_id, receiver_ids
+            )
+        else:
+            word, bit = divmod(general_id, WORD_BITS)
+            mask = np.uint64(1) << np.uint64(bit)
+            if self.yes[word] & mask:
+                code = opinion_matrix.CODE_Y
+            elif self.no[word] & mask:
+                code = opinion_matrix.CODE_N
+            else:
+                code = opinion_matrix.CODE_UNDECIDED
+            codes = np.full(self.n, code, dtype=np.int8)
+            codes[general_id] = opinion_matrix.NO_MESSAGE
+        self.messages_sent += self.n - 1
+        return codes
+
+    def local_algorithm(self, send_to_self: bool = True) -> List[Optional[str]]:
+        """Same as `HeadlessGameState.local_algorithm`."""
+        y_cnts, n_cnts = self.send_opinions_to_everybody(send_to_self)
+        self.set_opinion_codes(opinion_matrix.majority_decisions(y_cnts, n_cnts))
+        self.phase += 1
+        return self.opinions()
+
+    def full_algorithm(
+        self, leader_ids: List[int], send_to_self: bool = True
+    ) -> List[Optional[str]]:
+        """Same as `HeadlessGameState.full_algorithm`."""
+        for leader_id in leader_ids:
+            y_cnts, n_cnts = self.send_opinions_to_everybody(send_to_self, leader_id)
+
+            leader_only = np.zeros(self.n, dtype=bool)
+            leader_only[leader_id] = True
+            leader_only = pack(leader_only)
+            if leader_id not in self.traitors:
+                decisions = opinion_matrix.majority_decisions(y_cnts, n_cnts)
+                self.set_opinion_codes(decisions, mask=leader_only)
+
+            view = None
+            if leader_id in self.traitors and self.traitors[leader_id].uses_view:
+                view = self.view(
+                    protocol.ROUND_LEADER, leader_id, send_to_self, y_cnts, n_cnts
+                )
+            leader_opinions = self.broadcast_opinion(leader_id, view)
+            decisions = opinion_matrix.supermajority_or_leader_decisions(
+                y_cnts, n_cnts, leader_opinions, self.threshold
+            )
+            self.set_opinion_codes(decisions, mask=~leader_only)
+            self.phase += 1
+        return self.opinions()
@@ -0,0 +1,220 @@
+"""The full algorithm on 64 independent binary decisions per machine word.
+
+Every message in `generals.py` carries a single "Y"/"N". Here a message is a vector
+of uint64 words: bit b of word w is the opinion on decision 64 * w + b, so one run of
+the protocol decides 64 * n_words independent bits with the same messages, e.g. a
+whole set of replicated feature flags at once.
+
+The decision rules need the number of YES messages per decision. These are counted
+bit-sliced: a counter is a list of bit planes, plane k holding bit k of all the
+counts, and a message word is added with a ripple-carry chain of half adders, which
+is a few bitwise operations per plane for all 64 lanes at once. The rules of
+`protocol.py` then become comparisons of the counter with constants. Messages are
+binary (no undecided opinions), so with m messages NO count = m - YES count.
+"""
+
+import argparse
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from . import protocol
+from .bitpacked import n_words, pack, popcount, unpack
+
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def counter_planes(max_count: int) -> int:
+    """Number of bit planes needed to count up to `max_count`."""
+    return max(1, int(max_count).bit_length())
+
+
+def add_word(planes: np.ndarray, words: np.ndarray) -> None:
+    """Add one bit per lane to a bit-sliced counter, in place.
+
+    `planes` has shape (n_planes, ...) and `words` the shape of one plane.
+    """
+    carry = words
+    for k in range(len(planes)):
+        new_carry = planes[k] & carry
+        planes[k] ^= carry
+        carry = new_carry
+
+
+def at_least(planes: np.ndarray, constant: int) -> np.ndarray:
+    """Lanes where the counter is >= `constant`, as words."""
+    if constant <= 0:
+        return np.full(planes.shape[1:], ALL_ONES)
+    if constant >= 1 << len(planes):
+        return np.zeros(planes.shape[1:], dtype=np.uint64)
+    greater = np.zeros(planes.shape[1:], dtype=np.uint64)
+    equal = np.full(planes.shape[1:], ALL_ONES)
+    # Compare from the most significant plane down
+    for k in reversed(range(len(planes))):
+        if (constant >> k) & 1:
+            equal &= planes[k]
+        else:
+            greater |= equal & planes[k]
+            equal &= ~planes[k]
+    return greater | equal
+
+
+def majority_words(y_planes: np.ndarray, n_messages: int) -> np.ndarray:
+    """Bit-sliced `protocol.majority`: YES iff y >= n_messages - y."""
+    return at_least(y_planes, (n_messages + 1) // 2)
+
+
+def supermajority_or_leader_words(
+    y_planes: np.ndarray, n_messages: int, leader_words: np.ndarray, threshold: int
+) -> np.ndarray:
+    """Bit-sliced `protocol.supermajority_or_leader`."""
+    # n_cnt <= threshold  <=>  y >= n_messages - threshold
+    super_y = at_least(y_planes, n_messages - threshold)
+    # y_cnt <= threshold
+    super_n = ~at_least(y_planes, threshold + 1)
+    return super_y | (~super_y & ~super_n & leader_words)
+
+
+class RandomWordsTraitor:
+    """Sends independent random bits for every decision, receiver and round."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+
+    def messages(
+        self, phase: int, round: int, receiver_ids: np.ndarray, n_words: int
+    ) -> np.ndarray:
+        """Words sent to each receiver, shape (len(receiver_ids), n_words)."""
+        return self.rng.integers(
+            0, 1 << 64, size=(len(receiver_ids), n_words), dtype=np.uint64
+        )
+
+
+class BitSlicedGameState:
+    def __init__(
+        self,
+        inputs: np.ndarray,
+        traitors: Dict[int, RandomWordsTraitor],
+        threshold: Optional[int] = None,
+    ):
+        """`inputs` is a generals x decisions boolean array (True for YES). Rows of
+        the traitors are ignored."""
+        self.n, self.n_decisions = inputs.shape
+        self.n_words = n_words(self.n_decisions)
+        self.traitors = traitors
+        self.threshold = (
+            threshold if threshold is not None else protocol.max_traitors(self.n)
+        )
+        self.honest = np.ones(self.n, dtype=bool)
+        self.honest[list(traitors)] = False
+        self.words = np.stack([pack(row) for row in inputs])
+        self.words[~self.honest] = 0
+        self.phase = 0
+        self.messages_sent = 0
+
+    def outputs(self) -> np.ndarray:
+        """Generals x decisions booleans. Rows of the traitors are all False."""
+        return np.stack([unpack(row, self.n_decisions) for row in self.words])
+
+    def send_opinions_to_everybody(self, send_to_self: bool = True) -> np.ndarray:
+        """Bit-sliced YES counters of all generals, shape (planes, n, n_words)."""
+        n_messages = self.n if send_to_self else self.n - 1
+        if send_to_self:
+            # Honest generals send the same words to everybody: count them once.
+            planes = np.zeros((counter_planes(self.n), self.n_words), dtype=np.uint64)
+            for i in np.flatnonzero(self.honest):
+                add_word(planes, self.words[i])
+            planes = np.repeat(planes[:, None, :], self.n, axis=1)
+        else:
+            planes = self._count_without_self()
+
+        all_ids = np.arange(self.n)
+        for i, traitor in self.traitors.items():
+            receiver_ids = all_ids if send_to_self else np.delete(all_ids, i)
+            words = np.zeros((self.n, self.n_words), dtype=np.uint64)
+            words[receiver_ids] = traitor.messages(
+                self.phase, protocol.ROUND_ALL_TO_ALL, receiver_ids, self.n_words
+            )
+            add_word(planes, words)
+
+        self.messages_sent += self.n * n_messages
+        return planes
+
+    def _count_without_self(self) -> np.ndarray:
+        # Subtracting is awkward on a bit-sliced counter, so count per receiver.
+        planes = np.zeros(
+            (counter_planes(self.n), self.n, self.n_words), dtype=np.uint64
+        )
+        for i in np.flatnonzero(self.honest):
+            words = np.repeat(self.words[i][None, :], self.n, axis=0)
+            words[i] = 0
+            add_word(planes, words)
+        return planes
+
+    def full_algorithm(
+        self, leader_ids: Sequence[int], send_to_self: bool = True
+    ) -> np.ndarray:
+        """Same as `HeadlessGameState.full_algorithm`, for all decisions at once.
+        Returns `outputs()`."""
+        n_messages = self.n if send_to_self else self.n - 1
+        for leader_id in leader_ids:
+            y_planes = self.send_opinions_to_everybody(send_to_self)
+
+            if self.honest[leader_id]:
+                self.words[leader_id] = majority_words(
+                    y_planes[:, leader_id], n_messages
+                )
+                leader_words = np.repeat(self.words[leader_id][None, :], self.n, axis=0)
+            else:
+                leader_words = self.traitors[leader_id].messages(
+                    self.phase,
+                    protocol.ROUND_LEADER,
+                    np.arange(self.n),
+                    self.n_words,
+                )
+            self.messages_sent += self.n - 1
+
+            followers = self.honest.copy()
+            followers[leader_id] = False
+            self.words[followers] = supermajority_or_leader_words(
+                y_planes[:, followers],
+                n_messages,
+                leader_words[followers],
+                self.threshold,
+            )
+            self.phase += 1
+        return self.outputs()
+
+    def agreed_decisions(self) -> int:
+        """Number of decisions on which all honest generals agree."""
+        honest_words = self.words[self.honest]
+        all_yes = np.bitwise_and.reduce(honest_words, axis=0)
+        all_no = np.bitwise_and.reduce(~honest_words, axis=0)
+        # Don't count the padding bits of the last word
+        valid = pack(np.ones(self.n_decisions, dtype=bool))
+        return popcount((all_yes | all_no) & valid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, default=12)
+    parser.add_argument("--traitors", type=int, default=2)
+    parser.add_argument("--decisions", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    inputs = rng.integers(2, size=(args.generals, args.decisions)).astype(bool)
+    traitor_ids = rng.choice(args.generals, args.traitors, replace=False)
+    game = BitSlicedGameState(
+        inputs, {int(i): RandomWordsTraitor(args.seed + int(i)) for i in traitor_ids}
+    )
+    game.full_algorithm(list(range(args.traitors + 1)))
+    print(
+        f"Agreement on {game.agreed_decisions()}/{args.decisions} decisions with "
+        f"{game.messages_sent} messages of {game.n_words} words each"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Hierarchical agreement in committees, the idea of the `Reduction` scene.
+
+The full algorithm has t + 1 phases of n^2 messages, which is out of reach for
+10,000 generals. Here the generals are split into committees (the "mega generals" of
+`Reduction`) that run the full algorithm on their own:
+
+1. Every committee of `committee_size` generals agrees on a value.
+2. The first `representatives` members of every committee carry its value up: the
+   representatives of all committees are split into committees again, and so on for
+   `depth` levels or until they fit into a single committee, which runs the full
+   algorithm among all of them.
+3. The result goes back down: the representatives of every committee send it to the
+   other members, which take the majority of what they got.
+
+Messages per level are about n * committee_size * (committee_size / 4), instead of
+n^2 * n / 4 for the flat algorithm, and every level takes as many rounds as one
+committee, so the latency grows with the depth, not with n.
+
+The price is the fault tolerance. The flat algorithm handles any t < n/4. Here each
+committee has to have fewer than a quarter traitors, the top committee too, and the
+representatives of every committee need an honest majority. With the traitors
+spread at random, that is likely if the fraction of traitors is well below 1/4 and
+the committees are large enough; `python -m utils.committee` estimates how likely.
+
+By default the traitors send random cyclic opinions, which rarely break a committee
+that could be broken, so the estimate is optimistic. With `--worst-case` they play
+`strategies.WorstCaseStrategy` instead. Either way the traitors sit at random
+positions; traitors that pick their positions can fill a single committee and break
+it at any fraction.
+
+    python -m utils.committee --generals 10000 --traitor-fraction 0.1 --worst-case
+"""
+
+import argparse
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import protocol, strategies
+
+
+@dataclass
+class LevelStats:
+    units: int
+    committees: int
+    messages: int
+    rounds: int
+
+
+@dataclass
+class CommitteeResult:
+    # Opinions of the generals at the end, None for the traitors.
+    outputs: List[Optional[str]]
+    # Level 0 is the committees of generals, the last one the top committee.
+    levels: List[LevelStats] = field(default_factory=list)
+    # Messages and rounds to send the result back down.
+    down_messages: int = 0
+    down_rounds: int = 0
+
+    @property
+    def messages(self) -> int:
+        return sum(level.messages for level in self.levels) + self.down_messages
+
+    @property
+    def rounds(self) -> int:
+        return sum(level.rounds for level in self.levels) + self.down_rounds
+
+
+def flat_cost(n: int) -> Tuple[int, int]:
+    """Messages and rounds of the flat full algorithm with max_traitors(n) + 1
+    leaders."""
+    phases = protocol.max_traitors(n) + 1
+    return phases * (n * n + n - 1), 2 * phases
+
+
+class CommitteeConsensus:
+    def __init__(
+        self,
+        committee_size: int = 40,
+        representatives: int = 13,
+        depth: Optional[int] = None,
+    ):
+        """With `depth` None, levels are added until the representatives fit into a
+        single committee. With `depth` 0 this is the flat full algorithm."""
+        if representatives >= committee_size:
+            raise ValueError("A committee needs more members than representatives")
+        self.committee_size = committee_size
+        self.representatives = representatives
+        self.depth = depth
+
+    def committees(self, unit_ids: np.ndarray) -> List[np.ndarray]:
+        """Consecutive blocks of `committee_size`. A last block smaller than half of
+        that joins the one before."""
+        blocks = [
+            unit_ids[i : i + self.committee_size]
+            for i in range(0, len(unit_ids), self.committee_size)
+        ]
+        if len(blocks) > 1 and len(blocks[-1]) < self.committee_size // 2:
+            last = blocks.pop()
+            blocks[-1] = np.concatenate([blocks[-1], last])
+        return blocks
+
+    def _full_algorithm(
+        self,
+        member_ids: np.ndarray,
+        opinions: Dict[int, str],
+        traitors: Dict[int, protocol.HeadlessTraitor],
+    ) -> Tuple[int, int]:
+        """Run the full algorithm among `member_ids`, updating `opinions` of the
+        honest ones. Returns the messages and rounds it took."""
+        game = protocol.HeadlessGameState(
+            [
+                traitors[i] if i in traitors else protocol.HeadlessPlayer(opinions[i])
+                for i in member_ids.tolist()
+            ],
+            vectorized=len(member_ids) >= 100,
+        )
+        leader_ids = list(range(protocol.max_traitors(len(member_ids)) + 1))
+        for i, opinion in zip(member_ids.tolist(), game.full_algorithm(leader_ids)):
+            if opinion is not None:
+                opinions[i] = opinion
+        return game.messages_sent, 2 * len(leader_ids)
+
+    def run(
+        self, inputs: Sequence[str], traitors: Dict[int, protocol.HeadlessTraitor]
+    ) -> CommitteeResult:
+        """`inputs` are the opinions of the generals (those of the traitors are
+        ignored), `traitors` maps the ids of the traitors to their behavior."""
+        opinions = {i: o for i, o in enumerate(inputs) if i not in traitors}
+        result = CommitteeResult(outputs=[])
+        unit_ids = np.arange(len(inputs))
+        # Committees of every level, as (members, representatives)
+        hierarchy: List[List[Tuple[np.ndarray, np.ndarray]]] = []
+
+        while len(unit_ids) > self.committee_size and (
+            self.depth is None or len(hierarchy) < self.depth
+        ):
+            level = LevelStats(len(unit_ids), 0, 0, 0)
+            committees = []
+            for member_ids in self.committees(unit_ids):
+                messages, rounds = self._full_algorithm(member_ids, opinions, traitors)
+                level.messages += messages
+                # Committees run in parallel
+                level.rounds = max(level.rounds, rounds)
+                committees.append((member_ids, member_ids[: self.representatives]))
+            level.committees = len(committees)
+            result.levels.append(level)
+            hierarchy.append(committees)
+            unit_ids = np.concatenate([reps for _, reps in committees])
+
+        messages, rounds = self._full_algorithm(unit_ids, opinions, traitors)
+        result.levels.append(LevelStats(len(unit_ids), 1, messages, rounds))
+
+        for committees in reversed(hierarchy):
+            for member_ids, rep_ids in committees:
+                result.down_messages += self._send_down(
+                    member_ids, rep_ids, opinions, traitors
+                )
+            result.down_rounds += 1
+
+        result.outputs = [opinions.get(i) for i in range(len(inputs))]
+        return result
+
+    def _send_down(
+        self,
+        member_ids: np.ndarray,
+        rep_ids: np.ndarray,
+        opinions: Dict[int, str],
+        traitors: Dict[int, protocol.HeadlessTraitor],
+    ) -> int:
+        """The representatives send their opinion to the other members, which take
+        the majority. Traitors send the opposite of the honest representatives."""
+        honest_values = [opinions[i] for i in rep_ids.tolist() if i not in traitors]
+        others = member_ids[self.representatives :].tolist()
+        n_traitors = len(rep_ids) - len(honest_values)
+        y_honest = honest_values.count(protocol.YES)
+        n_honest = len(honest_values) - y_honest
+        if honest_values:
+            lie = protocol.NO if y_honest >= n_honest else protocol.YES
+        else:
+            lie = None
+        for k, i in enumerate(others):
+            if i in traitors:
+                continue
+            # Without honest representatives, split the members
+            if (lie or "YN"[k % 2]) == protocol.YES:
+                opinions[i] = protocol.majority(y_honest + n_traitors, n_honest)
+            else:
+                opinions[i] = protocol.majority(y_honest, n_honest + n_traitors)
+        return len(rep_ids) * len(others)
+
+
+def random_traitors(
+    n: int, fraction: float, rng: np.random.Generator, worst_case: bool = False
+) -> Dict[int, protocol.HeadlessTraitor]:
+    """Cyclic traitors at random positions, or with `worst_case` traitors that play
+    `strategies.WorstCaseStrategy`."""
+    traitor_ids = rng.choice(n, int(n * fraction), replace=False)
+    if worst_case:
+        # One strategy for all traitors, so that they share the joint plan of a round
+        strategy = strategies.WorstCaseStrategy()
+        return {int(i): strategies.StrategyTraitor(strategy) for i in traitor_ids}
+    return {
+        int(i): protocol.HeadlessCyclicOpinionTraitor(
+            "".join("YN"[j] for j in rng.integers(2, size=rng.integers(1, 13)))
+        )
+        for i in traitor_ids
+    }
+
+
+def format_report(n: int, results: List[CommitteeResult], valid: int) -> str:
+    result = results[0]
+    lines = []
+    for k, level in enumerate(result.levels):
+        lines.append(
+            f"Level {k}: {level.units} units in {level.committees} committees, "
+            f"{level.messages} messages, {level.rounds} rounds"
+        )
+    lines.append(f"Down: {result.down_messages} messages, {result.down_rounds} rounds")
+    flat_messages, flat_rounds = flat_cost(n)
+    lines.append(
+        f"Total: {result.messages} messages, {result.rounds} rounds "
+        f"(flat: {flat_messages} messages, {flat_rounds} rounds)"
+    )
+    agreements = sum(protocol.is_agreement(r.outputs) for r in results)
+    lines.append(
+        f"Agreement {agreements}/{len(results)}, validity {valid}/{len(results)}"
+    )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, default=10_000)
+    parser.add_argument("--traitor-fraction", type=float, default=0.1)
+    parser.add_argument("--committee-size", type=int, default=40)
+    parser.add_argument("--representatives", type=int, default=13)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worst-case", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    engine = CommitteeConsensus(
+        args.committee_size, args.representatives, depth=args.depth
+    )
+    results = []
+    valid = 0
+    for run in range(args.runs):
+        # Every other run starts unanimous, to test validity too
+        if run % 2:
+            inputs = ["YN"[i] for i in rng.integers(2, size=args.generals)]
+        else:
+            inputs = [protocol.YES] * args.generals
+        traitors = random_traitors(
+            args.generals, args.traitor_fraction, rng, worst_case=args.worst_case
+        )
+        results.append(engine.run(inputs, traitors))
+        valid += protocol.is_valid(inputs, results[-1].outputs)
+    print(format_report(args.generals, results, valid))
+
+
+if __name__ == "__main__":
+    main()
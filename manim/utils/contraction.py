@@ -0,0 +1,291 @@
+"""Contraction hierarchy for repeated route queries on a fixed map.
+
+Scenes call `run_dijkstra` again and again on the same graph, and every call explores
+the whole graph. A contraction hierarchy is built once: the vertices are contracted
+one by one, cheapest first, and when contracting v removes the only shortest path
+u -> v -> w, a shortcut u -> w is added. Then a query searches only upwards in that
+order from both ends, which settles a few hundred vertices even on country-scale
+graphs, and the path is unpacked by replacing every shortcut with the two edges it
+stands for.
+
+Building is pure Python and slow: a 60x60 grid (3.6k vertices) takes 5-15 s, so a
+country-scale map with millions of vertices can't be built in any reasonable time;
+only the queries scale. `ContractionHierarchy.load_or_build` saves the index with
+`np.savez`, in a file named by a hash of the edges and weights, so it is built once.
+
+    ch = ContractionHierarchy.load_or_build(indptr, indices, weights)
+    distance, path = ch.route(source, target)
+
+Paths are shortest paths, but among several of the same length the index may pick a
+different one than `run_dijkstra`.
+"""
+
+import hashlib
+import heapq
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join("media", "contraction")
+
+# Arrays of one search graph: indptr, neighbors, weights, middle vertices (-1 for
+# edges that aren't shortcuts)
+_ARRAYS = ["indptr", "indices", "weights", "middle"]
+
+
+def graph_key(indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray) -> str:
+    """Hash of the edges and weights, to name the saved index."""
+    h = hashlib.blake2b(digest_size=16)
+    for array, dtype in [(indptr, np.int64), (indices, np.int64), (weights, float)]:
+        h.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def _to_csr(n: int, edges: List[Dict[int, Tuple[float, int]]]):
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(e) for e in edges])
+    indices = np.array([v for e in edges for v in e], dtype=np.int64)
+    weights = np.array([w for e in edges for w, _ in e.values()], dtype=float)
+    middle = np.array([m for e in edges for _, m in e.values()], dtype=np.int64)
+    return indptr, indices, weights, middle
+
+
+class _Builder:
+    """Contracts the vertices, cheapest first by the edge difference (shortcuts
+    added minus edges removed), preferring vertices away from those contracted."""
+
+    def __init__(self, indptr, indices, weights, witness_limit: int):
+        self.n = len(indptr) - 1
+        self.witness_limit = witness_limit
+        # out[u][v] = in_[v][u] = (weight, middle vertex or -1)
+        self.out: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(self.n)]
+        self.in_: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(self.n)]
+        sources = np.repeat(np.arange(self.n), np.diff(indptr)).tolist()
+        for u, v, w in zip(sources, np.asarray(indices).tolist(), weights.tolist()):
+            if u != v and w < self.out[u].get(v, (math.inf,))[0]:
+                self.out[u][v] = self.in_[v][u] = (w, -1)
+        self.contracted_neighbors = [0] * self.n
+        # 1 + the highest level of a contracted neighbor, to spread the contractions
+        self.level = [0] * self.n
+        # Edges of the search graphs: up[v] to higher vertices, down[v] from them
+        self.up: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(self.n)]
+        self.down: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(self.n)]
+
+    def _witnesses(self, u: int, v: int, limit: float, targets) -> Dict[int, float]:
+        """Distances from u avoiding v, up to `limit` and `witness_limit` settled
+        vertices."""
+        out = self.out
+        dist = {u: 0.0}
+        queue = [(0.0, u)]
+        settled = 0
+        remaining = len(targets)
+        while queue and settled < self.witness_limit and remaining:
+            d, x = heapq.heappop(queue)
+            if d > dist[x]:
+                continue
+            if d > limit:
+                break
+            settled += 1
+            if x in targets:
+                remaining -= 1
+            for y, (w, _) in out[x].items():
+                new_dist = d + w
+                if y != v and new_dist < dist.get(y, math.inf):
+                    dist[y] = new_dist
+                    heapq.heappush(queue, (new_dist, y))
+        return dist
+
+    def _shortcuts(self, v: int) -> List[Tuple[int, int, float]]:
+        shortcuts = []
+        for u, (wu, _) in self.in_[v].items():
+            targets = {w: wu + ww for w, (ww, _) in self.out[v].items() if w != u}
+            if not targets:
+                continue
+            dist = self._witnesses(u, v, max(targets.values()), targets)
+            shortcuts.extend(
+                (u, w, d) for w, d in targets.items() if dist.get(w, math.inf) > d
+            )
+        return shortcuts
+
+    def _priority(self, v: int) -> int:
+        edge_difference = len(self._shortcuts(v)) - len(self.in_[v]) - len(self.out[v])
+        return 2 * edge_difference + self.contracted_neighbors[v] + self.level[v]
+
+    def _contract(self, v: int):
+        for u, w, d in self._shortcuts(v):
+            if d < self.out[u].get(w, (math.inf,))[0]:
+                self.out[u][w] = self.in_[w][u] = (d, v)
+        # The remaining neighbors are all contracted later, so they are higher
+        self.up[v] = self.out[v]
+        self.down[v] = self.in_[v]
+        for w in self.out[v]:
+            del self.in_[w][v]
+            self.contracted_neighbors[w] += 1
+            self.level[w] = max(self.level[w], self.level[v] + 1)
+        for u in self.in_[v]:
+            del self.out[u][v]
+            self.contracted_neighbors[u] += 1
+            self.level[u] = max(self.level[u], self.level[v] + 1)
+        self.out[v] = {}
+        self.in_[v] = {}
+
+    def build(self) -> "ContractionHierarchy":
+        queue = [(self._priority(v), v) for v in range(self.n)]
+        heapq.heapify(queue)
+        rank = np.empty(self.n, dtype=np.int64)
+        for r in range(self.n):
+            while True:
+                # Priorities change as neighbors get contracted: recompute lazily
+                _, v = heapq.heappop(queue)
+                priority = self._priority(v)
+                if not queue or priority <= queue[0][0]:
+                    break
+                heapq.heappush(queue, (priority, v))
+            rank[v] = r
+            self._contract(v)
+        return ContractionHierarchy(
+            rank, _to_csr(self.n, self.up), _to_csr(self.n, self.down)
+        )
+
+
+class ContractionHierarchy:
+    def __init__(self, rank: np.ndarray, up, down):
+        """`up` and `down` are the CSR arrays (indptr, indices, weights, middle) of
+        the edges to higher vertices and of the edges from higher vertices."""
+        self.rank = rank
+        self.up = up
+        self.down = down
+        # Lists are faster to index than arrays in the query loop
+        self._up = [a.tolist() for a in up]
+        self._down = [a.tolist() for a in down]
+        # (u, w) -> middle vertex of the shortcut, built on the first `path`
+        self._middle: Optional[Dict[Tuple[int, int], int]] = None
+
+    @classmethod
+    def build(
+        cls,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        witness_limit: int = 50,
+    ) -> "ContractionHierarchy":
+        """Contract the graph with edges `u -> indices[k]` for k in
+        `indptr[u]:indptr[u + 1]`. Weights must be nonnegative. A lower
+        `witness_limit` builds faster but adds more shortcuts than needed."""
+        weights = np.asarray(weights, dtype=float)
+        return _Builder(indptr, indices, weights, witness_limit).build()
+
+    def save(self, path: str):
+        arrays = {"rank": self.rank}
+        for name, graph in [("up", self.up), ("down", self.down)]:
+            arrays.update({f"{name}_{a}": x for a, x in zip(_ARRAYS, graph)})
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        with np.load(path) as f:
+            return cls(
+                f["rank"],
+                tuple(f[f"up_{a}"] for a in _ARRAYS),
+                tuple(f[f"down_{a}"] for a in _ARRAYS),
+            )
+
+    @classmethod
+    def load_or_build(
+        cls,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+    ) -> "ContractionHierarchy":
+        """The saved index of this graph, or a new one, saved for next time."""
+        path = os.path.join(cache_dir, graph_key(indptr, indices, weights) + ".npz")
+        if os.path.exists(path):
+            return cls.load(path)
+        ch = cls.build(indptr, indices, weights)
+        os.makedirs(cache_dir, exist_ok=True)
+        ch.save(path)
+        return ch
+
+    def _search(self, source: int, target: int):
+        """Bidirectional upward search. Returns the length, the meeting vertex and
+        the parents of both searches."""
+        graphs = [self._up, self._down]
+        dist: List[Dict[int, float]] = [{source: 0.0}, {target: 0.0}]
+        parent: List[Dict[int, int]] = [{source: -1}, {target: -1}]
+        queues = [[(0.0, source)], [(0.0, target)]]
+        best, meeting = math.inf, -1
+        while queues[0] or queues[1]:
+            # Continue the side with the closer vertex; stop when neither can improve
+            side = (
+                0
+                if queues[0] and (not queues[1] or queues[0][0] <= queues[1][0])
+                else 1
+            )
+            d, x = heapq.heappop(queues[side])
+            if d >= best:
+                queues[side] = []
+                continue
+            if d > dist[side][x]:
+                continue
+            if x in dist[1 - side] and d + dist[1 - side][x] < best:
+                best, meeting = d + dist[1 - side][x], x
+            indptr, indices, weights, _ = graphs[side]
+            for k in range(indptr[x], indptr[x + 1]):
+                y = indices[k]
+                new_dist = d + weights[k]
+                if new_dist < dist[side].get(y, math.inf):
+                    dist[side][y] = new_dist
+                    parent[side][y] = x
+                    heapq.heappush(queues[side], (new_dist, y))
+        return best, meeting, parent
+
+    def distance(self, source: int, target: int) -> float:
+        """Length of the shortest path, inf if there is none."""
+        return self._search(source, target)[0]
+
+    def path(self, source: int, target: int) -> List[int]:
+        """Vertices of a shortest path from `source` to `target`, empty if there is
+        none."""
+        return self.route(source, target)[1]
+
+    def route(self, source: int, target: int) -> Tuple[float, List[int]]:
+        """`distance` and `path` from a single search."""
+        best, meeting, (forward, backward) = self._search(source, target)
+        if meeting < 0:
+            return best, []
+        # Edges of the hierarchy: up to the meeting vertex and down from it
+        upward = []
+        x = meeting
+        while x != source:
+            upward.append((forward[x], x))
+            x = forward[x]
+        edges = upward[::-1]
+        x = meeting
+        while x != target:
+            edges.append((x, backward[x]))
+            x = backward[x]
+
+        if self._middle is None:
+            self._middle = {}
+            for graph, upwards in [(self._up, True), (self._down, False)]:
+                indptr, indices, _, middle = graph
+                for u in range(len(indptr) - 1):
+                    for k in range(indptr[u], indptr[u + 1]):
+                        if middle[k] >= 0:
+                            key = (u, indices[k]) if upwards else (indices[k], u)
+                            self._middle[key] = middle[k]
+
+        path = [source]
+        stack = edges[::-1]
+        while stack:
+            u, w = stack.pop()
+            m = self._middle.get((u, w), -1)
+            if m < 0:
+                path.append(w)
+            else:
+                stack.extend([(m, w), (u, m)])
+        return best, path
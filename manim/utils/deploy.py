@@ -0,0 +1,297 @@
+"""Run the full algorithm with every general in its own OS process.
+
+The generals are connected by a full mesh of `multiprocessing` pipes and exchange
+the messages of every round as real inter-process messages. To get meaningful
+throughput, every process runs a batch of independent protocol instances in
+lock-step, and every round sends one frame per peer holding the messages of all
+instances of the batch (one byte per instance, see `opinion_matrix`'s codes):
+
+    python -m utils.deploy --generals 12 --traitors 2 --instances 100000
+
+The decisions use the same rules as `HeadlessGameState` (vectorized in
+`opinion_matrix.py`), and the outputs are checked against it with `--check`.
+"""
+
+import argparse
+import multiprocessing
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from . import opinion_matrix, protocol
+from .network_sim import percentiles
+
+# A frame must fit into the pipe buffer (64 KiB on Linux): every process sends all
+# its frames of a round before it receives any.
+MAX_BATCH_SIZE = 1 << 15
+
+
+@dataclass
+class DeploymentResult:
+    # Instances x generals message codes of the outputs, NO_MESSAGE for traitors.
+    outputs: np.ndarray
+    seconds: float
+    # Seconds each phase of each batch took, over all processes.
+    phase_times: np.ndarray
+    batch_size: int
+
+    @property
+    def instances_per_second(self) -> float:
+        return len(self.outputs) / self.seconds
+
+    def agreement_rate(self) -> float:
+        honest = self.outputs[:, self.outputs[0] != opinion_matrix.NO_MESSAGE]
+        return float(np.mean(np.all(honest == honest[:, :1], axis=1)))
+
+
+def _send_frames(
+    conns: Dict[int, Connection], frames: Dict[int, np.ndarray], receiver_ids
+):
+    for j in receiver_ids:
+        conns[j].send_bytes(frames[j].tobytes())
+
+
+def _recv_frame(conn: Connection) -> np.ndarray:
+    return np.frombuffer(conn.recv_bytes(), dtype=np.int8)
+
+
+def _general_main(
+    general_id: int,
+    n: int,
+    conns: Dict[int, Connection],
+    inputs: np.ndarray,
+    traitor_opinions: Optional[List[str]],
+    leader_ids: Sequence[int],
+    threshold: int,
+    batch_size: int,
+    send_to_self: bool,
+    start_event,
+    result_conn: Connection,
+):
+    """Main loop of the process of one general.
+
+    `inputs` are the codes of the general's input in every instance. Traitors get
+    the opinions of a cyclic traitor for every instance instead.
+    """
+    peers = sorted(conns)
+    all_ids = np.arange(n)
+    others = np.delete(all_ids, general_id)
+    is_traitor = traitor_opinions is not None
+    n_instances = len(inputs)
+    outputs = inputs.copy()
+    phase_times = []
+
+    start_event.wait()
+    for batch_start in range(0, n_instances, batch_size):
+        batch = slice(batch_start, min(batch_start + batch_size, n_instances))
+        opinions = outputs[batch]
+        traitors = None
+        if is_traitor:
+            traitors = [
+                protocol.HeadlessCyclicOpinionTraitor(o)
+                for o in traitor_opinions[batch]
+            ]
+
+        for leader_id in leader_ids:
+            phase_start = time.perf_counter()
+
+            # Everybody sends to everybody
+            receiver_ids = all_ids if send_to_self else others
+            if is_traitor:
+                # Instances x receivers
+                sent = np.full((len(opinions), n), opinion_matrix.NO_MESSAGE, np.int8)
+                for k, traitor in enumerate(traitors):
+                    sent[k, receiver_ids] = traitor.send(None, general_id, receiver_ids)
+                frames = {j: np.ascontiguousarray(sent[:, j]) for j in peers}
+                own = sent[:, general_id]
+            else:
+                frames = {j: opinions for j in peers}
+                own = opinions
+            _send_frames(conns, frames, peers)
+
+            y_cnts = np.zeros(len(opinions), dtype=np.int64)
+            n_cnts = np.zeros(len(opinions), dtype=np.int64)
+            received = [_recv_frame(conns[j]) for j in peers]
+            if send_to_self:
+                received.append(own)
+            for codes in received:
+                y_cnts += codes == opinion_matrix.CODE_Y
+                n_cnts += codes == opinion_matrix.CODE_N
+
+            # The leader broadcasts, the followers decide
+            if general_id == leader_id:
+                if is_traitor:
+                    sent = np.stack(
+                        [traitor.send(None, general_id, others) for traitor in traitors]
+                    )
+                    frames = dict(zip(others.tolist(), sent.T.copy()))
+                else:
+                    opinions = opinion_matrix.majority_decisions(y_cnts, n_cnts)
+                    frames = {j: opinions for j in peers}
+                _send_frames(conns, frames, peers)
+            else:
+                leader_codes = _recv_frame(conns[leader_id])
+                if not is_traitor:
+                    opinions = opinion_matrix.supermajority_or_leader_decisions(
+                        y_cnts, n_cnts, leader_codes, threshold
+                    )
+
+            phase_times.append(time.perf_counter() - phase_start)
+
+        outputs[batch] = opinions
+
+    if is_traitor:
+        outputs[:] = opinion_matrix.NO_MESSAGE
+    result_conn.send((general_id, outputs, np.array(phase_times)))
+    result_conn.close()
+
+
+def run(
+    inputs: np.ndarray,
+    traitor_opinions: Dict[int, List[str]],
+    leader_ids: Sequence[int],
+    threshold: Optional[int] = None,
+    batch_size: int = 1024,
+    send_to_self: bool = True,
+) -> DeploymentResult:
+    """Run every row of `inputs` (instances x generals, "Y"/"N" characters) as one
+    protocol instance. `traitor_opinions` maps the traitors' ids to the opinions of
+    a cyclic traitor for every instance."""
+    if batch_size > MAX_BATCH_SIZE:
+        raise ValueError(f"Batches of more than {MAX_BATCH_SIZE} instances")
+    n_instances, n = inputs.shape
+    threshold = threshold if threshold is not None else protocol.max_traitors(n)
+    codes = np.stack(
+        [opinion_matrix.encode_opinions("".join(row)) for row in inputs]
+    ).astype(np.int8)
+
+    # Full mesh: conns[i][j] is general i's end of the pipe to general j.
+    conns = [{} for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            conns[i][j], conns[j][i] = multiprocessing.Pipe()
+
+    start_event = multiprocessing.Event()
+    processes = []
+    result_receivers = []
+    for i in range(n):
+        opinions = traitor_opinions.get(i)
+        # One result pipe per process: large results written concurrently to a shared
+        # pipe would interleave.
+        result_receiver, result_sender = multiprocessing.Pipe(duplex=False)
+        result_receivers.append(result_receiver)
+        process = multiprocessing.Process(
+            target=_general_main,
+            args=(
+                i,
+                n,
+                conns[i],
+                codes[:, i].copy(),
+                None if opinions is None else np.array(opinions, dtype=object),
+                list(leader_ids),
+                threshold,
+                batch_size,
+                send_to_self,
+                start_event,
+                result_sender,
+            ),
+        )
+        process.start()
+        processes.append(process)
+
+    start = time.perf_counter()
+    start_event.set()
+    outputs = np.empty((n_instances, n), dtype=np.int8)
+    phase_times = []
+    for result_receiver in result_receivers:
+        general_id, general_outputs, general_phase_times = result_receiver.recv()
+        outputs[:, general_id] = general_outputs
+        phase_times.append(general_phase_times)
+    seconds = time.perf_counter() - start
+
+    for process in processes:
+        process.join()
+    return DeploymentResult(outputs, seconds, np.concatenate(phase_times), batch_size)
+
+
+def random_inputs(
+    n_generals: int,
+    n_traitors: int,
+    n_instances: int,
+    seed: int = 0,
+    max_cycle_length: int = 12,
+):
+    """Random inputs for every instance, random traitor ids (fixed for the whole
+    deployment, like processes would be) and random cyclic traitor opinions."""
+    rng = np.random.default_rng(seed)
+    inputs = np.array(list("YN"))[rng.integers(2, size=(n_instances, n_generals))]
+    traitor_ids = sorted(
+        int(i) for i in rng.choice(n_generals, size=n_traitors, replace=False)
+    )
+    traitor_opinions = {
+        i: [
+            "".join("YN"[j] for j in rng.integers(2, size=length))
+            for length in rng.integers(1, max_cycle_length + 1, size=n_instances)
+        ]
+        for i in traitor_ids
+    }
+    return inputs, traitor_opinions
+
+
+def check(
+    inputs: np.ndarray,
+    traitor_opinions: Dict[int, List[str]],
+    leader_ids: Sequence[int],
+    result: DeploymentResult,
+) -> int:
+    """Number of instances whose outputs differ from `HeadlessGameState`."""
+    mismatches = 0
+    for k, row in enumerate(inputs):
+        game = protocol.HeadlessGameState.from_opinions(
+            list(row), {i: opinions[k] for i, opinions in traitor_opinions.items()}
+        )
+        expected = opinion_matrix.encode_opinions(game.full_algorithm(leader_ids))
+        mismatches += not np.array_equal(expected, result.outputs[k])
+    return mismatches
+
+
+def format_report(result: DeploymentResult) -> str:
+    def ms(p: Dict[int, float]) -> str:
+        return ", ".join(f"p{q} {v * 1000:.3f} ms" for q, v in p.items())
+
+    return "\n".join(
+        [
+            f"Instances: {len(result.outputs)} in {result.seconds:.2f} s "
+            f"({result.instances_per_second:.0f}/s)",
+            f"Agreement: {result.agreement_rate():.6f}",
+            f"Phase latency (batch of {result.batch_size}): "
+            f"{ms(percentiles(result.phase_times))}",
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, default=12)
+    parser.add_argument("--traitors", type=int, default=2)
+    parser.add_argument("--instances", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    inputs, traitor_opinions = random_inputs(
+        args.generals, args.traitors, args.instances, seed=args.seed
+    )
+    leader_ids = list(range(args.traitors + 1))
+    result = run(inputs, traitor_opinions, leader_ids, batch_size=args.batch_size)
+    print(format_report(result))
+    if args.check:
+        print(f"Mismatches: {check(inputs, traitor_opinions, leader_ids, result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Headless agreement with signed messages, as in the blockchain scenes.
+
+With signatures (`ElectronicSignature`, `ChatMessage(with_verification=True)`), a
+traitor can't claim that somebody else said something they didn't, and agreement is
+possible with any number of traitors below n/2, not just n/4. This is the
+Dolev-Strong protocol:
+
+- Every general signs its input and sends it to everybody.
+- A message received in round r is a chain of r signatures: the general whose input
+  it is, then every general that relayed it. A general accepts it if all signatures
+  are valid and distinct and it hasn't accepted that value for that general yet; it
+  then adds its own signature and relays it to everybody in round r + 1.
+- After t + 1 rounds, a general whose input was accepted as exactly one value counts
+  as voting for it, and every general decides by majority of the votes.
+
+A traitor can make its input reach some generals late, but only through a chain of
+traitors' signatures: a value accepted in round r <= t is relayed to everybody in
+round r + 1, and a chain of t + 1 signatures contains an honest one, whose general
+relayed it to everybody already. So all honest generals accept the same values,
+which is what the chat windows of `BlockchainState` show: the same messages in
+everybody's window.
+
+Signatures are checked in one batch per general and round, and every general keeps
+a `VerificationCache`, so the beginning of a relayed chain, which the general has
+usually already seen, is not verified again.
+
+    python -m utils.dolev_strong --generals 7 --traitors 3 --adversary late
+"""
+
+import argparse
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import protocol
+from .signatures import KeyRing, VerificationCache
+
+# whose input, opinion
+_HEADER = struct.Struct("<IB")
+_OPINIONS = (protocol.YES, protocol.NO)
+
+
+def max_signed_traitors(n: int) -> int:
+    """The most traitors the signed protocol handles."""
+    return (n - 1) // 2
+
+
+@dataclass(frozen=True)
+class Chain:
+    """A value with the signatures of the generals that relayed it, in order. The
+    first signer is the general whose input it is."""
+
+    general_id: int
+    opinion: str
+    signers: Tuple[int, ...] = ()
+    signatures: Tuple[bytes, ...] = ()
+
+    def payload(self, k: int) -> bytes:
+        """What the k-th signer signed: the value and all signatures before it."""
+        header = _HEADER.pack(self.general_id, ord(self.opinion))
+        return header + b"".join(self.signatures[:k])
+
+    def signed(self, keys: KeyRing, signer_id: int) -> "Chain":
+        signature = keys.sign(signer_id, self.payload(len(self.signatures)))
+        return Chain(
+            self.general_id,
+            self.opinion,
+            self.signers + (signer_id,),
+            self.signatures + (signature,),
+        )
+
+
+# receiver id, chain
+Message = Tuple[int, Chain]
+
+
+class Adversary:
+    """Controls all traitors. It can sign with the traitors' keys only: honest
+    signatures it can only copy from the chains the traitors received."""
+
+    def messages(
+        self,
+        game: "SignedGameState",
+        round: int,
+        inboxes: Dict[int, List[Chain]],
+    ) -> Dict[int, List[Message]]:
+        """Messages every traitor sends in `round` (starting from 1), given what the
+        traitors received in the round before."""
+        return {}
+
+
+class SilentAdversary(Adversary):
+    pass
+
+
+class EquivocatingAdversary(Adversary):
+    """Every traitor sends YES to half of the generals and NO to the other half in
+    the first round, and also tries to flip honest inputs with forged signatures."""
+
+    def messages(self, game, round, inboxes):
+        if round != 1:
+            return {}
+        rng = np.random.default_rng(round)
+        out = {}
+        for i in game.traitor_ids:
+            chains = {o: game.sign(Chain(i, o), i) for o in _OPINIONS}
+            sent = [
+                (j, chains[protocol.YES if j % 2 == 0 else protocol.NO])
+                for j in game.others(i)
+            ]
+            for h in game.honest_ids:
+                forged = Chain(
+                    h,
+                    protocol.NO if game.inputs[h] == protocol.YES else protocol.YES,
+                    (h,),
+                    (rng.bytes(len(chains[protocol.YES].signatures[0])),),
+                )
+                sent.extend((j, forged) for j in game.others(i))
+            out[i] = sent
+        return out
+
+
+class LateAdversary(Adversary):
+    """The inputs of the traitors travel through all the traitors, and in the last
+    round in which they can, YES reaches one honest general and NO another."""
+
+    def messages(self, game, round, inboxes):
+        traitor_ids = game.traitor_ids
+        if round > len(traitor_ids) or len(game.honest_ids) < 2:
+            return {}
+        # In round r, the r-th traitor passes the chains on.
+        sender = traitor_ids[round - 1]
+        out = []
+        for i in traitor_ids:
+            for opinion, receiver in zip(_OPINIONS, game.honest_ids[:2]):
+                chain = Chain(i, opinion)
+                for signer in traitor_ids[:round]:
+                    chain = game.sign(chain, signer)
+                if round == len(traitor_ids):
+                    out.append((receiver, chain))
+                else:
+                    out.append((traitor_ids[round], chain))
+        return {sender: out}
+
+
+class SignedGameState:
+    def __init__(
+        self,
+        inputs: Sequence[str],
+        traitor_ids: Sequence[int],
+        adversary: Optional[Adversary] = None,
+        max_traitors: Optional[int] = None,
+        keys: Optional[KeyRing] = None,
+    ):
+        """`inputs` are the opinions of the generals; those of the traitors are
+        ignored. The protocol runs for `max_traitors` + 1 rounds, by default the
+        most that works for the number of generals."""
+        self.n = len(inputs)
+        self.inputs = list(inputs)
+        self.traitor_ids = sorted(int(i) for i in traitor_ids)
+        self.honest_ids = [i for i in range(self.n) if i not in self.traitor_ids]
+        self.adversary = adversary or SilentAdversary()
+        self.max_traitors = (
+            max_traitors if max_traitors is not None else max_signed_traitors(self.n)
+        )
+        self.keys = keys or KeyRing(self.n)
+        self.caches = {i: VerificationCache(self.keys) for i in self.honest_ids}
+        # accepted[j][i]: values general j accepted as the input of general i
+        self.accepted: Dict[int, List[set]] = {
+            j: [set() for _ in range(self.n)] for j in self.honest_ids
+        }
+        self.messages_sent = 0
+
+    def others(self, general_id: int) -> List[int]:
+        return [j for j in range(self.n) if j != general_id]
+
+    def sign(self, chain: Chain, signer_id: int) -> Chain:
+        """Add a traitor's signature; for adversaries."""
+        if signer_id not in self.traitor_ids:
+            raise ValueError(f"General {signer_id} is not a traitor")
+        return chain.signed(self.keys, signer_id)
+
+    def _accept(self, receiver_id: int, round: int, chains: List[Chain]):
+        """Chains that `receiver_id` accepts in `round`, verified in one batch."""
+        candidates = [
+            c
+            for c in chains
+            if len(c.signers) == round
+            and c.signers[0] == c.general_id
+            and len(set(c.signers)) == round
+            and receiver_id not in c.signers
+            and c.opinion in _OPINIONS
+        ]
+        items = [
+            (signer, c.payload(k), c.signatures[k])
+            for c in candidates
+            for k, signer in enumerate(c.signers)
+        ]
+        valid = iter(self.caches[receiver_id].verify_batch(items))
+
+        accepted = []
+        for c in candidates:
+            # Consume the results of all signatures of the chain
+            ok = all([next(valid) for _ in c.signers])
+            values = self.accepted[receiver_id][c.general_id]
+            # Two different values are enough to know the general is a traitor
+            if ok and c.opinion not in values and len(values) < 2:
+                values.add(c.opinion)
+                accepted.append(c)
+        return accepted
+
+    def run(self) -> List[Optional[str]]:
+        """Run all rounds. Returns the decisions, None for the traitors."""
+        inboxes: Dict[int, List[Chain]] = {i: [] for i in range(self.n)}
+        outgoing: Dict[int, List[Message]] = {
+            i: [
+                (j, Chain(i, self.inputs[i]).signed(self.keys, i))
+                for j in self.others(i)
+            ]
+            for i in self.honest_ids
+        }
+        for i in self.honest_ids:
+            self.accepted[i][i].add(self.inputs[i])
+
+        for round in range(1, self.max_traitors + 2):
+            outgoing.update(
+                self.adversary.messages(
+                    self, round, {i: inboxes[i] for i in self.traitor_ids}
+                )
+            )
+            inboxes = {i: [] for i in range(self.n)}
+            for messages in outgoing.values():
+                for receiver_id, chain in messages:
+                    inboxes[receiver_id].append(chain)
+                self.messages_sent += len(messages)
+
+            outgoing = {}
+            for j in self.honest_ids:
+                accepted = self._accept(j, round, inboxes[j])
+                if round <= self.max_traitors:
+                    outgoing[j] = [
+                        (k, chain.signed(self.keys, j))
+                        for chain in accepted
+                        for k in self.others(j)
+                        if k not in chain.signers
+                    ]
+        return self.decisions()
+
+    def decisions(self) -> List[Optional[str]]:
+        out: List[Optional[str]] = [None] * self.n
+        for j in self.honest_ids:
+            votes = [
+                next(iter(values)) for values in self.accepted[j] if len(values) == 1
+            ]
+            out[j] = protocol.majority(
+                votes.count(protocol.YES), votes.count(protocol.NO)
+            )
+        return out
+
+    def verification_stats(self) -> Tuple[int, int]:
+        """Signatures verified and cache hits, over all honest generals."""
+        return (
+            sum(c.verified for c in self.caches.values()),
+            sum(c.hits for c in self.caches.values()),
+        )
+
+
+ADVERSARIES = {
+    "silent": SilentAdversary,
+    "equivocating": EquivocatingAdversary,
+    "late": LateAdversary,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, default=7)
+    parser.add_argument("--traitors", type=int, default=3)
+    parser.add_argument("--adversary", choices=ADVERSARIES, default="late")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    agreements, valid, messages, verified, hits = 0, 0, 0, 0, 0
+    for _ in range(args.runs):
+        inputs = ["YN"[i] for i in rng.integers(2, size=args.generals)]
+        traitor_ids = rng.choice(args.generals, args.traitors, replace=False)
+        game = SignedGameState(inputs, traitor_ids, ADVERSARIES[args.adversary]())
+        outputs = game.run()
+        agreements += protocol.is_agreement(outputs)
+        valid += protocol.is_valid(inputs, outputs)
+        messages += game.messages_sent
+        run_verified, run_hits = game.verification_stats()
+        verified += run_verified
+        hits += run_hits
+
+    print(
+        f"Agreement {agreements}/{args.runs}, validity {valid}/{args.runs}, "
+        f"{messages / args.runs:.0f} messages/run, "
+        f"{verified / args.runs:.0f} signatures verified/run, "
+        f"{hits / (verified + hits):.1%} cache hits"
+    )
+
+
+if __name__ == "__main__":
+    main()
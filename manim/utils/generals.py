@@ -1,9 +1,13 @@
+import functools
 from collections import namedtuple
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 from manim import *
 
+from . import opinion_matrix, profiling, protocol, trace
 from .chat_window import SENDER_COLORS_ORDER
+from .profiling import Profiler, profiled
+from .trace import FLAG_DECISION, FLAG_LEADER, TraceWriter
 from .util_general import *
 
 GENERAL_RADIUS = 0.5
@@ -27,6 +31,27 @@ CLICK_OFFSET = 0.1
 EXPLOSION_OFFSET = 0.1
 
 
+@functools.lru_cache(maxsize=None)
+def circle_layout(n: int) -> np.ndarray:
+    """Positions of n generals on the unit circle, one 3D point per row (read-only)."""
+    # Shift the index by 1 so that the generals are numbered like clocks
+    angles = (np.arange(n) + 1.5) % n * 2 * np.pi / n
+    layout = np.outer(np.sin(angles), RIGHT) + np.outer(np.cos(angles), UP)
+    layout.flags.writeable = False
+    return layout
+
+
+def _trace_codes(opinions: Sequence[str]) -> np.ndarray:
+    """Message codes of opinions to record in a trace, which only has codes for
+    "Y", "N" and "-"."""
+    invalid = {o for o in opinions if o not in opinion_matrix.OPINIONS.values()}
+    if invalid:
+        raise ValueError(
+            f"Only Y, N and - opinions can be traced, got {sorted(map(repr, invalid))}"
+        )
+    return opinion_matrix.encode_opinions(opinions)
+
+
 class Message(Group):
     def __init__(self, message: str, clipart=False):
         super().__init__()
@@ -74,33 +99,66 @@ class LeaderMessage(Message):
 class MessageBuffer(Group):
     def __init__(self):
         super().__init__()
+        # Read-only from outside: use `add_message`, `take_messages` and `clear`.
         self.messages = []
+        # Regular (non-leader) messages per opinion, and for every message its index
+        # among the messages with the same opinion (None for leader messages).
+        self.y_cnt, self.n_cnt = 0, 0
+        self._slots: List[Optional[int]] = []
+        # Messages that `sort_messages` hasn't placed yet.
+        self._n_sorted = 0
         self.icon = Rectangle(width=1, height=1, stroke_opacity=0.0).scale(0.75)
         self.add(self.icon)
 
     def add_message(self, message: Message):
+        slot = None
+        if not isinstance(message, LeaderMessage):
+            if message.message == "Y":
+                slot = self.y_cnt
+                self.y_cnt += 1
+            elif message.message == "N":
+                slot = self.n_cnt
+                self.n_cnt += 1
         self.messages.append(message)
+        self._slots.append(slot)
+
+    def add_messages(self, messages: List[Message]):
+        for message in messages:
+            self.add_message(message)
+
+    def take_messages(self) -> List[Message]:
+        """Remove all messages from the buffer and return them."""
+        messages = self.messages
+        self.clear()
+        return messages
+
+    def clear(self):
+        self.messages = []
+        self.y_cnt, self.n_cnt = 0, 0
+        self._slots = []
+        self._n_sorted = 0
 
     def count_regular_opinions(self):
-        opinions = [
-            msg.message for msg in self.messages if not isinstance(msg, LeaderMessage)
-        ]
-        return opinions.count("Y"), opinions.count("N")
+        return self.y_cnt, self.n_cnt
 
     def sort_messages(self):
-        # Reorganize the messages by the opinion they carry
+        """Animations that reorganize the messages by the opinion they carry. Only
+        the messages added since the last call are moved."""
         anims = []
-        y_cnt, n_cnt = 0, 0
         message_spacing = 3 * MESSAGE_RADIUS  # 2 * radius + spacing
-        for msg in self.messages:
+        for msg, slot in zip(
+            self.messages[self._n_sorted :], self._slots[self._n_sorted :]
+        ):
             if isinstance(msg, LeaderMessage):
                 # Leader messages are not sorted, they are just shifted up
                 # to make space for the inequality symbol.
                 anims.append(msg.animate.shift(UP * MESSAGE_BUFFER_VERTICAL_OFFSET))
                 continue
+            if slot is None:
+                raise Exception("Invalid message")
+            row = slot // MESSAGE_BUFFER_COLUMNS
+            col = slot % MESSAGE_BUFFER_COLUMNS
             if msg.message == "Y":
-                row = y_cnt // MESSAGE_BUFFER_COLUMNS
-                col = y_cnt % MESSAGE_BUFFER_COLUMNS
                 pos = (
                     self.get_center()
                     + LEFT * MESSAGE_BUFFER_HORIZONTAL_OFFSET
@@ -108,10 +166,7 @@ class MessageBuffer(Group):
                     + row * message_spacing * DOWN
                     + col * message_spacing * RIGHT
                 )
-                y_cnt += 1
-            elif msg.message == "N":
-                row = n_cnt // MESSAGE_BUFFER_COLUMNS
-                col = n_cnt % MESSAGE_BUFFER_COLUMNS
+            else:
                 pos = (
                     self.get_center()
                     + RIGHT * MESSAGE_BUFFER_HORIZONTAL_OFFSET
@@ -119,10 +174,8 @@ class MessageBuffer(Group):
                     + row * message_spacing * DOWN
                     + col * message_spacing * LEFT
                 )
-                n_cnt += 1
-            else:
-                raise Exception("Invalid message")
             anims.append(msg.animate.move_to(pos))
+        self._n_sorted = len(self.messages)
         return anims
 
 
@@ -288,26 +341,20 @@ class General(Group):
         # Traitors don't move their receive buffer to the thinking buffer,
         # they just discard the messages.
         if self.is_traitor:
-            anims = [FadeOut(msg) for msg in self.receive_buffer.messages]
-            self.receive_buffer.messages = []
-            return anims
+            return [FadeOut(msg) for msg in self.receive_buffer.take_messages()]
 
         receive_to_thinking = (
             self.thinking_buffer.get_center() - self.receive_buffer.get_center()
         )
-        anims = [
-            msg.animate.shift(receive_to_thinking)
-            for msg in self.receive_buffer.messages
-        ]
-        self.thinking_buffer.messages += self.receive_buffer.messages
-        self.receive_buffer.messages = []
-        return anims
+        messages = self.receive_buffer.take_messages()
+        self.thinking_buffer.add_messages(messages)
+        return [msg.animate.shift(receive_to_thinking) for msg in messages]
 
     def update_opinion_to_majority(self, scene: Scene, short_version: bool = False):
         thinking_buffer = self.thinking_buffer
 
         y_cnt, n_cnt = thinking_buffer.count_regular_opinions()
-        win = "Y" if y_cnt >= n_cnt else "N"
+        win = protocol.majority(y_cnt, n_cnt)
 
         if not short_version:
             scene.add_sound(get_sound_effect("click", variant=1))
@@ -327,7 +374,7 @@ class General(Group):
                 *[msg.animate.move_to(new_opinion) for msg in msgs],
                 inequality_symbol.animate.become(new_opinion.icon),
             )
-            self.thinking_buffer.messages = []
+            self.thinking_buffer.clear()
             scene.remove(inequality_symbol, *msgs)
         else:
             new_opinion = Message(win).scale(4)
@@ -338,8 +385,11 @@ class General(Group):
             )
         return new_opinion
 
-    def update_opinion_to_supermajority_or_leader(self, scene: Scene) -> Message:
-        """Returns a Message with the new opinion."""
+    def update_opinion_to_supermajority_or_leader(
+        self, scene: Scene, threshold: int
+    ) -> Message:
+        """Returns a Message with the new opinion. `threshold` is how many dissenting
+        messages still count as a supermajority (see `protocol.max_traitors`)."""
         thinking_buffer = self.thinking_buffer
         scene.add_sound(get_sound_effect("click", variant=1))
         scene.play(*thinking_buffer.sort_messages())
@@ -358,10 +408,11 @@ class General(Group):
         )
 
         y_cnt, n_cnt = thinking_buffer.count_regular_opinions()
-        if n_cnt <= 2:
+        supermajority = protocol.supermajority(y_cnt, n_cnt, threshold)
+        if supermajority == "Y":
             win = "Y"
             tex = "$\gg$"  # Supermajority
-        elif y_cnt <= 2:
+        elif supermajority == "N":
             win = "N"
             tex = "$\ll$"  # Supermajority
         else:
@@ -376,13 +427,13 @@ class General(Group):
         new_opinion = Message(win).scale(4)  # Make the new opinion 4x bigger
         new_opinion.move_to(inequality_symbol)
 
-        if n_cnt <= 2:
+        if supermajority == "Y":
             anims = (
                 [msg.animate.move_to(new_opinion) for msg in y_msgs]
                 + [FadeOut(msg) for msg in n_msgs]
                 + [FadeOut(leader_msg)]
             )
-        elif y_cnt <= 2:
+        elif supermajority == "N":
             anims = (
                 [msg.animate.move_to(new_opinion) for msg in n_msgs]
                 + [FadeOut(msg) for msg in y_msgs]
@@ -400,7 +451,7 @@ class General(Group):
             *anims,
             inequality_symbol.animate.become(new_opinion.icon),
         )
-        self.thinking_buffer.messages = []
+        self.thinking_buffer.clear()
         scene.remove(inequality_symbol, *msgs)
         return new_opinion
 
@@ -690,9 +741,27 @@ class CyclicOpinionTraitor(Traitor):
 
 
 class GameState(Group):
-    def __init__(self, generals: List[General], shft=None):
+    def __init__(
+        self,
+        generals: List[General],
+        shft=None,
+        trace: Optional[TraceWriter] = None,
+        profiler: Optional[Profiler] = None,
+    ):
+        """
+        If `trace` is given, every message sent and every change of opinion is
+        recorded in it (see `trace.py`).
+
+        If `profiler` is given, or $GENERALS_PROFILE is set, the steps of the
+        algorithms are profiled (see `profiling.py`).
+        """
         super().__init__()
         self.generals = generals
+        self.trace = trace
+        self.profiler = profiler or profiling.from_environment()
+        # Incremented after every leader in `full_algorithm`, and after every run of
+        # `leader_algorithm` and `local_algorithm`.
+        self.phase = 0
         # Distribute generals in a circle
         for i in range(len(self.generals)):
             # Create the ith general
@@ -746,11 +815,7 @@ class GameState(Group):
         """
         Return the position of the ith general in the circle.
         """
-        # Shift the index by 1 so that the generals are numbered like clocks
-        ii = (i + 1.5) % len(self.generals)
-        x = np.sin(ii * 2 * np.pi / len(self.generals))
-        y = np.cos(ii * 2 * np.pi / len(self.generals))
-        return x * RIGHT + y * UP
+        return circle_layout(len(self.generals))[i % len(self.generals)].copy()
 
     def send_messages_low_tech(
         self,
@@ -798,77 +863,130 @@ class GameState(Group):
         If circular_receive is True, the messages are received in the receive buffer
         in the same layout as the generals are positioned in the circle.
         """
-        msg_objects = []
-        anims = []
-        to_remove = []
+        return self._send_messages(
+            [m.message for m in messages_to_send],
+            np.array([m.sender_id for m in messages_to_send], dtype=np.int64),
+            np.array([m.receiver_id for m in messages_to_send], dtype=np.int64),
+            circular_receive,
+            circular_send,
+        )
 
-        for message_to_send in messages_to_send:
-            sender = self.generals[message_to_send.sender_id]
-            receiver: General = self.generals[message_to_send.receiver_id]
-            message = message_to_send.message
+    def send_messages_bulk(
+        self,
+        sender_ids,
+        receiver_ids,
+        values,
+        msg_class=Message,
+        circular_receive=False,
+        circular_send=False,
+    ) -> Tuple[List[Message], List[Animation], List[Mobject]]:
+        """
+        Like `send_messages`, for messages given as arrays (or scalars, which are
+        broadcast) of sender ids, receiver ids and values. The values are either the
+        opinions themselves or opinion codes (see `opinion_matrix.py`).
+        """
+        sender_ids, receiver_ids, values = np.broadcast_arrays(
+            np.asarray(sender_ids, dtype=np.int64),
+            np.asarray(receiver_ids, dtype=np.int64),
+            np.asarray(values),
+        )
+        if values.dtype.kind in "iu":
+            unknown = set(values.ravel().tolist()) - opinion_matrix.OPINIONS.keys()
+            if unknown:
+                raise ValueError(f"Unknown opinion codes {sorted(unknown)}")
+            opinions = [opinion_matrix.OPINIONS[v] for v in values.ravel().tolist()]
+        else:
+            opinions = values.ravel().tolist()
+        messages = [msg_class(opinion) for opinion in opinions]
+        return self._send_messages(
+            messages, sender_ids, receiver_ids, circular_receive, circular_send
+        )
 
+    def _send_messages(
+        self,
+        messages: List[Message],
+        sender_ids: np.ndarray,
+        receiver_ids: np.ndarray,
+        circular_receive: bool,
+        circular_send: bool,
+    ) -> Tuple[List[Message], List[Animation], List[Mobject]]:
+        # All positions at once, from the positions of the generals and the layout
+        layout = circle_layout(len(self.generals))
+        icon_centers = np.array([g.icon.get_center() for g in self.generals])
+        buffer_centers = np.array(
+            [g.receive_buffer.get_center() for g in self.generals]
+        )
+        if circular_send:
+            # Before sending, messages are aligned around the sender's icon,
+            # corresponding to which receiver they are sent to.
+            send_locations = (
+                icon_centers[sender_ids] + layout[receiver_ids] * GENERAL_RADIUS
+            )
+        else:
+            # Messages are sent from the sender's position to the receiver's buffer
+            send_locations = icon_centers[sender_ids]
+        if circular_receive:
+            # Arange the messages in the buffer in the same circle as the generals from
+            # which they were sent.
+            receive_locations = (
+                buffer_centers[receiver_ids]
+                + layout[sender_ids] * RECEIVE_BUFFER_CIRCULAR_RADIUS
+            )
+        else:
+            receive_locations = buffer_centers[receiver_ids]
+
+        anims = []
+        to_remove = []
+        for message, sender_id, receiver_id, send_location, receive_location in zip(
+            messages,
+            sender_ids.tolist(),
+            receiver_ids.tolist(),
+            send_locations,
+            receive_locations,
+        ):
+            sender = self.generals[sender_id]
             if sender.is_traitor:
                 # Make the message border black if the sender is a traitor
                 # to indicate that the message is not trustworthy.
                 message.icon.stroke_color = BLACK
-                pass
-
-            if circular_send:
-                # Before sending, messages are aligned around the sender's icon,
-                # corresponding to which receiver they are sent to.
-                message.move_to(
-                    sender.icon.get_center()
-                    + self.circle_position(message_to_send.receiver_id) * GENERAL_RADIUS
-                )
-            else:
-                # Messages are sent from the sender's position to the receiver's buffer
-                # TODO hlasilo chybu
-                # msg.move_to(sender.receive_buffer)
-                message.move_to(sender.icon.get_center())
-
-            # Make the message icon appear from the sender's icon
-            message_icon_copy = message.icon.copy()
+            message.move_to(send_location)
 
+            # Make the message icon appear from the sender's icon. Every message needs
+            # its own copy to fly, but the target is the message's own icon in the
+            # receiver's buffer: `Transform` copies it when the animation begins, so
+            # it doesn't need a copy of its own like `.animate.become` did.
+            target = message.icon
             message.icon = sender.icon.copy()
+            message.move_to(receive_location)
 
             # Animate the message moving from the sender to the receiver.
-            if circular_receive:
-                # Arange the messages in the buffer in the same circle as the generals from
-                # which they were sent.
-                receive_location = (
-                    receiver.receive_buffer.get_center()
-                    + self.circle_position(message_to_send.sender_id)
-                    * RECEIVE_BUFFER_CIRCULAR_RADIUS
-                )
-            else:
-                receive_location = receiver.receive_buffer.get_center()
-
-            message_icon_copy.move_to(receive_location)
-            anims.append(message.icon.animate.become(message_icon_copy))
-
-            if isinstance(message, LeaderMessage):
-                # TODO(vv): handle
-                pass
-                # print("leader message")
-                # message_crown_copy = message.crown.copy().move_to(
-                #     receive_location
-                # )
-                # anims.append(FadeIn(message_crown_copy))
-
-            msg_objects.append(message)
-
-            message.move_to(receive_location)
-            receiver.receive_buffer.add_message(message)
+            anims.append(Transform(message.icon, target))
 
+            self.generals[receiver_id].receive_buffer.add_message(message)
             to_remove.append(message.icon)
 
+        if self.trace is not None and messages:
+            self.trace.write_messages(
+                self.phase,
+                sender_ids,
+                receiver_ids,
+                _trace_codes([m.message for m in messages]),
+                flags=np.array(
+                    [
+                        FLAG_LEADER if isinstance(m, LeaderMessage) else 0
+                        for m in messages
+                    ]
+                ),
+            )
+
         # NOTE(vv): It's ugly to have to return a separate to_remove list
         # but I couldn't figure out how to avoid it because of Manim's weird
         # behavior with animations scheduled ahead of time and .become().
         # Specifically, when you run move_receive_buffer_to_thinking_buffer(),
         # copies of the message dots would say behind.
-        return msg_objects, anims, to_remove
+        return messages, anims, to_remove
 
+    @profiled
     def broadcast_opinion(
         self,
         scene: Scene,
@@ -878,17 +996,19 @@ class GameState(Group):
         circular_send=False,
         msg_class=Message,
     ) -> List[Message]:
-        messages = []
+        sender_ids, receiver_ids = [], []
         for general_id in general_ids:
             for i in range(len(self.generals)):
                 if i != general_id or send_to_self:
-                    messages.append(
-                        MessageToSend(
-                            general_id, i, msg_class(self.generals[general_id].opinion)
-                        )
-                    )
-        msg_objects, anims, to_remove = self.send_messages(
-            messages,
+                    sender_ids.append(general_id)
+                    receiver_ids.append(i)
+        # Read the opinions message by message: a cyclic traitor's opinion changes
+        opinions = [self.generals[i].opinion for i in sender_ids]
+        msg_objects, anims, to_remove = self.send_messages_bulk(
+            sender_ids,
+            receiver_ids,
+            opinions,
+            msg_class=msg_class,
             circular_receive=circular_receive,
             circular_send=circular_send,
         )
@@ -897,32 +1017,27 @@ class GameState(Group):
 
         return msg_objects
 
+    @profiled
     def send_opinions_to(self, general_id: int, send_to_self: bool = False):
-        messages = []
-        for i in range(len(self.generals)):
-            if send_to_self or i != general_id:
-                messages.append(
-                    MessageToSend(i, general_id, Message(self.generals[i].opinion))
-                )
-        msg_objects, anims, to_remove = self.send_messages(
-            messages, circular_receive=True
+        sender_ids = [
+            i for i in range(len(self.generals)) if send_to_self or i != general_id
+        ]
+        opinions = [self.generals[i].opinion for i in sender_ids]
+        return self.send_messages_bulk(
+            sender_ids, general_id, opinions, circular_receive=True
         )
-        return msg_objects, anims, to_remove
 
+    @profiled
     def send_opinions_from(self, general_id: int, send_to_self: bool = False):
-        messages = []
-        for i in range(len(self.generals)):
-            if send_to_self or i != general_id:
-                messages.append(
-                    MessageToSend(
-                        general_id, i, Message(self.generals[general_id].opinion)
-                    )
-                )
-        msg_objects, anims, to_remove = self.send_messages(
-            messages, circular_receive=True
+        receiver_ids = [
+            i for i in range(len(self.generals)) if send_to_self or i != general_id
+        ]
+        opinions = [self.generals[general_id].opinion for _ in receiver_ids]
+        return self.send_messages_bulk(
+            general_id, receiver_ids, opinions, circular_receive=True
         )
-        return msg_objects, anims, to_remove
 
+    @profiled
     def update_general_opinions(
         self,
         scene: Scene,
@@ -947,11 +1062,26 @@ class GameState(Group):
 
             # The opinion was also sent via `broadcast_opinion` and stored in the receive
             # buffer, so make sure we remove it
-            self.generals[general_id].receive_buffer.messages = []
+            self.generals[general_id].receive_buffer.clear()
+
+        if self.trace is not None:
+            honest = [
+                (general_id, opinion.message)
+                for general_id, opinion in zip(general_ids, opinions)
+                if not self.generals[general_id].is_traitor
+            ]
+            if honest:
+                ids, values = zip(*honest)
+                self.trace.write_decisions(
+                    self.phase,
+                    np.array(ids),
+                    _trace_codes(values),
+                )
 
         scene.play(*anims)
         scene.remove(*opinions, *new_icons)
 
+    @profiled
     def leader_algorithm(
         self,
         scene: Scene,
@@ -973,7 +1103,8 @@ class GameState(Group):
         scene.remove(*to_remove)
         scene.play(*self.generals[leader_id].move_receive_buffer_to_thinking_buffer())
         if not self.generals[leader_id].is_traitor:
-            new_opinion = self.generals[leader_id].update_opinion_to_majority(scene)
+            with self.profiler.step("update_opinion_to_majority", self.phase):
+                new_opinion = self.generals[leader_id].update_opinion_to_majority(scene)
             scene.add_sound(get_sound_effect("click", variant=0))
             self.update_general_opinions(scene, [leader_id], [new_opinion])
 
@@ -993,6 +1124,9 @@ class GameState(Group):
         if add_background_at_the_end:
             self.set_output(scene)
 
+        self.phase += 1
+
+    @profiled
     def local_algorithm(self, scene: Scene, send_to_self: bool = True, second=False):
         anims = []
         to_remove = []
@@ -1038,19 +1172,24 @@ class GameState(Group):
             if self.generals[i].is_traitor:
                 continue
 
-            new_opinion = self.generals[i].update_opinion_to_majority(
-                scene, short_version=n_long_played >= 3
-            )
+            with self.profiler.step("update_opinion_to_majority", self.phase):
+                new_opinion = self.generals[i].update_opinion_to_majority(
+                    scene, short_version=n_long_played >= 3
+                )
             n_long_played += 1
             scene.add_sound(get_sound_effect("click", variant=0))
             self.update_general_opinions(scene, [i], [new_opinion], with_highlight=True)
 
+        self.phase += 1
+
+    @profiled
     def move_all_receive_buffers_to_thinking_buffers(self, scene: Scene):
         anims = []
         for general in self.generals:
             anims.extend(general.move_receive_buffer_to_thinking_buffer())
         scene.play(*anims)
 
+    @profiled
     def full_algorithm(
         self,
         scene: Scene,
@@ -1059,12 +1198,32 @@ class GameState(Group):
         send_to_self: bool = True,
         early_stop: bool = False,
         stops: bool = False,
+        stop_when_stable: bool = False,
     ):
+        """
+        With `stop_when_stable`, the remaining leaders are skipped once no phase can
+        change the opinions anymore (see `protocol.is_stable`).
+        """
+
         def highlight_line(line_number: int):
+            self.profiler.set_line(line_number, self.phase)
             if code is not None:
                 code.highlight_line(line_number, scene)
 
-        for leader_id in leader_ids:
+        # The same threshold as `HeadlessGameState`, whether or not generals send to
+        # themselves. With 12 generals, it is 2.
+        threshold = protocol.max_traitors(len(self.generals))
+        for phase, leader_id in enumerate(leader_ids):
+            if (
+                stop_when_stable
+                and phase > 0
+                and protocol.is_stable(
+                    [None if g.is_traitor else g.opinion for g in self.generals],
+                    threshold,
+                )
+            ):
+                break
+
             highlight_line(0)
             scene.play(self.generals[leader_id].make_leader(self.generals))
 
@@ -1091,7 +1250,10 @@ class GameState(Group):
 
             if not self.generals[leader_id].is_traitor:
                 highlight_line(3)
-                new_opinion = self.generals[leader_id].update_opinion_to_majority(scene)
+                with self.profiler.step("update_opinion_to_majority", self.phase):
+                    new_opinion = self.generals[leader_id].update_opinion_to_majority(
+                        scene
+                    )
                 scene.add_sound(get_sound_effect("click", variant=0))
                 self.update_general_opinions(scene, [leader_id], [new_opinion])
 
@@ -1105,6 +1267,7 @@ class GameState(Group):
             self.move_all_receive_buffers_to_thinking_buffers(scene)
 
             if early_stop:
+                self.phase += 1
                 return
 
             highlight_line(5)
@@ -1119,12 +1282,125 @@ class GameState(Group):
                     )
                     scene.wait()
                 if not g.is_traitor and not g.is_leader():
-                    new_opinion = g.update_opinion_to_supermajority_or_leader(scene)
+                    with self.profiler.step(
+                        "update_opinion_to_supermajority_or_leader", self.phase
+                    ):
+                        new_opinion = g.update_opinion_to_supermajority_or_leader(
+                            scene, threshold
+                        )
                     scene.add_sound(get_sound_effect("click", variant=0))
                     self.update_general_opinions(scene, [i], [new_opinion])
 
+            self.phase += 1
+
+        self.set_output(scene)
+
+    def replay_algorithm(
+        self,
+        scene: Scene,
+        records: np.ndarray,
+        start_phase: int = 0,
+        end_phase: Optional[int] = None,
+        lag_ratio: float = 0.3,
+    ):
+        """
+        Animate a run recorded in a trace (see `trace.read_trace`) instead of running
+        the protocol. The trace can come from `HeadlessGameState`, so long runs can be
+        simulated once and only the interesting phases rendered.
+
+        Phases before `start_phase` are skipped: the generals jump straight to the
+        opinions they had at the start of `start_phase`.
+        """
+        for general_id, code in trace.final_decisions(
+            trace.phase_records(records, 0, start_phase)
+        ).items():
+            self.generals[general_id].change_opinion(opinion_matrix.OPINIONS[code])
+
+        if end_phase is None:
+            end_phase = int(records["phase"][-1]) + 1 if len(records) else 0
+
+        for phase in range(start_phase, end_phase):
+            phase_records = trace.phase_records(records, phase)
+            leader_records = phase_records[phase_records["flags"] & FLAG_LEADER != 0]
+            if len(leader_records):
+                scene.play(self.set_leader(int(leader_records["sender_id"][0])))
+
+            for run in trace.split_runs(phase_records):
+                if run["flags"][0] & FLAG_DECISION:
+                    self.replay_decisions(scene, run)
+                else:
+                    self.replay_messages(scene, run, lag_ratio=lag_ratio)
+
         self.set_output(scene)
 
+    def replay_messages(
+        self, scene: Scene, records: np.ndarray, lag_ratio: float = 0.3
+    ):
+        """Animate recorded messages that all have the same flags."""
+        # Nothing to animate where a traitor stayed silent
+        records = records[records["value"] != opinion_matrix.NO_MESSAGE]
+        if len(records) == 0:
+            return
+        is_leader = bool(records["flags"][0] & FLAG_LEADER)
+        msg_class = LeaderMessage if is_leader else Message
+        _, anims, to_remove = self.send_messages_bulk(
+            records["sender_id"],
+            records["receiver_id"],
+            records["value"],
+            msg_class=msg_class,
+            circular_receive=not is_leader,
+            circular_send=is_leader,
+        )
+
+        if is_leader:
+            scene.play(*anims)
+        else:
+            # Messages of one sender fly together, senders one after another
+            sender_anims = {}
+            for sender_id, anim in zip(records["sender_id"].tolist(), anims):
+                sender_anims.setdefault(sender_id, []).append(anim)
+            scene.play(
+                LaggedStart(
+                    *[AnimationGroup(*a) for a in sender_anims.values()],
+                    lag_ratio=lag_ratio,
+                )
+            )
+        scene.remove(*to_remove)
+        self.move_all_receive_buffers_to_thinking_buffers(scene)
+
+    def replay_decisions(self, scene: Scene, records: np.ndarray):
+        """Animate recorded changes of opinion."""
+        general_ids = [int(i) for i in records["sender_id"]]
+        new_opinions = []
+        anims = []
+        for general_id, value in zip(general_ids, records["value"]):
+            thinking_buffer = self.generals[general_id].thinking_buffer
+            new_opinion = Message(opinion_matrix.OPINIONS[value]).scale(4)
+            new_opinion.move_to(thinking_buffer.get_center())
+            anims.append(FadeIn(new_opinion))
+            anims += [FadeOut(msg) for msg in thinking_buffer.take_messages()]
+            new_opinions.append(new_opinion)
+
+        scene.play(*anims)
+        self.update_general_opinions(scene, general_ids, new_opinions)
+
+    def headless(self) -> protocol.HeadlessGameState:
+        """Return a copy of the current state that runs the protocol without Manim.
+
+        Useful to check what an animation will end up with before rendering it.
+        """
+        generals = []
+        for g in self.generals:
+            if isinstance(g, CyclicOpinionTraitor):
+                generals.append(
+                    protocol.HeadlessCyclicOpinionTraitor(g.opinions, g.opinion_idx)
+                )
+            elif g.is_traitor:
+                generals.append(protocol.HeadlessTraitor())
+            else:
+                generals.append(protocol.HeadlessPlayer(g.opinion))
+        return protocol.HeadlessGameState(generals)
+
     def set_opinions(self, scene: Scene, opinions: List[str]):
         lag_ratio = 0.05
         for i in range(len(self.generals)):
@@ -0,0 +1,241 @@
+"""Monte Carlo estimate of how often the full algorithm reaches agreement.
+
+The scenes only show a handful of hand-picked cases (`SAMPLE_OPINIONS4`,
+`TRAITOR_IDS4`, ...). This runs the headless full algorithm on random inputs, random
+traitor sets and random traitor strategies in a process pool and reports agreement and
+validity rates with confidence intervals.
+
+    python -m utils.monte_carlo --generals 12 --traitors 2 --trials 1000000
+
+With `--worst-case`, all traitors play `strategies.WorstCaseStrategy` instead. With
+`--stop-when-stable`, runs end as soon as the opinions are stable, and the report
+says how many phases and messages that saved.
+
+Trials are split into fixed-size chunks and every chunk gets its own RNG stream split
+off one seed. The workers share nothing but the final counts, and the results only
+depend on the seed, not on the number of workers.
+"""
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from . import protocol, strategies
+
+TRAITOR_STRATEGIES = ["cyclic", "always_yes", "always_no"]
+
+
+@dataclass
+class MonteCarloConfig:
+    n_generals: int = 12
+    n_traitors: int = 2
+    # Leaders of the phases. By default, one more phase than there are traitors, so
+    # that at least one leader is honest.
+    leader_ids: Optional[List[int]] = None
+    # How often all honest generals start with the same opinion, so that validity
+    # gets tested too. With uniformly random inputs this almost never happens.
+    unanimous_fraction: float = 0.25
+    # Longest opinion string of a random `CyclicOpinionTraitor`.
+    max_cycle_length: int = 12
+    vectorized: bool = False
+    # All traitors play `WorstCaseStrategy` instead of random strategies.
+    worst_case: bool = False
+    stop_when_stable: bool = False
+
+    def get_leader_ids(self) -> List[int]:
+        if self.leader_ids is not None:
+            return self.leader_ids
+        return list(range(self.n_traitors + 1))
+
+
+@dataclass
+class MonteCarloCounts:
+    trials: int = 0
+    agreements: int = 0
+    # Validity is only defined for trials where all honest generals start equal.
+    validity_trials: int = 0
+    valid: int = 0
+    phases: int = 0
+    phases_saved: int = 0
+    messages: int = 0
+    messages_saved: int = 0
+
+    def __add__(self, other: "MonteCarloCounts") -> "MonteCarloCounts":
+        return MonteCarloCounts(
+            self.trials + other.trials,
+            self.agreements + other.agreements,
+            self.validity_trials + other.validity_trials,
+            self.valid + other.valid,
+            self.phases + other.phases,
+            self.phases_saved + other.phases_saved,
+            self.messages + other.messages,
+            self.messages_saved + other.messages_saved,
+        )
+
+
+def wilson_interval(
+    successes: int, trials: int, z: float = 1.96
+) -> Tuple[float, float]:
+    """Wilson score interval for a binomial proportion (95% by default).
+
+    Unlike the normal approximation it behaves well for rates close to 0 or 1,
+    which is exactly where agreement rates end up.
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z**2 / trials
+    center = (p + z**2 / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2))
+    margin /= denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def random_game(
+    config: MonteCarloConfig, rng: np.random.Generator
+) -> Tuple[protocol.HeadlessGameState, List[str]]:
+    n = config.n_generals
+    if rng.random() < config.unanimous_fraction:
+        inputs = ["YN"[rng.integers(2)]] * n
+    else:
+        inputs = ["YN"[i] for i in rng.integers(2, size=n)]
+
+    traitor_ids = rng.choice(n, size=config.n_traitors, replace=False)
+    if config.worst_case:
+        generals = [protocol.HeadlessPlayer(o) for o in inputs]
+        # One strategy for all traitors, so that they share the joint plan of a round
+        strategy = strategies.WorstCaseStrategy()
+        for i in traitor_ids:
+            generals[i] = strategies.StrategyTraitor(strategy)
+        game = protocol.HeadlessGameState(generals, vectorized=config.vectorized)
+        return game, inputs
+
+    traitor_opinions = {}
+    for i in traitor_ids:
+        strategy = TRAITOR_STRATEGIES[rng.integers(len(TRAITOR_STRATEGIES))]
+        if strategy == "cyclic":
+            length = rng.integers(1, config.max_cycle_length + 1)
+            traitor_opinions[int(i)] = "".join(
+                "YN"[j] for j in rng.integers(2, size=length)
+            )
+        elif strategy == "always_yes":
+            traitor_opinions[int(i)] = "Y"
+        else:
+            traitor_opinions[int(i)] = "N"
+
+    game = protocol.HeadlessGameState.from_opinions(
+        inputs, traitor_opinions, vectorized=config.vectorized
+    )
+    return game, inputs
+
+
+def run_chunk(
+    config: MonteCarloConfig, n_trials: int, seed: np.random.SeedSequence
+) -> MonteCarloCounts:
+    rng = np.random.default_rng(seed)
+    leader_ids = config.get_leader_ids()
+    counts = MonteCarloCounts()
+
+    for _ in range(n_trials):
+        game, inputs = random_game(config, rng)
+        outputs = game.full_algorithm(
+            leader_ids, stop_when_stable=config.stop_when_stable
+        )
+
+        counts.trials += 1
+        counts.phases += len(leader_ids)
+        counts.phases_saved += game.phases_saved
+        counts.messages += game.messages_sent + game.messages_saved
+        counts.messages_saved += game.messages_saved
+        counts.agreements += protocol.is_agreement(outputs)
+        honest_inputs = {o for o, out in zip(inputs, outputs) if out is not None}
+        if len(honest_inputs) == 1:
+            counts.validity_trials += 1
+            counts.valid += protocol.is_valid(inputs, outputs)
+
+    return counts
+
+
+def run(
+    config: MonteCarloConfig,
+    n_trials: int,
+    seed: int = 0,
+    n_workers: Optional[int] = None,
+    chunk_size: int = 5_000,
+) -> MonteCarloCounts:
+    """Run `n_trials` random games split across a process pool."""
+    n_workers = n_workers or os.cpu_count() or 1
+    n_chunks = max(1, math.ceil(n_trials / chunk_size))
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    chunk_sizes = [min(chunk_size, n_trials - i * chunk_size) for i in range(n_chunks)]
+
+    total = MonteCarloCounts()
+    if n_workers == 1:
+        for size, chunk_seed in zip(chunk_sizes, seeds):
+            total += run_chunk(config, size, chunk_seed)
+        return total
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(run_chunk, config, size, chunk_seed)
+            for size, chunk_seed in zip(chunk_sizes, seeds)
+        ]
+        for future in futures:
+            total += future.result()
+    return total
+
+
+def format_report(counts: MonteCarloCounts) -> str:
+    lines = [f"Trials: {counts.trials}"]
+    for name, successes, trials in [
+        ("Agreement", counts.agreements, counts.trials),
+        ("Validity", counts.valid, counts.validity_trials),
+    ]:
+        low, high = wilson_interval(successes, trials)
+        rate = successes / trials if trials else float("nan")
+        lines.append(
+            f"{name}: {rate:.6f} ({successes}/{trials}), "
+            f"95% CI [{low:.6f}, {high:.6f}]"
+        )
+    if counts.phases_saved:
+        lines.append(
+            f"Phases saved: {counts.phases_saved}/{counts.phases} "
+            f"({counts.phases_saved / counts.phases:.1%}), messages saved: "
+            f"{counts.messages_saved}/{counts.messages} "
+            f"({counts.messages_saved / counts.messages:.1%})"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, default=12)
+    parser.add_argument("--traitors", type=int, default=2)
+    parser.add_argument("--trials", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unanimous-fraction", type=float, default=0.25)
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--worst-case", action="store_true")
+    parser.add_argument("--stop-when-stable", action="store_true")
+    args = parser.parse_args()
+
+    config = MonteCarloConfig(
+        n_generals=args.generals,
+        n_traitors=args.traitors,
+        unanimous_fraction=args.unanimous_fraction,
+        vectorized=args.vectorized,
+        worst_case=args.worst_case,
+        stop_when_stable=args.stop_when_stable,
+    )
+    counts = run(config, args.trials, seed=args.seed, n_workers=args.workers)
+    print(format_report(counts))
+
+
+if __name__ == "__main__":
+    main()
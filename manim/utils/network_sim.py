@@ -0,0 +1,448 @@
+"""Simulation of the full algorithm over a network with latency.
+
+`GameState.full_algorithm` delivers the messages of a round in lock-step; the only
+notion of time is the `lag_ratio` of the animation. Here every general runs as an
+asyncio coroutine and every message is delivered after a latency drawn from a
+configurable distribution. A general waits for the messages of a round until it has
+all of them or `round_timeout` expires, so the simulation shows how long decisions
+take and how the timeout should be sized:
+
+    python -m utils.network_sim --generals 12 --traitors 2 --instances 1000 \\
+        --latency lognormal --latency-ms 2 --jitter 0.5 --timeout-ms 50
+
+Many protocol instances run concurrently on one event loop. The loop's clock is
+simulated (see `VirtualClockLoop`): computing takes no time and the clock jumps to the
+next delivery or timeout, so the results don't depend on how fast the host is or how
+many instances run at once. The decision rules are the ones from `protocol.py`, and
+without timeouts the outputs are exactly those of `HeadlessGameState` for the same
+generals.
+"""
+
+import argparse
+import asyncio
+import selectors
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import monte_carlo, opinion_matrix, protocol
+
+
+@dataclass
+class ConstantLatency:
+    delay: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return np.full(size, self.delay)
+
+
+@dataclass
+class UniformLatency:
+    low: float
+    high: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.uniform(self.low, self.high, size)
+
+
+@dataclass
+class ExponentialLatency:
+    """A fixed propagation delay plus exponentially distributed queueing delay."""
+
+    base: float
+    mean_jitter: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return self.base + rng.exponential(self.mean_jitter, size)
+
+
+@dataclass
+class LogNormalLatency:
+    """Heavy-tailed latency, a common fit for datacenter RPCs."""
+
+    median: float
+    sigma: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.lognormal(np.log(self.median), self.sigma, size)
+
+
+@dataclass
+class NetworkConfig:
+    latency: object = field(default_factory=lambda: LogNormalLatency(0.002, 0.5))
+    # Latencies of specific (sender, receiver) links, overriding `latency`.
+    link_latencies: Dict[Tuple[int, int], object] = field(default_factory=dict)
+    # How long a general waits for the messages of one round.
+    round_timeout: float = 0.05
+    # Arrival times are rounded up to multiples of this, see `_DeliveryScheduler`.
+    resolution: float = 1e-4
+    send_to_self: bool = True
+
+
+@dataclass
+class InstanceResult:
+    outputs: List[Optional[str]]
+    # Simulated seconds from the start until each honest general decided, None for
+    # traitors.
+    decision_times: List[Optional[float]]
+    # How long each honest general waited for the messages of each round.
+    round_times: List[float] = field(default_factory=list)
+    messages_sent: int = 0
+    timeouts: int = 0
+    # Messages that arrived after their receiver stopped waiting for them.
+    late_messages: int = 0
+
+    @property
+    def time_to_decision(self) -> float:
+        return max(t for t in self.decision_times if t is not None)
+
+
+class _VirtualClockSelector(selectors.DefaultSelector):
+    """Instead of blocking until the next timer is due, moves the clock there."""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # Nothing is scheduled, so nothing could ever wake the loop up
+            raise RuntimeError("The simulation is stuck: nothing is scheduled")
+        self.now += timeout
+        return super().select(0)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """An event loop with a simulated clock, starting at 0.
+
+    Callbacks run in zero simulated time, and when none is ready the clock jumps to
+    the next timer. Latencies and timeouts are then exactly those drawn, however
+    long the simulation itself takes to compute.
+    """
+
+    def __init__(self):
+        self._clock = _VirtualClockSelector()
+        super().__init__(self._clock)
+
+    def time(self) -> float:
+        return self._clock.now
+
+
+def run_simulated(coroutine):
+    """Run `coroutine` to completion on a new `VirtualClockLoop`."""
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class _Mailbox:
+    """Incoming messages of one general, by (phase, round)."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.messages = defaultdict(list)
+        self.closed = set()
+        self.late_messages = 0
+        self.waiting_for = None
+        self.waiter: Optional[asyncio.Future] = None
+
+    def deliver(self, key: Tuple[int, int], sender_id: int, code: int):
+        if key in self.closed:
+            self.late_messages += 1
+            return
+        self.messages[key].append((sender_id, code))
+        if (
+            self.waiter is not None
+            and self.waiting_for == (key, len(self.messages[key]))
+            and not self.waiter.done()
+        ):
+            self.waiter.set_result(True)
+
+    async def collect(
+        self, key: Tuple[int, int], expected: int, timeout: float
+    ) -> Tuple[List[Tuple[int, int]], bool]:
+        """Wait until `expected` messages of the round arrived or the timeout
+        expired. Returns the messages and whether it timed out."""
+        timed_out = False
+        if len(self.messages[key]) < expected:
+            self.waiter = self.loop.create_future()
+            self.waiting_for = (key, expected)
+            handle = self.loop.call_later(
+                timeout, lambda w=self.waiter: w.done() or w.set_result(False)
+            )
+            timed_out = not await self.waiter
+            handle.cancel()
+            self.waiter = None
+        self.closed.add(key)
+        return self.messages.pop(key), timed_out
+
+
+class _DeliveryScheduler:
+    """Delivers messages at their arrival times, rounded up to `resolution`.
+
+    One timer per tick instead of one per message: with thousands of instances on
+    one loop, the timer heap is what limits throughput otherwise.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, resolution: float):
+        self.loop = loop
+        self.resolution = resolution
+        self.ticks = {}
+
+    def schedule(self, delays: np.ndarray, deliveries: List[Tuple]):
+        ticks = np.ceil((self.loop.time() + delays) / self.resolution).astype(np.int64)
+        for tick, delivery in zip(ticks.tolist(), deliveries):
+            batch = self.ticks.get(tick)
+            if batch is None:
+                batch = self.ticks[tick] = []
+                self.loop.call_at(tick * self.resolution, self._deliver, tick)
+            batch.append(delivery)
+
+    def _deliver(self, tick: int):
+        for mailbox, key, sender_id, code in self.ticks.pop(tick):
+            mailbox.deliver(key, sender_id, code)
+
+
+class NetworkInstance:
+    """One run of the full algorithm between the generals of a `HeadlessGameState`.
+
+    Traitors send what `HeadlessTraitor.send` tells them to; strategies that look at
+    the view see the opinions at the time they send, not the lock-step state.
+    """
+
+    def __init__(
+        self,
+        game: protocol.HeadlessGameState,
+        leader_ids: Sequence[int],
+        config: NetworkConfig,
+        rng: np.random.Generator,
+        scheduler: Optional[_DeliveryScheduler] = None,
+    ):
+        """Instances on the same loop may share a `scheduler`."""
+        self.game = game
+        self.scheduler = scheduler
+        self.generals = game.generals
+        self.n = len(self.generals)
+        self.leader_ids = list(leader_ids)
+        self.config = config
+        self.rng = rng
+        self.messages_sent = 0
+        self.timeouts = 0
+        self.round_times = []
+
+    def _send(
+        self,
+        sender_id: int,
+        receiver_ids: np.ndarray,
+        codes: np.ndarray,
+        key: Tuple[int, int],
+    ):
+        delays = self.config.latency.sample(self.rng, len(receiver_ids))
+        deliveries = []
+        for k, (receiver_id, code) in enumerate(
+            zip(receiver_ids.tolist(), codes.tolist())
+        ):
+            link_latency = self.config.link_latencies.get((sender_id, receiver_id))
+            if link_latency is not None:
+                delays[k] = link_latency.sample(self.rng, 1)[0]
+            if receiver_id == sender_id:
+                # Messages to self don't go over the network
+                delays[k] = 0
+            deliveries.append((self.mailboxes[receiver_id], key, sender_id, code))
+        self.scheduler.schedule(delays, deliveries)
+        self.messages_sent += len(receiver_ids)
+
+    def _messages_of(
+        self, general_id: int, receiver_ids: np.ndarray, phase: int, round: int
+    ) -> np.ndarray:
+        g = self.generals[general_id]
+        if not g.is_traitor:
+            code = opinion_matrix.encode_opinions(g.opinion)[0]
+            return np.full(len(receiver_ids), code, dtype=np.int8)
+
+        view = None
+        if g.uses_view:
+            self.game.phase = phase
+            view = self.game.view(
+                round, self.leader_ids[phase], self.config.send_to_self
+            )
+        return g.send(view, general_id, receiver_ids)
+
+    async def _collect(self, general_id: int, key: Tuple[int, int], expected: int):
+        round_start = self.loop.time()
+        messages, timed_out = await self.mailboxes[general_id].collect(
+            key, expected, self.config.round_timeout
+        )
+        self.timeouts += timed_out
+        if not self.generals[general_id].is_traitor:
+            self.round_times.append(self.loop.time() - round_start)
+
+        y_cnt = sum(code == opinion_matrix.CODE_Y for _, code in messages)
+        n_cnt = sum(code == opinion_matrix.CODE_N for _, code in messages)
+        return messages, y_cnt, n_cnt
+
+    async def _run_general(self, general_id: int) -> Optional[float]:
+        g = self.generals[general_id]
+        all_ids = np.arange(self.n)
+        others = np.delete(all_ids, general_id)
+        receiver_ids = all_ids if self.config.send_to_self else others
+
+        for phase, leader_id in enumerate(self.leader_ids):
+            key = (phase, protocol.ROUND_ALL_TO_ALL)
+            codes = self._messages_of(
+                general_id, receiver_ids, phase, protocol.ROUND_ALL_TO_ALL
+            )
+            self._send(general_id, receiver_ids, codes, key)
+            _, y_cnt, n_cnt = await self._collect(general_id, key, len(receiver_ids))
+
+            key = (phase, protocol.ROUND_LEADER)
+            if general_id == leader_id:
+                if not g.is_traitor:
+                    g.change_opinion(protocol.majority(y_cnt, n_cnt))
+                codes = self._messages_of(
+                    general_id, others, phase, protocol.ROUND_LEADER
+                )
+                self._send(general_id, others, codes, key)
+            elif not g.is_traitor:
+                leader_messages, _, _ = await self._collect(general_id, key, 1)
+                if leader_messages:
+                    leader_opinion = opinion_matrix.OPINIONS[leader_messages[0][1]]
+                else:
+                    # Without the leader's message, fall back to the local majority
+                    leader_opinion = protocol.majority(y_cnt, n_cnt)
+                g.change_opinion(
+                    protocol.supermajority_or_leader(
+                        y_cnt, n_cnt, leader_opinion, self.game.threshold
+                    )
+                )
+
+        if g.is_traitor:
+            return None
+        return self.loop.time() - self.start
+
+    async def run(self) -> InstanceResult:
+        self.loop = asyncio.get_running_loop()
+        if self.scheduler is None:
+            self.scheduler = _DeliveryScheduler(self.loop, self.config.resolution)
+        self.mailboxes = [_Mailbox(self.loop) for _ in range(self.n)]
+        self.start = self.loop.time()
+        decision_times = await asyncio.gather(
+            *[self._run_general(i) for i in range(self.n)]
+        )
+        return InstanceResult(
+            outputs=self.game.opinions(),
+            decision_times=list(decision_times),
+            round_times=self.round_times,
+            messages_sent=self.messages_sent,
+            timeouts=self.timeouts,
+            late_messages=sum(m.late_messages for m in self.mailboxes),
+        )
+
+
+async def simulate(
+    game_config: monte_carlo.MonteCarloConfig,
+    network_config: NetworkConfig,
+    n_instances: int,
+    seed: int = 0,
+    max_concurrent: Optional[int] = None,
+) -> List[InstanceResult]:
+    """Run `n_instances` random games (see `monte_carlo.random_game`) on one event
+    loop, at most `max_concurrent` at a time. Run it with `run_simulated`; on a
+    regular event loop, the time spent computing counts as latency."""
+    rng = np.random.default_rng(seed)
+    semaphore = asyncio.Semaphore(max_concurrent or n_instances)
+    scheduler = _DeliveryScheduler(
+        asyncio.get_running_loop(), network_config.resolution
+    )
+
+    async def run_one(game):
+        async with semaphore:
+            instance = NetworkInstance(
+                game, game_config.get_leader_ids(), network_config, rng, scheduler
+            )
+            return await instance.run()
+
+    games = [monte_carlo.random_game(game_config, rng)[0] for _ in range(n_instances)]
+    return await asyncio.gather(*[run_one(game) for game in games])
+
+
+def percentiles(values: Sequence[float], qs=(50, 90, 99)) -> Dict[int, float]:
+    if len(values) == 0:
+        return {q: float("nan") for q in qs}
+    return dict(zip(qs, np.percentile(values, qs)))
+
+
+def format_report(results: List[InstanceResult], wall_seconds: float) -> str:
+    def ms(p: Dict[int, float]) -> str:
+        return ", ".join(f"p{q} {v * 1000:.2f} ms" for q, v in p.items())
+
+    n = len(results)
+    agreements = sum(protocol.is_agreement(r.outputs) for r in results)
+    decision_times = [t for r in results for t in r.decision_times if t is not None]
+    lines = [
+        f"Instances: {n} in {wall_seconds:.2f} s ({n / wall_seconds:.1f}/s)",
+        f"Agreement: {agreements / n:.4f} ({agreements}/{n})",
+        f"Time to decision (instance): {ms(percentiles([r.time_to_decision for r in results]))}",
+        f"Time to decision (general): {ms(percentiles(decision_times))}",
+        f"Round wait: {ms(percentiles([t for r in results for t in r.round_times]))}",
+        f"Messages: {sum(r.messages_sent for r in results)}, "
+        f"timeouts: {sum(r.timeouts for r in results)}, "
+        f"late: {sum(r.late_messages for r in results)}",
+    ]
+    return "\n".join(lines)
+
+
+LATENCY_MODELS = {
+    "constant": lambda ms, jitter: ConstantLatency(ms / 1000),
+    "uniform": lambda ms, jitter: UniformLatency(
+        ms * (1 - jitter) / 1000, ms * (1 + jitter) / 1000
+    ),
+    "exponential": lambda ms, jitter: ExponentialLatency(ms / 1000, ms * jitter / 1000),
+    "lognormal": lambda ms, jitter: LogNormalLatency(ms / 1000, jitter),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--generals", type=int, default=12)
+    parser.add_argument("--traitors", type=int, default=2)
+    parser.add_argument("--instances", type=int, default=100)
+    parser.add_argument("--max-concurrent", type=int, default=100)
+    parser.add_argument("--latency", choices=list(LATENCY_MODELS), default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    # Relative spread for uniform/exponential, sigma for lognormal.
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--timeout-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worst-case", action="store_true")
+    args = parser.parse_args()
+
+    game_config = monte_carlo.MonteCarloConfig(
+        n_generals=args.generals,
+        n_traitors=args.traitors,
+        worst_case=args.worst_case,
+    )
+    network_config = NetworkConfig(
+        latency=LATENCY_MODELS[args.latency](args.latency_ms, args.jitter),
+        round_timeout=args.timeout_ms / 1000,
+    )
+    start = time.perf_counter()
+    results = run_simulated(
+        simulate(
+            game_config,
+            network_config,
+            args.instances,
+            seed=args.seed,
+            max_concurrent=args.max_concurrent,
+        )
+    )
+    print(format_report(results, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Vectorized counting of the messages sent in one phase.
+
+`MessageBuffer.count_regular_opinions` counts the messages of a single general, so a
+phase costs n^2 Python-level operations. Here the messages of a whole phase are kept
+in one sender x receiver matrix of message codes, and the tallies and decisions of all
+generals are computed with a few array reductions.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Message codes. NO_MESSAGE marks pairs that don't communicate, e.g. the diagonal when
+# generals don't send messages to themselves.
+NO_MESSAGE = -1
+CODE_N = 0
+CODE_Y = 1
+CODE_UNDECIDED = 2
+
+OPINIONS = {CODE_N: "N", CODE_Y: "Y", CODE_UNDECIDED: "-"}
+
+_ENCODING = np.full(256, NO_MESSAGE, dtype=np.int8)
+for _code, _opinion in OPINIONS.items():
+    _ENCODING[ord(_opinion)] = _code
+
+
+def encode_opinions(opinions: Sequence[Optional[str]]) -> np.ndarray:
+    """Convert "Y"/"N"/"-" (or a string of them) to message codes.
+
+    None becomes NO_MESSAGE.
+    """
+    if not isinstance(opinions, str):
+        opinions = "".join(" " if o is None else o for o in opinions)
+    return _ENCODING[np.frombuffer(opinions.encode("ascii"), dtype=np.uint8)]
+
+
+def decode_opinions(codes: np.ndarray) -> List[Optional[str]]:
+    return [OPINIONS.get(int(code)) for code in codes]
+
+
+def phase_matrix(
+    opinions: np.ndarray,
+    traitor_messages: Dict[int, np.ndarray],
+    send_to_self: bool = True,
+) -> np.ndarray:
+    """Build the sender x receiver matrix of an all-to-all phase.
+
+    Honest generals send their opinion (given as codes) to everybody, the rows of the
+    traitors are given by `traitor_messages` (general id -> codes of its messages).
+    """
+    n = len(opinions)
+    matrix = np.repeat(opinions.astype(np.int8)[:, None], n, axis=1)
+    for i, messages in traitor_messages.items():
+        matrix[i] = messages
+    if not send_to_self:
+        np.fill_diagonal(matrix, NO_MESSAGE)
+    return matrix
+
+
+def count_opinions(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the number of YES and NO messages received by every general."""
+    y_cnts = np.count_nonzero(matrix == CODE_Y, axis=0)
+    n_cnts = np.count_nonzero(matrix == CODE_N, axis=0)
+    return y_cnts, n_cnts
+
+
+def majority_decisions(y_cnts: np.ndarray, n_cnts: np.ndarray) -> np.ndarray:
+    """Vectorized `protocol.majority`."""
+    return np.where(y_cnts >= n_cnts, CODE_Y, CODE_N).astype(np.int8)
+
+
+def supermajority_decisions(
+    y_cnts: np.ndarray, n_cnts: np.ndarray, threshold: int
+) -> np.ndarray:
+    """Vectorized `protocol.supermajority`, NO_MESSAGE where there is none."""
+    return np.select(
+        [n_cnts <= threshold, y_cnts <= threshold],
+        [CODE_Y, CODE_N],
+        default=NO_MESSAGE,
+    ).astype(np.int8)
+
+
+def supermajority_or_leader_decisions(
+    y_cnts: np.ndarray, n_cnts: np.ndarray, leader_opinions: np.ndarray, threshold: int
+) -> np.ndarray:
+    """Vectorized `protocol.supermajority_or_leader`.
+
+    `leader_opinions` holds the code of the leader's message received by each general.
+    """
+    decisions = supermajority_decisions(y_cnts, n_cnts, threshold)
+    return np.where(decisions == NO_MESSAGE, leader_opinions, decisions).astype(np.int8)
@@ -0,0 +1,224 @@
+"""Opt-in profiling of the animated algorithms.
+
+Rendering a scene such as `FullSolutionWithCode` can take many minutes, and it isn't
+obvious whether the time goes to building the messages (`send_opinions_from`), moving
+them around (`move_all_receive_buffers_to_thinking_buffers`), the decision rules or
+`scene.play` itself. A `Profiler` measures every step of `GameState`'s algorithms and
+every `scene.play` call inside them, with wall-clock time and the memory allocated
+(with `tracemalloc`). Steps are keyed by the phase and the highlighted line of the
+code, and the report is in the folded format of flame graph tools:
+
+    full_algorithm;phase 1;line 5;update_opinion_to_supermajority_or_leader;scene.play 81234
+
+To profile a render without changing the scene, set the environment variable:
+
+    GENERALS_PROFILE=profile.folded manim -ql anims.py FullSolutionWithCode
+    flamegraph.pl profile.folded > profile.svg
+
+or pass `GameState(..., profiler=Profiler("profile.folded"))`. The report is written
+when the scene ends, to `profile.folded` (microseconds) and `profile.folded.alloc`
+(bytes allocated and not yet freed by the end of the step).
+
+By default `GameState` gets `NULL_PROFILER`, whose steps are a shared no-op context
+manager, so profiling costs next to nothing when it is off.
+"""
+
+import contextlib
+import functools
+import os
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+ENV_VARIABLE = "GENERALS_PROFILE"
+
+_NULL_STEP = contextlib.nullcontext()
+
+
+class NullProfiler:
+    """Profiler that does nothing."""
+
+    enabled = False
+
+    def step(self, name: str, phase: Optional[int] = None):
+        return _NULL_STEP
+
+    def set_line(self, line_number: Optional[int], phase: Optional[int] = None):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Frame:
+    def __init__(self, path: Tuple[str, ...], context, start: float, memory: int):
+        self.path = path
+        # (phase, highlighted line) when the step started
+        self.context = context
+        self.start = start
+        self.memory = memory
+        self.child_seconds = 0.0
+        self.child_bytes = 0
+
+
+class Profiler(NullProfiler):
+    enabled = True
+
+    def __init__(self, output: Optional[str] = None, allocations: bool = True):
+        """If `output` is given, the report is written there when the scene ends."""
+        self.output = output
+        self.allocations = allocations
+        self.phase: Optional[int] = None
+        self.line: Optional[int] = None
+        # Stack of steps -> [self seconds, self bytes, calls]
+        self.totals: Dict[Tuple[str, ...], List] = defaultdict(lambda: [0.0, 0, 0])
+        self._stack: List[_Frame] = []
+        self._started_tracing = False
+        self._scenes_reported = set()
+
+    def set_line(self, line_number: Optional[int], phase: Optional[int] = None):
+        """The highlighted line of the code, for the steps that follow."""
+        self.line = line_number
+        if phase is not None:
+            self.phase = phase
+
+    def _memory(self) -> int:
+        return tracemalloc.get_traced_memory()[0] if self.allocations else 0
+
+    @contextlib.contextmanager
+    def step(self, name: str, phase: Optional[int] = None):
+        """Measure the block as a step called `name`, nested in the current one."""
+        if phase is not None:
+            self.phase = phase
+        if not self._stack:
+            # A new algorithm starts without a highlighted line
+            self.line = None
+            path: Tuple[str, ...] = ()
+        else:
+            parent = self._stack[-1]
+            path = parent.path
+            if (self.phase, self.line) != parent.context:
+                path += (f"phase {self.phase}", f"line {self.line}")
+        if self.allocations and not tracemalloc.is_tracing():
+            # Tracing slows down every allocation, so only trace inside steps
+            tracemalloc.start()
+            self._started_tracing = True
+
+        frame = _Frame(
+            path + (name,), (self.phase, self.line), time.perf_counter(), self._memory()
+        )
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            seconds = time.perf_counter() - frame.start
+            allocated = self._memory() - frame.memory
+            total = self.totals[frame.path]
+            total[0] += seconds - frame.child_seconds
+            total[1] += allocated - frame.child_bytes
+            total[2] += 1
+            if self._stack:
+                self._stack[-1].child_seconds += seconds
+                self._stack[-1].child_bytes += allocated
+            elif self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    @contextlib.contextmanager
+    def patch_scene(self, scene):
+        """Measure every `scene.play` in the block as a step."""
+        play = scene.play
+        if getattr(play, "profiler", None) is self:
+            # Already patched by an enclosing step
+            yield
+            return
+
+        @functools.wraps(play)
+        def profiled_play(*args, **kwargs):
+            with self.step("scene.play"):
+                return play(*args, **kwargs)
+
+        profiled_play.profiler = self
+        scene.play = profiled_play
+        if self.output is not None:
+            self.write_at_end(scene, self.output)
+        try:
+            yield
+        finally:
+            del scene.play
+
+    def write_at_end(self, scene, path: str):
+        """Write the report when `scene` ends (after `Scene.tear_down`)."""
+        if id(scene) in self._scenes_reported:
+            return
+        self._scenes_reported.add(id(scene))
+        tear_down = scene.tear_down
+
+        @functools.wraps(tear_down)
+        def tear_down_and_report(*args, **kwargs):
+            tear_down(*args, **kwargs)
+            self.write(path)
+
+        scene.tear_down = tear_down_and_report
+
+    def folded(self, metric: str = "seconds") -> str:
+        """The report in folded format: microseconds, or bytes for "bytes"."""
+        lines = []
+        for path, (seconds, allocated, _) in sorted(self.totals.items()):
+            value = round(seconds * 1e6) if metric == "seconds" else allocated
+            # Flame graphs can't show negative self values (memory freed by a step
+            # that its children allocated)
+            lines.append(f"{';'.join(path)} {max(0, value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.folded("seconds"))
+        if self.allocations:
+            with open(path + ".alloc", "w") as f:
+                f.write(self.folded("bytes"))
+
+    def summary(self, top: int = 10) -> str:
+        """The steps with the most time in themselves, not counting their children."""
+        rows = sorted(self.totals.items(), key=lambda item: -item[1][0])[:top]
+        return "\n".join(
+            f"{seconds:9.3f} s {allocated / 1024:10.0f} KiB {calls:6d}x  "
+            f"{';'.join(path)}"
+            for path, (seconds, allocated, calls) in rows
+        )
+
+
+_environment_profiler: Optional[Profiler] = None
+
+
+def from_environment() -> NullProfiler:
+    """A profiler writing to $GENERALS_PROFILE if it is set, shared by all
+    `GameState`s, or else `NULL_PROFILER`."""
+    global _environment_profiler
+    output = os.environ.get(ENV_VARIABLE)
+    if not output:
+        return NULL_PROFILER
+    if _environment_profiler is None or _environment_profiler.output != output:
+        _environment_profiler = Profiler(output)
+    return _environment_profiler
+
+
+def profiled(method):
+    """Measure a `GameState` method as a step of `self.profiler`. If its first
+    argument is a scene, its `scene.play` calls are measured as well."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if not profiler.enabled:
+            return method(self, *args, **kwargs)
+        scene = args[0] if args and hasattr(args[0], "play") else None
+        with profiler.step(method.__name__, self.phase):
+            if scene is None:
+                return method(self, *args, **kwargs)
+            with profiler.patch_scene(scene):
+                return method(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,611 @@
+"""Headless version of the protocols animated in `generals.py`.
+
+`GameState.leader_algorithm`, `local_algorithm` and `full_algorithm` compute the
+protocol while building the animations, so a single run takes minutes of rendering.
+`HeadlessGameState` runs exactly the same phases on plain data instead: no Manim
+objects, no `scene.play`, no sound effects. This module must not import Manim so that
+simulations can run without it.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import opinion_matrix
+from .trace import FLAG_LEADER, TraceWriter
+
+YES = "Y"
+NO = "N"
+UNDECIDED = "-"
+
+# The two rounds of a phase of the full algorithm: everybody sends to everybody, then
+# the leader broadcasts.
+ROUND_ALL_TO_ALL = 0
+ROUND_LEADER = 1
+
+
+def max_traitors(n_messages: int) -> int:
+    """How many dissenting messages still count as a supermajority.
+
+    The full algorithm works for fewer than n/4 traitors, so with n=12 generals a
+    general keeps its local opinion if at most 2 messages disagree with it.
+    """
+    return (n_messages - 1) // 4
+
+
+def majority(y_cnt: int, n_cnt: int) -> str:
+    """The decision rule of the leader-based and local algorithms."""
+    return YES if y_cnt >= n_cnt else NO
+
+
+def supermajority(y_cnt: int, n_cnt: int, threshold: int) -> Optional[str]:
+    """Return the opinion of a supermajority, or None if there is none.
+
+    There is a supermajority if at most `threshold` messages disagree with it.
+    """
+    if n_cnt <= threshold:
+        return YES
+    elif y_cnt <= threshold:
+        return NO
+    else:
+        return None
+
+
+def supermajority_or_leader(
+    y_cnt: int, n_cnt: int, leader_opinion: str, threshold: int
+) -> str:
+    """The decision rule of the full algorithm, see `CodeWithStepping.CODE`."""
+    return supermajority(y_cnt, n_cnt, threshold) or leader_opinion
+
+
+def is_agreement(opinions: Sequence[Optional[str]]) -> bool:
+    """Whether all honest generals (those with opinion other than None) agree."""
+    return len({o for o in opinions if o is not None}) <= 1
+
+
+def is_stable(opinions: Sequence[Optional[str]], threshold: int) -> bool:
+    """Whether no further phase of the full algorithm can change any opinion.
+
+    If all honest generals (opinion other than None) hold the same opinion and there
+    are at most `threshold` traitors, every honest general receives at most
+    `threshold` dissenting messages, so it keeps its opinion by the supermajority
+    rule, and an honest leader keeps it by majority.
+    """
+    honest = {o for o in opinions if o is not None}
+    n_traitors = sum(o is None for o in opinions)
+    return len(honest) == 1 and UNDECIDED not in honest and n_traitors <= threshold
+
+
+def is_valid(inputs: Sequence[Optional[str]], outputs: Sequence[Optional[str]]) -> bool:
+    """If all honest generals started with the same opinion, they must keep it."""
+    honest_inputs = {o for o, out in zip(inputs, outputs) if out is not None}
+    if len(honest_inputs) != 1:
+        return True
+    return {o for o in outputs if o is not None} <= honest_inputs
+
+
+@dataclass
+class PhaseView:
+    """Everything a traitor may base its messages on in one round of a phase.
+
+    Engines build one view per round and pass it to every traitor (see
+    `HeadlessTraitor.send`), so strategies can be pure functions of the view, the
+    sender and the receiver.
+    """
+
+    phase: int
+    round: int
+    leader_id: Optional[int]
+    # Message codes of the opinions of all generals when the round starts,
+    # `opinion_matrix.NO_MESSAGE` for the traitors.
+    opinions: np.ndarray
+    traitor_ids: Tuple[int, ...]
+    threshold: int
+    send_to_self: bool
+    # In ROUND_ALL_TO_ALL, the YES and NO messages each general gets from the honest
+    # generals in this round. In ROUND_LEADER, everything each general got in the
+    # all-to-all round of this phase, if there was one.
+    y_cnts: Optional[np.ndarray] = None
+    n_cnts: Optional[np.ndarray] = None
+
+    @property
+    def n(self) -> int:
+        return len(self.opinions)
+
+    @classmethod
+    def from_opinions(
+        cls,
+        phase: int,
+        round: int,
+        leader_id: Optional[int],
+        opinions: np.ndarray,
+        threshold: int,
+        send_to_self: bool = True,
+        y_cnts: Optional[np.ndarray] = None,
+        n_cnts: Optional[np.ndarray] = None,
+    ) -> "PhaseView":
+        """Build a view from the opinion codes. For ROUND_ALL_TO_ALL, the honest
+        tallies are computed unless given."""
+        if round == ROUND_ALL_TO_ALL and y_cnts is None:
+            is_y = opinions == opinion_matrix.CODE_Y
+            is_n = opinions == opinion_matrix.CODE_N
+            y_cnts = np.full(len(opinions), np.count_nonzero(is_y))
+            n_cnts = np.full(len(opinions), np.count_nonzero(is_n))
+            if not send_to_self:
+                y_cnts -= is_y
+                n_cnts -= is_n
+        traitor_ids = tuple(
+            int(i) for i in np.flatnonzero(opinions == opinion_matrix.NO_MESSAGE)
+        )
+        return cls(
+            phase,
+            round,
+            leader_id,
+            opinions,
+            traitor_ids,
+            threshold,
+            send_to_self,
+            y_cnts,
+            n_cnts,
+        )
+
+
+class HeadlessPlayer:
+    """Data-only counterpart of `Player`."""
+
+    is_traitor = False
+
+    def __init__(self, opinion: str = UNDECIDED):
+        self.opinion = opinion
+
+    def change_opinion(self, opinion: str):
+        self.opinion = opinion
+
+
+class HeadlessTraitor:
+    """Data-only counterpart of `Traitor`.
+
+    Like `Traitor`, it ignores opinion changes. Subclasses decide what it sends.
+    """
+
+    is_traitor = True
+    # Whether `send` looks at the view. If no traitor does, engines skip building it.
+    uses_view = False
+
+    @property
+    def opinion(self) -> str:
+        raise NotImplementedError("A plain traitor has no opinion to send")
+
+    def change_opinion(self, opinion: str):
+        pass
+
+    def read_opinions(self, count: int) -> str:
+        """The opinions sent in the next `count` messages, in order."""
+        return "".join(self.opinion for _ in range(count))
+
+    def send(
+        self, view: PhaseView, sender_id: int, receiver_ids: np.ndarray
+    ) -> np.ndarray:
+        """Message codes the traitor sends to `receiver_ids`, in this order.
+
+        Engines only ask for messages through this method. By default it reads the
+        next `len(receiver_ids)` opinions, so cyclic traitors send the same as in
+        `GameState`, and `view` may be None. Strategies that look at the view
+        override it and set `uses_view` (see `strategies.py`).
+        """
+        return opinion_matrix.encode_opinions(self.read_opinions(len(receiver_ids)))
+
+
+class HeadlessCyclicOpinionTraitor(HeadlessTraitor):
+    """Data-only counterpart of `CyclicOpinionTraitor`.
+
+    The messages are read in the same order as in `GameState`, so a headless run
+    reproduces the animated one exactly.
+    """
+
+    def __init__(self, opinions: str, opinion_idx: int = 0):
+        self.opinions = opinions
+        self.opinion_idx = opinion_idx
+
+    @property
+    def opinion(self) -> str:
+        """
+        Traitors opinion is cyclic and changes every time it is accessed.
+        """
+        ret = self.opinions[self.opinion_idx]
+        self.opinion_idx = (self.opinion_idx + 1) % len(self.opinions)
+        return ret
+
+    def read_opinions(self, count: int) -> str:
+        # Same as reading `opinion` `count` times, but without the Python loop.
+        cycles = (self.opinion_idx + count) // len(self.opinions) + 1
+        ret = (self.opinions * cycles)[self.opinion_idx : self.opinion_idx + count]
+        self.opinion_idx = (self.opinion_idx + count) % len(self.opinions)
+        return ret
+
+
+class HeadlessGameState:
+    def __init__(
+        self,
+        generals: List,
+        threshold: Optional[int] = None,
+        vectorized: bool = False,
+        trace: Optional[TraceWriter] = None,
+        dissemination=None,
+    ):
+        """
+        `threshold` is the supermajority threshold of the full algorithm. By default
+        it is derived from the number of generals, which gives 2 for n=12.
+
+        If `vectorized` is set, the messages of each phase are counted with NumPy
+        (see `opinion_matrix.py`), which pays off for hundreds of generals and more.
+
+        If `trace` is given, every message sent is recorded in it (see `trace.py`).
+
+        `dissemination` replaces the all-to-all messages by something that only
+        delivers the counts, such as `aggregation.SignedAggregation`. Its messages
+        are not traced.
+        """
+        self.generals = generals
+        self.threshold = (
+            threshold if threshold is not None else max_traitors(len(generals))
+        )
+        self.vectorized = vectorized
+        self.trace = trace
+        self.dissemination = dissemination
+        # Incremented after every leader in `full_algorithm`, and after every run of
+        # `leader_algorithm` and `local_algorithm`.
+        self.phase = 0
+        self.messages_sent = 0
+        # Set by `full_algorithm(stop_when_stable=True)`.
+        self.phases_saved = 0
+        self.messages_saved = 0
+        self._general_ids = np.arange(len(generals))
+
+    @classmethod
+    def from_opinions(
+        cls,
+        opinions: Sequence[str],
+        traitor_opinions: Optional[Dict[int, str]] = None,
+        threshold: Optional[int] = None,
+        vectorized: bool = False,
+        trace: Optional[TraceWriter] = None,
+        dissemination=None,
+    ) -> "HeadlessGameState":
+        """Honest generals with the given opinions, except for the cyclic traitors
+        in `traitor_opinions` (general id -> opinions of the traitor)."""
+        traitor_opinions = traitor_opinions or {}
+        generals = [
+            (
+                HeadlessCyclicOpinionTraitor(traitor_opinions[i])
+                if i in traitor_opinions
+                else HeadlessPlayer(opinion)
+            )
+            for i, opinion in enumerate(opinions)
+        ]
+        return cls(
+            generals,
+            threshold=threshold,
+            vectorized=vectorized,
+            trace=trace,
+            dissemination=dissemination,
+        )
+
+    def opinions(self) -> List[Optional[str]]:
+        """Opinions of the honest generals, None for the traitors."""
+        return [None if g.is_traitor else g.opinion for g in self.generals]
+
+    def view(
+        self,
+        round: int,
+        leader_id: Optional[int] = None,
+        send_to_self: bool = True,
+        y_cnts: Optional[np.ndarray] = None,
+        n_cnts: Optional[np.ndarray] = None,
+    ) -> PhaseView:
+        """What the traitors get to see in the given round of the current phase."""
+        return PhaseView.from_opinions(
+            self.phase,
+            round,
+            leader_id,
+            opinion_matrix.encode_opinions(self.opinions()),
+            self.threshold,
+            send_to_self,
+            y_cnts,
+            n_cnts,
+        )
+
+    def _traitors_use_view(self) -> bool:
+        return any(g.is_traitor and g.uses_view for g in self.generals)
+
+    def _receiver_ids(self, sender_id: int, send_to_self: bool) -> np.ndarray:
+        if send_to_self:
+            return self._general_ids
+        ids = self._general_ids
+        return np.concatenate((ids[:sender_id], ids[sender_id + 1 :]))
+
+    def send_opinions_to_everybody(
+        self, send_to_self: bool = True, leader_id: Optional[int] = None
+    ) -> Tuple[List[int], List[int]]:
+        """Every general sends its opinion to everybody, as in `send_opinions_from`.
+
+        Returns the number of YES and NO messages each general received. Honest
+        generals send the same message to everybody, so they are only counted once.
+        `leader_id` is the leader of the phase, if any; the traitors may use it.
+        """
+        view = None
+        if self._traitors_use_view():
+            view = self.view(ROUND_ALL_TO_ALL, leader_id, send_to_self)
+
+        if self.dissemination is not None:
+            return self.dissemination.tallies(self, view, send_to_self)
+        if self.vectorized or self.trace is not None:
+            return self._count_with_matrix(send_to_self, view)
+
+        n = len(self.generals)
+        honest_y, honest_n = 0, 0
+        for g in self.generals:
+            if not g.is_traitor:
+                if g.opinion == YES:
+                    honest_y += 1
+                elif g.opinion == NO:
+                    honest_n += 1
+
+        y_cnts = [honest_y] * n
+        n_cnts = [honest_n] * n
+
+        for i, g in enumerate(self.generals):
+            if g.is_traitor:
+                receiver_ids = self._receiver_ids(i, send_to_self)
+                codes = g.send(view, i, receiver_ids)
+                for j, code in zip(receiver_ids.tolist(), codes.tolist()):
+                    if code == opinion_matrix.CODE_Y:
+                        y_cnts[j] += 1
+                    elif code == opinion_matrix.CODE_N:
+                        n_cnts[j] += 1
+            elif not send_to_self:
+                # Undo counting the general's own opinion
+                if g.opinion == YES:
+                    y_cnts[i] -= 1
+                elif g.opinion == NO:
+                    n_cnts[i] -= 1
+
+        self.messages_sent += n * n if send_to_self else n * (n - 1)
+        return y_cnts, n_cnts
+
+    def _count_with_matrix(self, send_to_self: bool, view: Optional[PhaseView]):
+        n = len(self.generals)
+        opinions = opinion_matrix.encode_opinions(
+            [UNDECIDED if g.is_traitor else g.opinion for g in self.generals]
+        )
+        traitor_messages = {}
+        for i, g in enumerate(self.generals):
+            if g.is_traitor:
+                # The traitor skips itself unless `send_to_self`, like in
+                # `send_opinions_from`
+                receiver_ids = self._receiver_ids(i, send_to_self)
+                messages = np.full(n, opinion_matrix.NO_MESSAGE, dtype=np.int8)
+                messages[receiver_ids] = g.send(view, i, receiver_ids)
+                traitor_messages[i] = messages
+
+        matrix = opinion_matrix.phase_matrix(opinions, traitor_messages, send_to_self)
+        if self.trace is not None:
+            self.trace.write_matrix(self.phase, matrix)
+        self.messages_sent += n * n if send_to_self else n * (n - 1)
+        return opinion_matrix.count_opinions(matrix)
+
+    def _change_opinions(self, general_ids: List[int], codes) -> None:
+        for i in general_ids:
+            self.generals[i].change_opinion(opinion_matrix.OPINIONS[int(codes[i])])
+
+    def _record_decisions(self, general_ids: List[int]):
+        if self.trace is not None and general_ids:
+            self.trace.write_decisions(
+                self.phase,
+                np.array(general_ids),
+                opinion_matrix.encode_opinions(
+                    [self.generals[i].opinion for i in general_ids]
+                ),
+            )
+
+    def broadcast_opinion(
+        self, general_id: int, view: Optional[PhaseView] = None
+    ) -> List[Optional[str]]:
+        """The general sends its opinion to everybody else, as in `broadcast_opinion`.
+
+        Returns the message received by each general, None for the sender itself and
+        for those a traitor doesn't send anything to.
+        `view` is what a traitor gets to see, by default just the current opinions.
+        """
+        sender = self.generals[general_id]
+        if sender.is_traitor:
+            if view is None and sender.uses_view:
+                view = self.view(ROUND_LEADER, general_id)
+            receiver_ids = self._receiver_ids(general_id, send_to_self=False)
+            messages = [None] * len(self.generals)
+            for i, code in zip(
+                receiver_ids.tolist(), sender.send(view, general_id, receiver_ids)
+            ):
+                messages[i] = opinion_matrix.OPINIONS.get(int(code))
+        else:
+            messages = [
+                sender.opinion if i != general_id else None
+                for i in range(len(self.generals))
+            ]
+        self.messages_sent += len(self.generals) - 1
+
+        if self.trace is not None:
+            receiver_ids = np.array(
+                [i for i in range(len(self.generals)) if i != general_id]
+            )
+            codes = opinion_matrix.encode_opinions(messages)[receiver_ids]
+            self.trace.write_messages(
+                self.phase, general_id, receiver_ids, codes, flags=FLAG_LEADER
+            )
+        return messages
+
+    def leader_algorithm(
+        self, leader_id: int, send_to_self: bool = True
+    ) -> List[Optional[str]]:
+        """Headless `GameState.leader_algorithm`. Returns the new opinions."""
+        leader = self.generals[leader_id]
+        view = None
+        if self._traitors_use_view():
+            view = self.view(ROUND_ALL_TO_ALL, leader_id, send_to_self)
+        y_cnt, n_cnt = 0, 0
+        sender_ids, sent = [], []
+        for i, g in enumerate(self.generals):
+            if i == leader_id and not send_to_self:
+                continue
+            if g.is_traitor:
+                code = g.send(view, i, np.array([leader_id]))[0]
+                opinion = opinion_matrix.OPINIONS.get(int(code))
+            else:
+                opinion = g.opinion
+            if opinion == YES:
+                y_cnt += 1
+            elif opinion == NO:
+                n_cnt += 1
+            sender_ids.append(i)
+            sent.append(opinion)
+            self.messages_sent += 1
+
+        if self.trace is not None:
+            self.trace.write_messages(
+                self.phase,
+                np.array(sender_ids),
+                leader_id,
+                opinion_matrix.encode_opinions(sent),
+            )
+
+        if not leader.is_traitor:
+            leader.change_opinion(majority(y_cnt, n_cnt))
+            self._record_decisions([leader_id])
+
+        # Whether it's a traitor or not, the leader broadcasts the decision
+        for i, opinion in enumerate(self.broadcast_opinion(leader_id)):
+            if i != leader_id:
+                self.generals[i].change_opinion(opinion)
+        self._record_decisions(
+            [
+                i
+                for i, g in enumerate(self.generals)
+                if not g.is_traitor and i != leader_id
+            ]
+        )
+
+        self.phase += 1
+        return self.opinions()
+
+    def local_algorithm(self, send_to_self: bool = True) -> List[Optional[str]]:
+        """Headless `GameState.local_algorithm`. Returns the new opinions."""
+        y_cnts, n_cnts = self.send_opinions_to_everybody(send_to_self)
+        honest_ids = [i for i, g in enumerate(self.generals) if not g.is_traitor]
+        if self.vectorized:
+            decisions = opinion_matrix.majority_decisions(y_cnts, n_cnts)
+            self._change_opinions(honest_ids, decisions)
+        else:
+            for i in honest_ids:
+                self.generals[i].change_opinion(majority(y_cnts[i], n_cnts[i]))
+        self._record_decisions(honest_ids)
+
+        self.phase += 1
+        return self.opinions()
+
+    def full_algorithm(
+        self,
+        leader_ids: List[int],
+        send_to_self: bool = True,
+        early_stop: bool = False,
+        stop_when_stable: bool = False,
+    ) -> List[Optional[str]]:
+        """Headless `GameState.full_algorithm`. Returns the new opinions.
+
+        `early_stop` is the animation shortcut of `GameState.full_algorithm`. With
+        `stop_when_stable`, the remaining phases are skipped as soon as a phase
+        ends with the opinions stable (see `is_stable`), which doesn't change the
+        outputs; `phases_saved` and `messages_saved` say what it saved.
+        """
+        for _ in self.rounds(leader_ids, send_to_self, early_stop, stop_when_stable):
+            pass
+        return self.opinions()
+
+    def rounds(
+        self,
+        leader_ids: List[int],
+        send_to_self: bool = True,
+        early_stop: bool = False,
+        stop_when_stable: bool = False,
+    ) -> Iterator[Tuple[int, int]]:
+        """Run `full_algorithm` one round at a time.
+
+        Yields (round, leader id) after every round, so that several runs can be
+        interleaved (see `pipeline.py`).
+        """
+        n = len(self.generals)
+        if self.dissemination is not None:
+            messages_per_phase = self.dissemination.messages_per_phase(n) + n - 1
+        else:
+            messages_per_phase = (n * n if send_to_self else n * (n - 1)) + n - 1
+        for phase, leader_id in enumerate(leader_ids):
+            # Stability is only checked after a phase: a general only learns that
+            # the others agree from the messages of a phase.
+            if (
+                stop_when_stable
+                and phase > 0
+                and is_stable(self.opinions(), self.threshold)
+            ):
+                self.phases_saved += len(leader_ids) - phase
+                self.messages_saved += (len(leader_ids) - phase) * messages_per_phase
+                return
+
+            y_cnts, n_cnts = self.send_opinions_to_everybody(send_to_self, leader_id)
+
+            leader = self.generals[leader_id]
+            if not leader.is_traitor:
+                leader.change_opinion(majority(y_cnts[leader_id], n_cnts[leader_id]))
+                self._record_decisions([leader_id])
+            yield ROUND_ALL_TO_ALL, leader_id
+
+            # Whether it's a traitor or not, the leader broadcasts its updated opinion
+            view = None
+            if leader.is_traitor and leader.uses_view:
+                view = self.view(
+                    ROUND_LEADER,
+                    leader_id,
+                    send_to_self,
+                    np.asarray(y_cnts),
+                    np.asarray(n_cnts),
+                )
+            leader_opinions = self.broadcast_opinion(leader_id, view)
+
+            if early_stop:
+                self.phase += 1
+                yield ROUND_LEADER, leader_id
+                return
+
+            follower_ids = [
+                i
+                for i, g in enumerate(self.generals)
+                if not g.is_traitor and i != leader_id
+            ]
+            if self.vectorized:
+                decisions = opinion_matrix.supermajority_or_leader_decisions(
+                    y_cnts,
+                    n_cnts,
+                    opinion_matrix.encode_opinions(leader_opinions),
+                    self.threshold,
+                )
+                self._change_opinions(follower_ids, decisions)
+            else:
+                for i in follower_ids:
+                    self.generals[i].change_opinion(
+                        supermajority_or_leader(
+                            y_cnts[i], n_cnts[i], leader_opinions[i], self.threshold
+                        )
+                    )
+            self._record_decisions(follower_ids)
+
+            self.phase += 1
+            yield ROUND_LEADER, leader_id
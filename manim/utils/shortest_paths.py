@@ -0,0 +1,232 @@
+"""Shortest paths on CSR arrays, the computation behind `CustomGraph.run_dijkstra`.
+
+`run_dijkstra` used to run Dijkstra (A* with potentials) with `queue.PriorityQueue`,
+which takes a lock on every put and get, and read the weights and potentials from
+`ValueTracker`s inside the loop. Here the graph is a snapshot: the CSR arrays of
+`CustomGraph.adjacency_csr()` and NumPy arrays of the weights and potentials, and
+`run_dijkstra` only builds the animations from the result.
+
+`dijkstra` with the default method "heap" gives exactly what the old loop gave: the
+length of an edge u -> v is weights + potentials[v] - potentials[u], added in that
+order, and ties are broken the same way, by (distance, vertex, predecessor), with
+`rank` giving the order of the vertices. The method "scipy" runs
+`scipy.sparse.csgraph.dijkstra`, which is much faster on large graphs, but needs
+nonnegative lengths, may round the distances differently and may pick other
+predecessors among paths of the same length.
+
+`Landmarks` gives A* potentials for `run_dijkstra` (ALT): distances from and to a few
+landmark vertices are computed once, and by the triangle inequality
+d(landmark, t) - d(landmark, v) and d(v, landmark) - d(t, landmark) are lower bounds
+on d(v, t). The largest of them is an admissible and consistent potential for the
+target t, and Dijkstra with it settles few vertices outside of the shortest path if it
+stops at t (`run_dijkstra(..., stop_at_end=True)`). Vertices that can't reach t get
+the largest potential of the others, which keeps every reduced length nonnegative.
+"""
+
+import heapq
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+
+
+@dataclass
+class ShortestPathTree:
+    # inf for the vertices that can't be reached
+    distances: np.ndarray
+    # -1 for the source and the vertices that can't be reached
+    predecessors: np.ndarray
+    # The reachable vertices, in the order in which their distance was settled
+    order: np.ndarray
+
+
+def reduced_weights(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    potentials: Optional[np.ndarray],
+) -> np.ndarray:
+    """weights + potentials[v] - potentials[u] of every edge u -> v."""
+    weights = np.asarray(weights, dtype=float)
+    if potentials is None:
+        return weights
+    sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return weights + potentials[indices] - potentials[sources]
+
+
+def dijkstra(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    source: int,
+    potentials: Optional[np.ndarray] = None,
+    rank: Optional[np.ndarray] = None,
+    method: str = "heap",
+    target: Optional[int] = None,
+) -> ShortestPathTree:
+    """Distances from `source` over the edges `u -> indices[k]` for k in
+    `indptr[u]:indptr[u + 1]`, of length `weights[k]` shifted by the potentials.
+
+    Ties between queue entries of the same distance go to the lower `rank` of the
+    vertex and then of the predecessor (by default the vertex index itself). With a
+    `target`, the heap method stops once it has settled every vertex at most as far
+    as the target, in the same order as without it.
+    """
+    if method == "scipy":
+        return _dijkstra_scipy(indptr, indices, weights, source, potentials)
+    if method != "heap":
+        raise ValueError(f"Unknown method {method!r}")
+
+    n = len(indptr) - 1
+    indptr = np.asarray(indptr).tolist()
+    indices = np.asarray(indices).tolist()
+    weights = np.asarray(weights, dtype=float).tolist()
+    pots = (
+        np.asarray(potentials, dtype=float).tolist() if potentials is not None else None
+    )
+    keys = np.asarray(rank).tolist() if rank is not None else list(range(n))
+
+    distances = [np.inf] * n
+    predecessors = [-1] * n
+    settled = [False] * n
+    order = []
+    # (distance, rank, predecessor's rank, vertex, predecessor). Ranks are distinct,
+    # so the vertices themselves are never compared.
+    queue = [(0.0, keys[source], -1, source, -1)]
+    target_dist = np.inf
+    while queue:
+        dist, _, _, node, pred = heapq.heappop(queue)
+        if dist > target_dist:
+            break
+        if settled[node]:
+            continue
+        settled[node] = True
+        distances[node] = dist
+        predecessors[node] = pred
+        order.append(node)
+        if node == target:
+            target_dist = dist
+        for k in range(indptr[node], indptr[node + 1]):
+            neighbor = indices[k]
+            if settled[neighbor]:
+                continue
+            if pots is None:
+                new_dist = dist + weights[k]
+            else:
+                new_dist = dist + weights[k] + pots[neighbor] - pots[node]
+            heapq.heappush(
+                queue, (new_dist, keys[neighbor], keys[node], neighbor, node)
+            )
+
+    return ShortestPathTree(
+        np.array(distances), np.array(predecessors), np.array(order, dtype=np.int64)
+    )
+
+
+def _dijkstra_scipy(indptr, indices, weights, source, potentials):
+    n = len(indptr) - 1
+    lengths = reduced_weights(indptr, indices, weights, potentials)
+    if (lengths < 0).any():
+        raise ValueError("The scipy method needs nonnegative edge lengths")
+    # csr_matrix would add up parallel edges; keep the shortest one instead
+    sources = np.repeat(np.arange(n), np.diff(indptr))
+    by_edge = np.lexsort((lengths, indices, sources))
+    sources, targets, lengths = sources[by_edge], indices[by_edge], lengths[by_edge]
+    first = np.ones(len(sources), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    graph = csr_matrix((lengths[first], (sources[first], targets[first])), shape=(n, n))
+    distances, predecessors = csgraph_dijkstra(
+        graph, indices=source, return_predecessors=True
+    )
+    predecessors[predecessors < 0] = -1
+    reachable = np.flatnonzero(np.isfinite(distances))
+    order = reachable[np.argsort(distances[reachable], kind="stable")]
+    return ShortestPathTree(distances, predecessors.astype(np.int64), order)
+
+
+def reverse_csr(indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray):
+    """The CSR arrays of the graph with all edges reversed."""
+    n = len(indptr) - 1
+    sources = np.repeat(np.arange(n), np.diff(indptr))
+    by_target = np.argsort(indices, kind="stable")
+    reversed_indptr = np.zeros(n + 1, dtype=np.int64)
+    reversed_indptr[1:] = np.cumsum(np.bincount(indices, minlength=n))
+    return reversed_indptr, sources[by_target], np.asarray(weights)[by_target]
+
+
+class Landmarks:
+    """Distance tables of a few landmarks, for A* potentials towards any target.
+
+    The landmarks are picked one by one as the vertex farthest from those picked so
+    far, starting from the vertex farthest from `first`. Weights must be
+    nonnegative.
+    """
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        n_landmarks: int = 4,
+        first: int = 0,
+    ):
+        n = len(indptr) - 1
+        reverse = reverse_csr(indptr, indices, weights)
+        n_landmarks = min(n_landmarks, n)
+        # from_landmarks[i, v] = d(landmarks[i], v)
+        self.from_landmarks = np.empty((n_landmarks, n))
+        # to_landmarks[i, v] = d(v, landmarks[i])
+        self.to_landmarks = np.empty((n_landmarks, n))
+        self.landmarks: List[int] = []
+
+        # Distance to the closest landmark so far
+        closest = dijkstra(indptr, indices, weights, first, method="scipy").distances
+        for i in range(n_landmarks):
+            reachable = np.flatnonzero(np.isfinite(closest))
+            landmark = int(reachable[np.argmax(closest[reachable])])
+            if i > 0 and closest[landmark] <= 0:
+                # Every reachable vertex is a landmark already
+                break
+            self.landmarks.append(landmark)
+            self.from_landmarks[i] = dijkstra(
+                indptr, indices, weights, landmark, method="scipy"
+            ).distances
+            self.to_landmarks[i] = dijkstra(
+                *reverse, landmark, method="scipy"
+            ).distances
+            closest = np.minimum(closest, self.from_landmarks[i])
+        self.from_landmarks = self.from_landmarks[: len(self.landmarks)]
+        self.to_landmarks = self.to_landmarks[: len(self.landmarks)]
+
+    def potentials(self, target: int) -> np.ndarray:
+        """A lower bound on the distance from every vertex to `target`.
+
+        Landmarks that can't reach `target` or that `target` can't reach give no
+        bound. Vertices found not to reach `target` get the largest potential of the
+        others instead of infinity: then every edge u -> v still has
+        weight + potentials[v] - potentials[u] >= 0, and only the distances of
+        those vertices change in `dijkstra`.
+        """
+        from_target = self.from_landmarks[:, target : target + 1]
+        to_target = self.to_landmarks[:, target : target + 1]
+        # -inf where a landmark gives no bound, +inf where the vertex can't reach a
+        # landmark that target reaches, so it can't reach target either
+        with np.errstate(invalid="ignore"):
+            bounds = np.concatenate(
+                [
+                    np.where(
+                        np.isfinite(from_target),
+                        from_target - self.from_landmarks,
+                        -np.inf,
+                    ),
+                    np.where(
+                        np.isfinite(to_target), self.to_landmarks - to_target, -np.inf
+                    ),
+                ]
+            )
+        pots = bounds.max(axis=0, initial=0)
+        unreachable = np.isinf(pots)
+        pots[unreachable] = pots[~unreachable].max(initial=0)
+        return pots
@@ -0,0 +1,62 @@
+"""Stand-in signatures for the headless engines.
+
+The blockchain scenes (`ElectronicSignature`, `ChatMessage(with_verification=True)`)
+assume that nobody can forge a general's signature. Here every general has a secret
+key and a signature is an HMAC-SHA256 of the payload with that key. Unlike real
+signatures, verifying needs the key, so the `KeyRing` holds all of them; that is fine
+for simulating, as long as the engines only sign with the key of the sender.
+"""
+
+import hashlib
+import hmac
+from typing import Dict, List, Sequence, Tuple
+
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+class KeyRing:
+    def __init__(self, n_generals: int, seed: int = 0):
+        self.keys: List[bytes] = [
+            hashlib.sha256(f"general-{seed}-{i}".encode()).digest()
+            for i in range(n_generals)
+        ]
+
+    def sign(self, signer_id: int, payload: bytes) -> bytes:
+        return hmac.new(self.keys[signer_id], payload, hashlib.sha256).digest()
+
+    def verify(self, signer_id: int, payload: bytes, signature: bytes) -> bool:
+        return hmac.compare_digest(self.sign(signer_id, payload), signature)
+
+
+class VerificationCache:
+    """Signatures a general has already checked.
+
+    Results are keyed by a digest of the signer, the payload and the signature, so a
+    message that arrives again, e.g. relayed inside a longer chain of signatures, is
+    not verified again.
+    """
+
+    def __init__(self, keys: KeyRing):
+        self.keys = keys
+        self.results: Dict[bytes, bool] = {}
+        # Signatures actually verified, and ones answered from the cache.
+        self.verified = 0
+        self.hits = 0
+
+    @staticmethod
+    def digest(signer_id: int, payload: bytes, signature: bytes) -> bytes:
+        return hashlib.blake2b(
+            signer_id.to_bytes(4, "little") + payload + signature, digest_size=16
+        ).digest()
+
+    def verify_batch(self, items: Sequence[Tuple[int, bytes, bytes]]) -> List[bool]:
+        """Verify (signer id, payload, signature) triples, e.g. everything received
+        in one round. Every distinct signature is verified at most once."""
+        digests = [self.digest(*item) for item in items]
+        for d, item in zip(digests, items):
+            if d in self.results:
+                self.hits += 1
+            else:
+                self.results[d] = self.keys.verify(*item)
+                self.verified += 1
+        return [self.results[d] for d in digests]
@@ -0,0 +1,274 @@
+"""Stateless traitor strategies.
+
+`CyclicOpinionTraitor` decides what to send by advancing an index on every read of
+`opinion`, so its messages depend on the order in which they are read. A
+`TraitorStrategy` instead decides every message as a pure function of the round
+(a `protocol.PhaseView`), the sender and the receiver. Engines ask for all messages of
+a traitor in a round at once with `messages`, so strategies can be vectorized and the
+order of the calls doesn't matter.
+
+    game = HeadlessGameState(
+        [HeadlessPlayer("Y"), StrategyTraitor(WorstCaseStrategy()), ...]
+    )
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from . import opinion_matrix, protocol
+from .protocol import PhaseView
+
+
+class TraitorStrategy:
+    """Decides the messages of traitors. Subclasses implement `message` or, to be
+    fast, `messages`."""
+
+    def message(self, view: PhaseView, sender_id: int, receiver_id: int) -> str:
+        """The opinion sent from `sender_id` to `receiver_id` in the round of
+        `view`."""
+        code = self.messages(view, sender_id, np.array([receiver_id]))[0]
+        return opinion_matrix.OPINIONS[int(code)]
+
+    def messages(
+        self, view: PhaseView, sender_id: int, receiver_ids: np.ndarray
+    ) -> np.ndarray:
+        """Message codes sent from `sender_id` to each of `receiver_ids`."""
+        if type(self).message is TraitorStrategy.message:
+            raise NotImplementedError("Implement `message` or `messages`")
+        return opinion_matrix.encode_opinions(
+            [self.message(view, sender_id, int(j)) for j in receiver_ids]
+        )
+
+
+class StrategyTraitor(protocol.HeadlessTraitor):
+    """A headless traitor whose messages are decided by a `TraitorStrategy`."""
+
+    uses_view = True
+
+    def __init__(self, strategy: TraitorStrategy):
+        self.strategy = strategy
+
+    def send(
+        self, view: PhaseView, sender_id: int, receiver_ids: np.ndarray
+    ) -> np.ndarray:
+        return self.strategy.messages(view, sender_id, receiver_ids)
+
+
+class ConstantStrategy(TraitorStrategy):
+    """Always sends the same opinion, like `CyclicOpinionTraitor("Y")`."""
+
+    def __init__(self, opinion: str):
+        self.code = opinion_matrix.encode_opinions(opinion)[0]
+
+    def messages(self, view, sender_id, receiver_ids):
+        return np.full(len(receiver_ids), self.code, dtype=np.int8)
+
+
+class CyclicStrategy(TraitorStrategy):
+    """Stateless analogue of `CyclicOpinionTraitor`.
+
+    The traitor walks through `opinions` as if every round it sent a message to all n
+    generals in order, so the message to a receiver only depends on the phase, the
+    round and the receiver. For a single round this is exactly what the cyclic
+    traitor sends; across rounds the offsets differ slightly.
+    """
+
+    def __init__(self, opinions: str):
+        self.codes = opinion_matrix.encode_opinions(opinions)
+
+    def messages(self, view, sender_id, receiver_ids):
+        offset = (2 * view.phase + view.round) * view.n
+        return self.codes[(offset + receiver_ids) % len(self.codes)]
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """The splitmix64 finalizer: a cheap hash of uint64s with good avalanche."""
+    x = x.astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class RandomStrategy(TraitorStrategy):
+    """Sends YES with probability `p_yes`, independently for every message.
+
+    The coin flips are a hash of (seed, phase, round, sender, receiver) rather than an
+    RNG stream, so they don't depend on the order messages are asked for.
+    """
+
+    def __init__(self, seed: int = 0, p_yes: float = 0.5):
+        self.seed = seed
+        self.p_yes = p_yes
+
+    def messages(self, view, sender_id, receiver_ids):
+        key = _mix(np.uint64(self.seed) + np.uint64(view.phase))
+        key = _mix(key ^ np.uint64(2 * sender_id + view.round))
+        key = _mix(key ^ receiver_ids.astype(np.uint64))
+        # The top 53 bits of the hash as a float in [0, 1).
+        coin = (key >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+        return np.where(
+            coin < self.p_yes, opinion_matrix.CODE_Y, opinion_matrix.CODE_N
+        ).astype(np.int8)
+
+
+def _balance(can_y: np.ndarray, can_n: np.ndarray) -> np.ndarray:
+    """Pick YES or NO for every general, among what it can be pushed to, so that
+    min(#YES, #NO) is as large as possible. Returns True where YES is picked."""
+    forced_y = can_y & ~can_n
+    free = can_y & can_n
+    n_y = np.count_nonzero(forced_y)
+    # Generals that can be pushed either way go YES until the halves are balanced
+    n_free_y = min(max(len(can_y) // 2 - n_y, 0), np.count_nonzero(free))
+    pick_y = forced_y.copy()
+    pick_y[np.flatnonzero(free)[:n_free_y]] = True
+    return pick_y
+
+
+def _disagreement(pick_y: np.ndarray) -> int:
+    n_y = int(np.count_nonzero(pick_y))
+    return min(n_y, len(pick_y) - n_y)
+
+
+class WorstCaseStrategy(TraitorStrategy):
+    """Adaptive adversary that tries to split the honest generals.
+
+    All traitors follow one joint plan per round, computed from the view (the plan is
+    cached, but it is a function of the view only). In the all-to-all round, the plan
+    is how many traitors send YES to each receiver: the first k traitors (by id) send
+    YES, the rest NO. Only k in {0, t, middle} matter: all YES, all NO, or as close
+    to a tie as possible, so that nobody has a supermajority. The tallies of each
+    candidate are the honest tallies from the view plus k, so evaluating a plan costs
+    O(n) array operations and no messages are recounted.
+
+    - With an honest leader, the adversary tries both opinions for the leader and
+      pushes as many followers as useful into a supermajority for the other one.
+    - With a traitor leader, it avoids supermajorities and then the leader splits the
+      followers in its broadcast.
+    - Without a leader (`local_algorithm`), it splits the majorities.
+
+    The adversary is greedy: it maximizes the disagreement at the end of the current
+    phase and doesn't plan ahead.
+    """
+
+    def __init__(self):
+        self._cached_view: Optional[PhaseView] = None
+        self._cached_plan: Optional[np.ndarray] = None
+
+    def messages(self, view, sender_id, receiver_ids):
+        if view is not self._cached_view:
+            if view.round == protocol.ROUND_ALL_TO_ALL:
+                plan = self._plan_all_to_all(view)
+            else:
+                plan = self._plan_leader(view)
+            self._cached_view, self._cached_plan = view, plan
+
+        plan = self._cached_plan
+        if view.round == protocol.ROUND_ALL_TO_ALL:
+            rank = view.traitor_ids.index(sender_id)
+            send_y = rank < plan[receiver_ids]
+        else:
+            send_y = plan[receiver_ids]
+        return np.where(send_y, opinion_matrix.CODE_Y, opinion_matrix.CODE_N).astype(
+            np.int8
+        )
+
+    def _honest(self, view: PhaseView) -> np.ndarray:
+        return view.opinions != opinion_matrix.NO_MESSAGE
+
+    def _plan_all_to_all(self, view: PhaseView) -> np.ndarray:
+        """Number of traitors sending YES to each receiver."""
+        t = len(view.traitor_ids)
+        honest = self._honest(view)
+        hy, hn = view.y_cnts, view.n_cnts
+        # As close to a tie as possible: hy + k == hn + t - k
+        middle = np.clip((hn + t - hy + 1) // 2, 0, t)
+        candidates = [np.zeros_like(hy), np.full_like(hy, t), middle]
+
+        # Outcome of every receiver for every candidate k: code of the decision,
+        # or NO_MESSAGE if the leader gets to decide.
+        def outcomes(k):
+            y, n = hy + k, hn + t - k
+            if view.leader_id is None:
+                return opinion_matrix.majority_decisions(y, n)
+            return opinion_matrix.supermajority_decisions(y, n, view.threshold)
+
+        candidate_outcomes = np.stack([outcomes(k) for k in candidates])
+
+        if view.leader_id is None or not honest[view.leader_id]:
+            # Without a leader the outcome is final. With a traitor leader,
+            # receivers left without a supermajority can still be pushed either way.
+            undecided = candidate_outcomes == opinion_matrix.NO_MESSAGE
+            can_y = (candidate_outcomes == opinion_matrix.CODE_Y) | undecided
+            can_n = (candidate_outcomes == opinion_matrix.CODE_N) | undecided
+            pick_y = _balance(can_y.any(axis=0)[honest], can_n.any(axis=0)[honest])
+            target = np.full(view.n, opinion_matrix.CODE_N)
+            target[honest] = np.where(
+                pick_y, opinion_matrix.CODE_Y, opinion_matrix.CODE_N
+            )
+            return self._choose(candidates, candidate_outcomes, target)
+
+        leader_id = view.leader_id
+        best_plan, best_score = None, -1
+        for leader_code in [opinion_matrix.CODE_Y, opinion_matrix.CODE_N]:
+            # The honest leader decides by majority, so all YES or all NO is the
+            # best chance to make it pick `leader_code`.
+            k_leader = t if leader_code == opinion_matrix.CODE_Y else 0
+            leader_decision = opinion_matrix.majority_decisions(
+                hy[leader_id] + k_leader, hn[leader_id] + t - k_leader
+            )
+            if leader_decision != leader_code:
+                continue
+
+            final = np.where(
+                candidate_outcomes == opinion_matrix.NO_MESSAGE,
+                leader_code,
+                candidate_outcomes,
+            )
+            can_y = (final == opinion_matrix.CODE_Y).any(axis=0)
+            can_n = (final == opinion_matrix.CODE_N).any(axis=0)
+            can_y[leader_id] = leader_code == opinion_matrix.CODE_Y
+            can_n[leader_id] = leader_code == opinion_matrix.CODE_N
+            pick_y = _balance(can_y[honest], can_n[honest])
+
+            score = _disagreement(pick_y)
+            if score > best_score:
+                target = np.full(view.n, leader_code)
+                target[honest] = np.where(
+                    pick_y, opinion_matrix.CODE_Y, opinion_matrix.CODE_N
+                )
+                plan = self._choose(candidates, final, target)
+                plan[leader_id] = k_leader
+                best_plan, best_score = plan, score
+        return best_plan
+
+    def _choose(self, candidates, outcomes, target) -> np.ndarray:
+        """For every receiver, the first candidate k whose outcome is `target` or
+        left to the leader."""
+        plan = candidates[0].copy()
+        # Go backwards so that earlier candidates win
+        for k, outcome in reversed(list(zip(candidates, outcomes))):
+            hit = (outcome == target) | (outcome == opinion_matrix.NO_MESSAGE)
+            plan[hit] = k[hit]
+        return plan
+
+    def _plan_leader(self, view: PhaseView) -> np.ndarray:
+        """Whether the traitor leader sends YES to each receiver."""
+        honest = self._honest(view)
+        if view.y_cnts is None:
+            # No all-to-all round to go by, just split the generals.
+            pick_y = np.zeros(view.n, dtype=bool)
+            honest_ids = np.flatnonzero(honest)
+            pick_y[honest_ids[: len(honest_ids) // 2]] = True
+            return pick_y
+
+        decided = opinion_matrix.supermajority_decisions(
+            view.y_cnts, view.n_cnts, view.threshold
+        )
+        open_ = decided == opinion_matrix.NO_MESSAGE
+        can_y = open_ | (decided == opinion_matrix.CODE_Y)
+        can_n = open_ | (decided == opinion_matrix.CODE_N)
+        pick_y = np.zeros(view.n, dtype=bool)
+        pick_y[honest] = _balance(can_y[honest], can_n[honest])
+        return pick_y
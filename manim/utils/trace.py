@@ -0,0 +1,158 @@
+"""Compact binary traces of the messages sent during a run.
+
+A trace is a 16-byte header followed by fixed-width records (see `TRACE_DTYPE`), one
+per message and one per decision (a general changing its opinion), in the order they
+happened. Because the records have a fixed width,
+`read_trace` maps the file with `numpy.memmap` and nothing is parsed per record, so
+even multi-GB traces of long simulations can be scanned at disk speed:
+
+    trace = read_trace("run.trace")
+    leader_messages = trace[trace["flags"] & FLAG_LEADER != 0]
+
+Both `HeadlessGameState` and `GameState` write traces if given a `TraceWriter`, and
+`GameState.replay_algorithm` animates a recorded trace.
+"""
+
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from . import opinion_matrix
+
+MAGIC = b"BYZTRACE"
+VERSION = 1
+
+TRACE_DTYPE = np.dtype(
+    [
+        ("phase", "<u4"),
+        ("sender_id", "<u4"),
+        ("receiver_id", "<u4"),
+        # Message code from `opinion_matrix`: 0 = NO, 1 = YES, 2 = undecided, -1 =
+        # no message (a traitor staying silent).
+        ("value", "i1"),
+        ("flags", "u1"),
+    ]
+)
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")])
+
+# The message is a `LeaderMessage`, i.e. the leader's broadcast.
+FLAG_LEADER = 1
+# Not a message: general `sender_id` (== `receiver_id`) changed its opinion to `value`.
+FLAG_DECISION = 2
+
+
+class TraceWriter:
+    """Appends message records to a trace file.
+
+    Records are buffered and written in batches, so tracing single messages from the
+    animated `GameState` doesn't cost a syscall each.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 16):
+        self.path = path
+        self.file = open(path, "wb")
+        header = np.array([(MAGIC, VERSION, TRACE_DTYPE.itemsize)], dtype=HEADER_DTYPE)
+        header.tofile(self.file)
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_size = buffer_size
+        self.records_written = 0
+
+    def write_messages(
+        self,
+        phase: int,
+        sender_ids: Union[int, np.ndarray],
+        receiver_ids: Union[int, np.ndarray],
+        values: Union[int, np.ndarray],
+        flags: Union[int, np.ndarray] = 0,
+    ):
+        """Append messages. Scalars are broadcast against the arrays."""
+        sender_ids, receiver_ids, values, flags = np.broadcast_arrays(
+            sender_ids, receiver_ids, values, flags
+        )
+        records = np.empty(sender_ids.shape, dtype=TRACE_DTYPE).ravel()
+        records["phase"] = phase
+        records["sender_id"] = sender_ids.ravel()
+        records["receiver_id"] = receiver_ids.ravel()
+        records["value"] = values.ravel()
+        records["flags"] = flags.ravel()
+
+        self.buffer.append(records)
+        self.buffered += len(records)
+        self.records_written += len(records)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_decisions(self, phase: int, general_ids: np.ndarray, values: np.ndarray):
+        """Append the new opinions of the given generals."""
+        self.write_messages(phase, general_ids, general_ids, values, FLAG_DECISION)
+
+    def write_matrix(self, phase: int, matrix: np.ndarray, flags: int = 0):
+        """Append all messages of a sender x receiver matrix from `opinion_matrix`."""
+        senders, receivers = np.nonzero(matrix != opinion_matrix.NO_MESSAGE)
+        self.write_messages(
+            phase, senders, receivers, matrix[senders, receivers], flags=flags
+        )
+
+    def flush(self):
+        for records in self.buffer:
+            records.tofile(self.file)
+        self.buffer = []
+        self.buffered = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_trace(path: str) -> np.memmap:
+    """Map a trace file into memory as an array of `TRACE_DTYPE` records."""
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} is not a message trace")
+    if header["version"][0] != VERSION:
+        raise ValueError(f"Unsupported trace version {header['version'][0]}")
+    if header["record_size"][0] != TRACE_DTYPE.itemsize:
+        raise ValueError(f"Unexpected record size {header['record_size'][0]}")
+
+    if os.path.getsize(path) == HEADER_DTYPE.itemsize:
+        # np.memmap refuses to map an empty array
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize)
+
+
+def phase_records(trace: np.ndarray, phase: int, end_phase: Optional[int] = None):
+    """Records of phases [phase, end_phase), by default just `phase`.
+
+    Records are written in order, so this is a binary search, not a scan.
+    """
+    if end_phase is None:
+        end_phase = phase + 1
+    start, end = np.searchsorted(trace["phase"], [phase, end_phase])
+    return trace[start:end]
+
+
+def split_runs(records: np.ndarray) -> List[np.ndarray]:
+    """Split records into maximal runs of consecutive records with the same flags,
+    e.g. the all-to-all messages of a phase, then the leader's decision, etc."""
+    if len(records) == 0:
+        return []
+    boundaries = np.flatnonzero(np.diff(records["flags"])) + 1
+    return np.split(records, boundaries)
+
+
+def final_decisions(records: np.ndarray) -> Dict[int, int]:
+    """The last opinion (as a message code) each general decided on in `records`."""
+    decisions = records[records["flags"] & FLAG_DECISION != 0]
+    return {
+        int(general_id): int(value)
+        for general_id, value in zip(decisions["sender_id"], decisions["value"])
+    }
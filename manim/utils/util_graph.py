@@ -1,8 +1,9 @@
-from queue import PriorityQueue
+from collections.abc import MutableMapping
 
 import matplotlib.colors as mcolors
 from manim import *
 
+from utils import contraction, shortest_paths
 from utils.util import *
 
 PRAGUE = 0
@@ -66,39 +67,247 @@ def edge_potential_updater(mob, edge, graph):
     u = edge[0]
     v = edge[1]
     mob.set_value(
-        graph.edge_weights_vals[edge].get_value()
-        + graph.vertex_potentials[edge[1]].get_value()
-        - graph.vertex_potentials[edge[0]].get_value()
-    )
-    weight = graph.edge_weights_vals[edge].get_value()
-    pot_dif = (
-        graph.vertex_potentials[v].get_value() - graph.vertex_potentials[u].get_value()
+        graph.edge_weights_vals.get_value(edge)
+        + graph.vertex_potentials.get_value(edge[1])
+        - graph.vertex_potentials.get_value(edge[0])
     )
+    weight = graph.edge_weights_vals.get_value(edge)
+    pots = graph.vertex_potentials
+    pot_dif = pots.get_value(v) - pots.get_value(u)
     mob.set_color(color_from_potential(weight, pot_dif))
 
 
+class TrackedValues(MutableMapping):
+    # key -> ValueTracker, with the values in a NumPy array. The ValueTracker of a
+    # key is only created when it is accessed, e.g. to animate it, and from then on
+    # it holds the value. Read values with get_value() or array() to not create it.
+    def __init__(self):
+        self.ids = {}  # key -> index into values
+        self.values = np.zeros(16)
+        self.trackers = {}
+        self._size = 0
+        self._free = []
+        # incremented when a value changes, to know when a snapshot is out of date
+        self._version = 0
+        # incremented when a key is added or removed, which changes the slots
+        self.keys_version = 0
+
+    def __getitem__(self, key):
+        tracker = self.trackers.get(key)
+        if tracker is None:
+            tracker = ValueTracker(float(self.values[self.ids[key]]))
+            self.trackers[key] = tracker
+        return tracker
+
+    def __setitem__(self, key, tracker):
+        self.set_value(key, tracker.get_value())
+        self.trackers[key] = tracker
+
+    def __delitem__(self, key):
+        self._free.append(self.ids.pop(key))
+        self.trackers.pop(key, None)
+        self._version += 1
+        self.keys_version += 1
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def discard(self, key):
+        if key in self.ids:
+            del self[key]
+
+    def get_value(self, key, default=None):
+        tracker = self.trackers.get(key)
+        if tracker is not None:
+            return tracker.get_value()
+        if key not in self.ids and default is not None:
+            return default
+        return float(self.values[self.ids[key]])
+
+    def set_value(self, key, value):
+        self._version += 1
+        if key not in self.ids:
+            self.keys_version += 1
+            if self._free:
+                self.ids[key] = self._free.pop()
+            else:
+                if self._size == len(self.values):
+                    self.values = np.concatenate([self.values, np.zeros(self._size)])
+                self.ids[key] = self._size
+                self._size += 1
+        self.values[self.ids[key]] = value
+        if key in self.trackers:
+            self.trackers[key].set_value(value)
+
+    def _sync(self):
+        # copy the values of the trackers, which may have been animated, to the array
+        for key, tracker in self.trackers.items():
+            value = tracker.get_value()
+            if self.values[self.ids[key]] != value:
+                self.values[self.ids[key]] = value
+                self._version += 1
+
+    def version(self):
+        # changes whenever any value changes, also through a tracker
+        self._sync()
+        return self._version
+
+    def slots(self, keys):
+        # indices of keys into the values, -1 for missing keys; valid until
+        # keys_version changes
+        return np.array([self.ids.get(key, -1) for key in keys], dtype=np.int64)
+
+    def take(self, slots, default=0.0):
+        # values at slots, default for -1
+        self._sync()
+        out = self.values[slots]
+        out[slots < 0] = default
+        return out
+
+    def array(self, keys, default=0.0):
+        # values of keys as an array, default for missing keys
+        return self.take(self.slots(keys), default)
+
+
+class _EdgeNumbers(dict):
+    # edge -> DecimalNumber of its weight, created on first access
+    def __init__(self, graph):
+        super().__init__()
+        self.graph = graph
+
+    def __missing__(self, edge):
+        number = self.graph._create_edge_number(edge)
+        self[edge] = number
+        return number
+
+
 class CustomGraph(Graph):
-    edge_weights_vals = {}  # edge -> ValueTracker
-    edge_weights_objs = {}  # edge -> Decimal
-    vertex_names = {}  # vertex -> Tex
-    vertex_potentials = {}  # vertex -> ValueTracker
-    vertex_height_lines = {}  # vertex -> Line
     directed = True
+    # vertex -> [(neighbor, edge)], built on first use from self.edges and then kept
+    # up to date by the methods that add and remove edges
+    _adjacency = None
+    # (vertices, indptr, indices, edges), rebuilt from _adjacency when needed
+    _csr = None
+    # vertex -> its index in _csr
+    _csr_index = None
+    # (csr, keys_version, slots of the csr edges in edge_weights_vals)
+    _csr_slots = None
+    # (csr, version of edge_weights_vals, weights) of _csr_weights
+    _csr_weights_cache = None
+    # (csr, weights version, n_landmarks, shortest_paths.Landmarks) of
+    # gen_landmark_potentials
+    _landmarks = None
+    # (csr, weights version, contraction.ContractionHierarchy) of contraction_index
+    _contraction = None
+
+    def __init__(self, *args, **kwargs):
+        # per graph; set before Graph.__init__, which may already add edges
+        self.edge_weights_vals = TrackedValues()  # edge -> ValueTracker
+        self.edge_weights_objs = _EdgeNumbers(self)  # edge -> DecimalNumber
+        self.vertex_names = {}  # vertex -> Tex
+        self.vertex_potentials = TrackedValues()  # vertex -> ValueTracker
+        self.vertex_height_lines = {}  # vertex -> Line
+        self._edge_length_offsets = {}  # edge -> offset of its DecimalNumber
+        self._potentials_set_up = False
+        super().__init__(*args, **kwargs)
 
     def make_directed(self, directed):
+        if directed != self.directed:
+            self._adjacency = None
+            self._csr = None
         self.directed = directed
 
-    def get_adjacency_list(self):
-        adj = dict([(v, []) for v in self.vertices])
-        for v1, v2 in self.edges:
-            adj[v1].append(v2)
-            if not self.directed:
-                adj[v2].append(v1)
+    def _get_adjacency(self):
+        if self._adjacency is None:
+            self._adjacency = dict([(v, []) for v in self.vertices])
+            for edge in self.edges:
+                self._link(edge)
+        return self._adjacency
+
+    def _link(self, edge):
+        v1, v2 = edge
+        self._adjacency[v1].append((v2, edge))
+        if not self.directed:
+            self._adjacency[v2].append((v1, edge))
+        self._csr = None
+
+    def _unlink(self, edge):
+        v1, v2 = edge
+        self._adjacency[v1].remove((v2, edge))
+        if not self.directed:
+            self._adjacency[v2].remove((v1, edge))
+        self._csr = None
+
+    def _add_created_vertex(self, vertex, *args, **kwargs):
+        mob = super()._add_created_vertex(vertex, *args, **kwargs)
+        if self._adjacency is not None:
+            self._adjacency[vertex] = []
+            self._csr = None
+        return mob
+
+    def _remove_vertex(self, vertex):
+        # also removes the incident edges
+        for edge in [e for e in self.edges if vertex in e]:
+            self._forget_edge(edge)
+        self.vertex_potentials.discard(vertex)
+        self._adjacency = None
+        self._csr = None
+        return super()._remove_vertex(vertex)
+
+    def _add_edge(self, edge, *args, **kwargs):
+        is_new = edge not in self.edges
+        mobs = super()._add_edge(edge, *args, **kwargs)
+        # new vertices of the edge are added by _add_created_vertex
+        if self._adjacency is not None and is_new:
+            self._link(edge)
+        return mobs
+
+    def _remove_edge(self, edge):
+        mob = super()._remove_edge(edge)
+        if self._adjacency is not None:
+            self._unlink(edge)
+        self._forget_edge(edge)
+        return mob
+
+    def _forget_edge(self, edge):
+        self.edge_weights_vals.discard(edge)
+        self.edge_weights_objs.pop(edge, None)
+        self._edge_length_offsets.pop(edge, None)
 
-        return adj
+    def get_adjacency_list(self):
+        return {v: [u for u, _ in nbrs] for v, nbrs in self._get_adjacency().items()}
 
     def neighbors(self, vertex):
-        return self.get_adjacency_list()[vertex]
+        return [u for u, _ in self._get_adjacency()[vertex]]
+
+    def adjacency_csr(self):
+        # (vertices, indptr, indices, edges): the neighbors of vertices[i] are
+        # vertices[indices[indptr[i] : indptr[i + 1]]], through the edges (keys of
+        # self.edges) at the same positions
+        if self._csr is None:
+            adj = self._get_adjacency()
+            vertices = list(adj)
+            index = {v: i for i, v in enumerate(vertices)}
+            indptr = np.zeros(len(vertices) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(adj[v]) for v in vertices])
+            indices = np.array(
+                [index[u] for v in vertices for u, _ in adj[v]], dtype=np.int64
+            )
+            edges = [edge for v in vertices for _, edge in adj[v]]
+            self._csr = (vertices, indptr, indices, edges)
+            self._csr_index = index
+        return self._csr
+
+    def _vertex_index(self):
+        # vertex -> its index in adjacency_csr()
+        self.adjacency_csr()
+        return self._csr_index
 
     def create_name(self, vertex, name, offset, scale=0.5):
         self.vertex_names[vertex] = (
@@ -128,13 +337,23 @@ class CustomGraph(Graph):
         return AnimationGroup(*anims)
 
     def create_edge_length(self, edge, weight, offset=0 * RIGHT):
-        number = DecimalNumber(weight, num_decimal_places=1, color=GRAY).scale(0.3)
-        self.edge_weights_objs[edge] = number
-        self.edge_weights_vals[edge] = ValueTracker(weight)
+        # the DecimalNumber is created when first used, see _create_edge_number
+        self.edge_weights_vals.set_value(edge, weight)
+        self._edge_length_offsets[edge] = offset
+        self.edge_weights_objs.pop(edge, None)
+
+    def _create_edge_number(self, edge):
+        offset = self._edge_length_offsets[edge]
+        number = DecimalNumber(
+            self.edge_weights_vals.get_value(edge), num_decimal_places=1, color=GRAY
+        ).scale(0.3)
         number.move_to(self.edges[edge].get_center()).shift(offset)
         number.add_updater(
             lambda mob, dt: mob.move_to(self.edges[edge].get_center()).shift(offset)
         )
+        if self._potentials_set_up:
+            number.add_updater(lambda mob, dt: edge_potential_updater(mob, edge, self))
+        return number
 
     def show_edge_lengths(self, edges):
         anims = []
@@ -170,17 +389,16 @@ class CustomGraph(Graph):
     def setup_potentials(self, potentials={}, rate=1):
         # updater: edge_length = original_edge_length + potential(v) - potential(u)
         # ideally (but maybe hard), add also updater on the color, so that when it decreases/increases it gets a shade of green/red based on how fast it increases/decreases
+        self._potentials_set_up = True
         for v in self.vertices:
-            self.vertex_potentials[v] = ValueTracker(0)
-            if v in potentials:
-                self.vertex_potentials[v] = ValueTracker(potentials[v])
+            self.vertex_potentials.set_value(v, potentials.get(v, 0))
 
             self.vertices[v].add_updater(
                 lambda mob, dt, v=v: mob.move_to(
                     [
                         mob.get_center()[0],
                         mob.get_center()[1],
-                        self.vertex_potentials[v].get_value() * rate,
+                        self.vertex_potentials.get_value(v) * rate,
                     ]
                 )
             )
@@ -216,16 +434,16 @@ class CustomGraph(Graph):
             def edge_arrow_potential_updater(mob, edge):
                 u = edge[0]
                 v = edge[1]
-                weight = self.edge_weights_vals[edge].get_value()
-                pot_dif = (
-                    self.vertex_potentials[v].get_value()
-                    - self.vertex_potentials[u].get_value()
-                )
+                weight = self.edge_weights_vals.get_value(edge)
+                pots = self.vertex_potentials
+                pot_dif = pots.get_value(v) - pots.get_value(u)
                 mob.set_color(color_from_potential(weight, pot_dif))
 
-            self.edge_weights_objs[edge].add_updater(
-                lambda mob, dt, edge=edge: edge_potential_updater(mob, edge, self)
-            )
+            # numbers created later get this updater in _create_edge_number
+            if edge in self.edge_weights_objs:
+                self.edge_weights_objs[edge].add_updater(
+                    lambda mob, dt, edge=edge: edge_potential_updater(mob, edge, self)
+                )
             self.edges[edge].add_updater(
                 lambda mob, dt, edge=edge: edge_arrow_potential_updater(mob, edge)
             )
@@ -246,7 +464,7 @@ class CustomGraph(Graph):
 
     def set_new_potentials(self, potentials):
         for v, pot in potentials.items():
-            self.vertex_potentials[v].set_value(pot)
+            self.vertex_potentials.set_value(v, pot)
 
     def anim_new_potentials(self, new_potentials):
         anims = []
@@ -283,7 +501,10 @@ class CustomGraph(Graph):
             color=GRAY,
         )
 
+        is_new = (u, v) not in self.edges
         self.edges[(u, v)] = edge
+        if self._adjacency is not None and is_new:
+            self._link((u, v))
 
         def edge_updater(mob, u, v, offset):
             start_pos, end_pos = compute_positions(u, v, offset)
@@ -298,62 +519,153 @@ class CustomGraph(Graph):
 
         return AnimationGroup(Create(edge))
 
-    def run_dijkstra(self, start_node, end_node, speed, thumbnail=False):
+    def _csr_weights(self):
+        # current weights of the edges of adjacency_csr(), in the same order
+        # (read-only); recomputed only when the edges or the weights change
+        csr = self.adjacency_csr()
+        weights_vals = self.edge_weights_vals
+        version = weights_vals.version()
+        cache = self._csr_weights_cache
+        if cache is not None and cache[0] is csr and cache[1] == version:
+            return cache[2]
+
+        if (
+            self._csr_slots is None
+            or self._csr_slots[0] is not csr
+            or self._csr_slots[1] != weights_vals.keys_version
+        ):
+            vertices, indptr, indices, edges = csr
+            keys = []
+            for i, v in enumerate(vertices):
+                for k in range(indptr[i], indptr[i + 1]):
+                    edge = (v, vertices[indices[k]])
+                    # undirected edge stored the other way around
+                    keys.append(edge if edge in weights_vals else edges[k])
+            self._csr_slots = (csr, weights_vals.keys_version, weights_vals.slots(keys))
+        # same default as in run_dijkstra
+        weights = weights_vals.take(self._csr_slots[2], default=1)
+        weights.flags.writeable = False
+        self._csr_weights_cache = (csr, version, weights)
+        return weights
+
+    def gen_landmark_potentials(self, target, n_landmarks=4):
+        # A* potentials towards target from landmark distance tables (ALT), for
+        # run_dijkstra(start, target, ..., stop_at_end=True). The tables are computed once and again
+        # only when the edges or their weights change.
+        csr = self.adjacency_csr()
+        vertices, indptr, indices, _ = csr
+        weights = self._csr_weights()
+        version = self.edge_weights_vals.version()
+        if (
+            self._landmarks is None
+            or self._landmarks[0] is not csr
+            or self._landmarks[1:3] != (version, n_landmarks)
+        ):
+            landmarks = shortest_paths.Landmarks(indptr, indices, weights, n_landmarks)
+            self._landmarks = (csr, version, n_landmarks, landmarks)
+        pots = self._landmarks[3].potentials(self._vertex_index()[target])
+        return dict(zip(vertices, pots.tolist()))
+
+    def contraction_index(self, cache_dir=contraction.DEFAULT_CACHE_DIR):
+        # contraction hierarchy of the graph with the current weights, loaded from
+        # cache_dir if it was built before
+        csr = self.adjacency_csr()
+        weights = self._csr_weights()
+        version = self.edge_weights_vals.version()
+        if (
+            self._contraction is None
+            or self._contraction[0] is not csr
+            or self._contraction[1] != version
+        ):
+            _, indptr, indices, _ = csr
+            ch = contraction.ContractionHierarchy.load_or_build(
+                indptr, indices, weights, cache_dir
+            )
+            self._contraction = (csr, version, ch)
+        return self._contraction[2]
+
+    def query_shortest_path(self, start_node, end_node, **kwargs):
+        # (distance, shortest_path_nodes, shortest_path_edges) as in run_dijkstra,
+        # from the contraction index instead of a full search; the distance is
+        # without potentials
+        vertices = self.adjacency_csr()[0]
+        index = self._vertex_index()
+        ch = self.contraction_index(**kwargs)
+        distance, path = ch.route(index[start_node], index[end_node])
+        if not path:
+            raise ValueError(f"{end_node} can't be reached from {start_node}")
+        path = [vertices[i] for i in path]
+        shortest_path_nodes = path[::-1]
+        forward = list(zip(path[:-1], path[1:]))[::-1]
+        backward = [(v, u) for u, v in forward]
+        return distance, shortest_path_nodes, forward + backward
+
+    def run_dijkstra(
+        self, start_node, end_node, speed, thumbnail=False, stop_at_end=False
+    ):
+        # with stop_at_end, the search stops after the vertices at most as far as
+        # end_node, so the returned distances only have those; the animations are the
+        # same, they never go past end_node
         # initialize potentials and weights to default values to be sure
         for edge in self.edges:
             if edge not in self.edge_weights_vals:
-                self.edge_weights_vals[edge] = ValueTracker(1)
+                self.edge_weights_vals.set_value(edge, 1)
 
         for vert in self.vertices:
             if vert not in self.vertex_potentials:
-                self.vertex_potentials[vert] = ValueTracker(0)
+                self.vertex_potentials.set_value(vert, 0)
 
-        # run A*
+        # run A* on a snapshot of the weights and potentials
         all_anims = []
 
-        G = self.get_adjacency_list()
-        q = PriorityQueue()
-        q.put((0, start_node, -1))
-
-        distances = {}
-        predecessors = {}
+        vertices, indptr, indices, edges = self.adjacency_csr()
+        index = self._vertex_index()
+        weights = self._csr_weights()
+        potentials = self.vertex_potentials.array(vertices)
+        # the queue breaks ties by comparing the vertices themselves
+        rank = np.empty(len(vertices), dtype=np.int64)
+        rank[sorted(range(len(vertices)), key=vertices.__getitem__)] = np.arange(
+            len(vertices)
+        )
 
+        tree = shortest_paths.dijkstra(
+            indptr,
+            indices,
+            weights,
+            index[start_node],
+            potentials,
+            rank,
+            target=index[end_node] if stop_at_end else None,
+        )
+        dist = tree.distances.tolist()
+        distances = {vertices[i]: dist[i] for i in tree.order}
+        predecessors = {
+            vertices[i]: vertices[p] if p >= 0 else -1
+            for i, p in zip(tree.order, tree.predecessors[tree.order])
+        }
+        settled_at = np.full(len(vertices), len(vertices))
+        settled_at[tree.order] = np.arange(len(tree.order))
+
+        node_anims = [(dist[i], vertices[i]) for i in tree.order]
         mover_anims = []
-        node_anims = []
         red_nodes = []
-        while not q.empty():
-            (dist, node, predecessor) = q.get()
-            if node not in distances:
-                distances[node] = dist
-                predecessors[node] = predecessor
-
-                node_anims.append((dist, node))
-
-                for neighbor in G[node]:
-                    if neighbor not in distances:
-                        edge = (node, neighbor)
-
-                        new_dist = (
-                            dist
-                            + self.edge_weights_vals[edge].get_value()
-                            + self.vertex_potentials[neighbor].get_value()
-                            - self.vertex_potentials[node].get_value()
-                        )
-                        q.put((new_dist, neighbor, node))
-
-                        mover_anims.append(
-                            (
-                                self.vertices[node].get_center(),
-                                self.vertices[neighbor].get_center(),
-                                dist,
-                                dist
-                                + self.edge_weights_vals[edge].get_value()
-                                + self.vertex_potentials[neighbor].get_value()
-                                - self.vertex_potentials[node].get_value(),
-                                node,
-                                neighbor,
-                            )
-                        )
+        for i in tree.order:
+            node = vertices[i]
+            for k in range(indptr[i], indptr[i + 1]):
+                j = indices[k]
+                # edges to vertices not settled yet when node was
+                if settled_at[j] <= settled_at[i]:
+                    continue
+                mover_anims.append(
+                    (
+                        self.vertices[node].get_center(),
+                        self.vertices[vertices[j]].get_center(),
+                        dist[i],
+                        dist[i] + weights[k] + potentials[j] - potentials[i],
+                        node,
+                        vertices[j],
+                    )
+                )
 
         shortest_path_nodes = [end_node]
         shortest_path_edges = [[], []]